@@ -0,0 +1,235 @@
+""" runs many independent lox scripts in parallel on a pool of worker processes """
+import argparse
+import contextlib
+import io
+import multiprocessing
+import os
+import signal
+import sys
+import time
+from dataclasses import dataclass
+from parser import Parser
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+import cache
+from limits import LimitedInterpreter, Limits
+from runner import ENGINES, Engine
+from scanner import FastScanner
+
+
+@dataclass
+class ScriptResult:
+    path: str
+    ok: bool
+    output: str
+    """ everything the script printed, including reported lox errors """
+    error: Optional[str]
+    """ why the script failed, None if it succeeded """
+    elapsed: float
+
+
+class ScriptTimeout(BaseException):
+    """raised by the alarm, not an Exception so that nothing the script runs
+    through, like the cache swallowing the errors of a bad file, can catch it"""
+
+
+_engine = "tree"
+_use_cache = True
+_limits: Optional[Limits] = None
+
+
+def _warm_up(engine: str, use_cache: bool, limits: Optional[Limits]) -> None:
+    """initializer of the workers, the imports are done by now and a tiny
+    script warms up the engine before the first real one arrives"""
+    global _engine, _use_cache, _limits
+    _engine = engine
+    _use_cache = use_cache
+    _limits = limits
+    signal.signal(signal.SIGALRM, _raise_timeout)
+    with contextlib.redirect_stdout(io.StringIO()):
+        _new_engine().interpret(
+            Parser(FastScanner("var a = 1; { print a + 1; }").scan_tokens()).parse()
+        )
+
+
+def _new_engine() -> Engine:
+    if _limits is not None:
+        return LimitedInterpreter(limits=_limits)
+    return ENGINES[_engine]()
+
+
+def _raise_timeout(signum: int, frame: object) -> None:
+    raise ScriptTimeout()
+
+
+def _run_script(job: Tuple[str, float]) -> ScriptResult:
+    path, timeout = job
+    out = io.StringIO()
+    error = None
+    start = time.perf_counter()
+    # the alarm interrupts the script wherever it is, even in an endless loop
+    signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        with contextlib.redirect_stdout(out):
+            error = _interpret_file(path)
+    except ScriptTimeout:
+        error = f"timed out after {timeout}s"
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+    elapsed = time.perf_counter() - start
+    return ScriptResult(path, error is None, out.getvalue(), error, elapsed)
+
+
+def _interpret_file(path: str) -> Optional[str]:
+    """run the script, returns the error if it failed"""
+    with open(path) as f:
+        source_code = f.read()
+
+    stmts = cache.load(path, source_code) if _use_cache else None
+    if stmts is None:
+        parser = Parser(FastScanner(source_code).scan_tokens())
+        stmts = parser.parse()
+        if parser.errors:
+            # the output has every error, the parser recovers from each of them
+            count = len(parser.errors)
+            return "parse error" if count == 1 else f"{count} parse errors"
+        if _use_cache:
+            cache.store(path, source_code, stmts)
+
+    engine = _new_engine()
+    if not engine.interpret(stmts):
+        if isinstance(engine, LimitedInterpreter) and engine.exceeded is not None:
+            return engine.exceeded.msg
+        return "runtime error"
+    return None
+
+
+def find_scripts(paths: Iterable[str]) -> List[str]:
+    """the given files and the .lox files found under the given directories"""
+    scripts = []
+    for path in paths:
+        if not os.path.isdir(path):
+            scripts.append(path)
+            continue
+        for directory, _, files in os.walk(path):
+            scripts.extend(
+                os.path.join(directory, name)
+                for name in sorted(files)
+                if name.endswith(".lox")
+            )
+    return scripts
+
+
+def run_batch(
+    scripts: List[str],
+    workers: Optional[int] = None,
+    timeout: float = 60.0,
+    engine: str = "tree",
+    use_cache: bool = True,
+    limits: Optional[Limits] = None,
+) -> Iterator[ScriptResult]:
+    """run the scripts on a pool of worker processes, the results are yielded
+    as the scripts finish. Every script runs on a fresh engine and is stopped
+    once it runs longer than timeout seconds. With limits the scripts run on
+    a LimitedInterpreter, which ends a script exceeding them with an error
+    instead of killing it."""
+    with multiprocessing.Pool(
+        processes=workers, initializer=_warm_up, initargs=(engine, use_cache, limits)
+    ) as pool:
+        jobs = [(script, timeout) for script in scripts]
+        yield from pool.imap_unordered(_run_script, jobs)
+
+
+def _output_name(output_dir: str, script: str) -> str:
+    """the path of the script relative to the current directory, inside
+    output_dir. The .. leading out of the current directory are dropped, and
+    a path still ending outside output_dir through a symlink is rejected with
+    a ValueError."""
+    parts = os.path.relpath(script).split(os.sep)
+    while parts[0] == os.pardir:
+        parts.pop(0)
+    name = os.path.join(output_dir, *parts)
+    root = os.path.realpath(output_dir)
+    if os.path.commonpath([root, os.path.realpath(name)]) != root:
+        raise ValueError(f"the output of {script} would be outside {output_dir}")
+    return name
+
+
+def _save_output(output_dir: str, result: ScriptResult) -> None:
+    name = _output_name(output_dir, result.path)
+    os.makedirs(os.path.dirname(name), exist_ok=True)
+    with open(f"{name}.out", "w") as f:
+        f.write(result.output)
+    if result.error is not None:
+        with open(f"{name}.err", "w") as f:
+            f.write(result.error + "\n")
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(prog="pylox-batch")
+    arg_parser.add_argument("paths", nargs="+", help="scripts or directories")
+    arg_parser.add_argument(
+        "--workers", type=int, default=None, help="worker processes, one per cpu"
+    )
+    arg_parser.add_argument(
+        "--timeout", type=float, default=60.0, help="seconds allowed per script"
+    )
+    arg_parser.add_argument("--engine", choices=sorted(ENGINES), default="tree")
+    arg_parser.add_argument("--no-cache", action="store_true")
+    arg_parser.add_argument(
+        "--max-steps", type=int, help="loop iterations and calls allowed per script"
+    )
+    arg_parser.add_argument(
+        "--max-time", type=float, help="seconds of interpretation allowed per script"
+    )
+    arg_parser.add_argument("--max-depth", type=int, help="nesting of block frames")
+    arg_parser.add_argument(
+        "--max-string", type=int, help="characters of a string built by +"
+    )
+    arg_parser.add_argument(
+        "--output-dir",
+        metavar="DIR",
+        help="save the output of every script to DIR/<script>.out and the "
+        "error of a failed one to DIR/<script>.err",
+    )
+    args = arg_parser.parse_args()
+
+    limits = None
+    if any(
+        limit is not None
+        for limit in (args.max_steps, args.max_time, args.max_depth, args.max_string)
+    ):
+        if args.engine != "tree":
+            arg_parser.error("limits are only supported by the tree engine")
+        limits = Limits(args.max_steps, args.max_time, args.max_depth, args.max_string)
+
+    scripts = find_scripts(args.paths)
+    failed = 0
+    start = time.perf_counter()
+    for result in run_batch(
+        scripts, args.workers, args.timeout, args.engine, not args.no_cache, limits
+    ):
+        if not result.ok:
+            failed += 1
+        status = "ok" if result.ok else f"FAILED ({result.error})"
+        print(f"{result.path} {result.elapsed * 1000:.1f} ms {status}")
+        if args.output_dir is not None:
+            try:
+                _save_output(args.output_dir, result)
+            except ValueError as e:
+                print(f"{result.path} output not saved: {e}", file=sys.stderr)
+    elapsed = time.perf_counter() - start
+
+    print(
+        f"{len(scripts)} scripts, {failed} failed in {elapsed:.2f} s,"
+        f" {len(scripts) / elapsed:.1f} scripts/s",
+        file=sys.stderr,
+    )
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+import os
+import signal
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import cache
+from batch import (
+    ScriptResult,
+    _raise_timeout,
+    _run_script,
+    _save_output,
+    find_scripts,
+    run_batch,
+)
+from limits import Limits
+
+SCRIPTS = {
+    "ok.lox": "var a = 1;\nprint a + 1;\n",
+    "runtime_error.lox": 'print 1;\nprint -"a";\n',
+    "parse_error.lox": "print ;\nprint 1;\nvar = 2;\n",
+    "endless.lox": "while (true) {}\n",
+    "sub/nested.lox": 'print "nested";\n',
+    "sub/notes.txt": "not a script",
+}
+
+
+class BatchTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self._dir = tempfile.TemporaryDirectory()
+        for name, source in SCRIPTS.items():
+            path = os.path.join(self._dir.name, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w") as f:
+                f.write(source)
+
+    def tearDown(self) -> None:
+        self._dir.cleanup()
+
+    def test_find_scripts(self) -> None:
+        scripts = find_scripts([self._dir.name])
+        names = sorted(os.path.relpath(s, self._dir.name) for s in scripts)
+        self.assertEqual(names, sorted(n for n in SCRIPTS if n.endswith(".lox")))
+
+    def test_run_batch(self) -> None:
+        scripts = find_scripts([self._dir.name])
+        results = {
+            os.path.relpath(result.path, self._dir.name): result
+            for result in run_batch(scripts, workers=2, timeout=1.0, use_cache=False)
+        }
+
+        self.assertTrue(results["ok.lox"].ok)
+        self.assertEqual(results["ok.lox"].output, "2.0\n")
+        self.assertEqual(results["sub/nested.lox"].output, "nested\n")
+
+        failed = results["runtime_error.lox"]
+        self.assertFalse(failed.ok)
+        self.assertEqual(failed.error, "runtime error")
+        self.assertTrue(failed.output.startswith("1.0\n[line 2] Error: type"))
+
+        # all the errors are found and nothing runs
+        failed = results["parse_error.lox"]
+        self.assertEqual(failed.error, "2 parse errors")
+        self.assertEqual(
+            failed.output,
+            "[line 1] Error at ';': Expect Expression\n"
+            "[line 3] Error at '=': expect identifier\n",
+        )
+        self.assertEqual(results["endless.lox"].error, "timed out after 1.0s")
+
+    def test_run_batch_with_limits(self) -> None:
+        scripts = [os.path.join(self._dir.name, n) for n in ("ok.lox", "endless.lox")]
+        results = {
+            os.path.basename(result.path): result
+            for result in run_batch(
+                scripts, workers=1, use_cache=False, limits=Limits(steps=1000)
+            )
+        }
+
+        self.assertTrue(results["ok.lox"].ok)
+        endless = results["endless.lox"]
+        self.assertEqual(endless.error, "step limit of 1000 exceeded")
+        self.assertTrue(endless.output.endswith("Error: step limit of 1000 exceeded\n"))
+
+    def test_save_output(self) -> None:
+        output_dir = os.path.join(self._dir.name, "out")
+        # the scripts are outside the current directory, their path starts
+        # with ..
+        script = os.path.join(self._dir.name, "sub", "nested.lox")
+        _save_output(output_dir, ScriptResult(script, False, "1.0\n", "failed", 0.0))
+        saved = {
+            name: os.path.join(directory, name)
+            for directory, _, names in os.walk(output_dir)
+            for name in names
+        }
+        self.assertEqual(sorted(saved), ["nested.lox.err", "nested.lox.out"])
+        with open(saved["nested.lox.out"]) as f:
+            self.assertEqual(f.read(), "1.0\n")
+        with open(saved["nested.lox.err"]) as f:
+            self.assertEqual(f.read(), "failed\n")
+
+        # a symlink in the output directory leading out of it
+        os.symlink(
+            self._dir.name,
+            os.path.join(os.path.dirname(saved["nested.lox.out"]), "esc"),
+        )
+        script = os.path.join(os.path.dirname(script), "esc", "ok.lox")
+        with self.assertRaises(ValueError):
+            _save_output(output_dir, ScriptResult(script, True, "", None, 0.0))
+        self.assertFalse(os.path.exists(os.path.join(self._dir.name, "ok.lox.out")))
+
+    def test_timeout_during_cache_load(self) -> None:
+        script = os.path.join(self._dir.name, "ok.lox")
+        with open(script) as f:
+            cache.store(script, f.read(), [])
+
+        def slow_loads(data: bytes) -> None:
+            time.sleep(5)
+
+        previous = signal.signal(signal.SIGALRM, _raise_timeout)
+        try:
+            with mock.patch("cache.pickle.loads", slow_loads):
+                result = _run_script((script, 0.2))
+        finally:
+            signal.signal(signal.SIGALRM, previous)
+        # the cache ignores the files it fails to load, but not the timeout
+        self.assertEqual(result.error, "timed out after 0.2s")
+        self.assertEqual(result.output, "")
+        self.assertLess(result.elapsed, 5)
@@ -0,0 +1,565 @@
+""" benchmarks of the scanner, the parser and the execution engines.
+
+Every suite returns records, one dict per measurement with the times in
+seconds and the sizes in bytes. They are printed one per line, or with --json
+as a json document that can be saved and passed back with --baseline to
+compare two commits. """
+import argparse
+import contextlib
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from parser import Parser
+from typing import Any, Callable, Dict, List, Union
+
+import cache
+import snapshot
+from incremental import IncrementalParser
+from interpreter import Interpreter
+from lox_token import Token, TokenArray
+from optimizer import count_nodes
+from output import BufferedOutput
+from profiler import ProfilingInterpreter
+from runner import ENGINES, Engine
+from scanner import FastScanner, Scanner
+from stmt import BlockStmt, Stmt
+from version import __version__
+
+Record = Dict[str, Any]
+""" the str values of a record name the measurement, the others are results """
+
+
+def deep_blocks(depth: int) -> str:
+    """a loop inside depth nested blocks, each declaring a variable"""
+    opening = "".join(f"{{ var d{i} = {i};\n" for i in range(depth))
+    # the innermost variable minus the outermost is depth - 1
+    step = f"d{depth - 1} - d0 - {depth - 2}"
+    loop = f"var i = 0; while (i < 20000) {{ i = i + {step}; }}"
+    return opening + loop + "}" * depth
+
+
+def deep_expressions(size: int) -> Dict[str, str]:
+    """machine generated expressions of size terms, too deep for recursion"""
+    return {
+        "long_chain": "var x = 1" + " + 1" * size + ";",
+        "nested_groups": "var x = " + "(" * size + "1" + ")" * size + ";",
+        "right_nested": "var x = " + "1 + (" * size + "1" + ")" * size + ";",
+        "nested_calls": "var x = " + "abs(" * size + "-1" + ")" * size + ";",
+    }
+
+
+def synthetic_program(size: int) -> str:
+    """a long straight line script of declarations, arithmetic and branches"""
+    lines = ["var v0 = 1;"]
+    for i in range(1, size):
+        lines.append(f"var v{i} = (v{i - 1} + {i}) * 2 - {i} / (v{i - 1} + 3);")
+        if i % 10 == 0:
+            lines.append(f"if (v{i} > 0 and !(v{i} == nil)) {{ v{i} = -v{i}; }}")
+    return "\n".join(lines)
+
+
+WORKLOADS: Dict[str, str] = {
+    "while_loop": """
+var i = 0;
+var sum = 0;
+while (i < 200000) {
+    sum = sum + i * 2;
+    i = i + 1;
+}
+""",
+    "for_loop": """
+var total = 0;
+for (var i = 0; i < 200000; i = i + 1) {
+    var x = i - 1;
+    if (x >= 0 and x <= i) total = total + x / 2;
+}
+""",
+    "nested_blocks": """
+{
+    var i = 0;
+    var sum = 0;
+    while (i < 50000) {
+        var a = i;
+        { { { { var b = a + 1; { sum = sum + b - a; } } } } }
+        i = i + 1;
+    }
+}
+""",
+    "string_concat": """
+var s = "";
+var i = 0;
+while (i < 20000) {
+    s = s + "ab";
+    if (s == "ab") s = s + "";
+    i = i + 1;
+}
+""",
+    "native_calls": """
+var total = 0;
+for (var i = 0; i < 50000; i = i + 1) {
+    total = total + sqrt(i) + max(i, len("abc"));
+}
+""",
+    "fib": """
+fun fib(n) {
+    if (n < 2) return n;
+    return fib(n - 2) + fib(n - 1);
+}
+var result = fib(25);
+""",
+    "print_loop": """
+for (var i = 0; i < 50000; i = i + 1) {
+    print i;
+    print "line " + "of output";
+}
+""",
+    "deep_blocks": deep_blocks(100),
+    "straight_line": synthetic_program(5000),
+}
+""" the corpus of lox programs """
+
+LOOP_WORKLOADS = ["while_loop", "for_loop", "nested_blocks"]
+
+_DEVNULL = open(os.devnull, "w")
+
+
+def _engine(name: str) -> Engine:
+    """a new engine throwing away what the workload prints"""
+    return ENGINES[name](BufferedOutput(_DEVNULL))
+
+
+def _parse(source_code: str) -> List[Stmt]:
+    return Parser(FastScanner(source_code).scan_tokens()).parse()
+
+
+def _best_of(repeat: int, fn: Callable[[], Any]) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def _peak_memory(fn: Callable[[], Any]) -> int:
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def bench_phases(repeat: int, engines: List[str]) -> List[Record]:
+    """time of every phase of running each workload, and the memory peak of
+    the whole run"""
+    records = []
+    for name, source_code in WORKLOADS.items():
+        scan = _best_of(repeat, lambda: FastScanner(source_code).scan_tokens())
+        tokens = FastScanner(source_code).scan_tokens()
+        parse = _best_of(repeat, lambda: Parser(tokens).parse())
+        stmts = Parser(tokens).parse()
+        for engine_name in engines:
+            interpret = _best_of(repeat, lambda: _engine(engine_name).interpret(stmts))
+            peak = _peak_memory(
+                lambda: _engine(engine_name).interpret(_parse(source_code))
+            )
+            records.append(
+                {
+                    "suite": "phases",
+                    "workload": name,
+                    "engine": engine_name,
+                    "scan": scan,
+                    "parse": parse,
+                    "interpret": interpret,
+                    "peak": peak,
+                }
+            )
+    return records
+
+
+def bench_engines(repeat: int, engines: List[str]) -> List[Record]:
+    """run time of the engines on the loops, relative to the first engine"""
+    records = []
+    for name in LOOP_WORKLOADS:
+        stmts = _parse(WORKLOADS[name])
+        baseline = None
+        for engine_name in engines:
+            elapsed = _best_of(repeat, lambda: _engine(engine_name).interpret(stmts))
+            baseline = baseline or elapsed
+            records.append(
+                {
+                    "suite": "engines",
+                    "workload": name,
+                    "engine": engine_name,
+                    "time": elapsed,
+                    "speedup": baseline / elapsed,
+                }
+            )
+    return records
+
+
+def bench_frames(repeat: int) -> List[Record]:
+    """block executions of the loops and how many of them allocated a frame,
+    with the run time of the tree engine"""
+    records = []
+    for name in LOOP_WORKLOADS + ["deep_blocks"]:
+        stmts = _parse(WORKLOADS[name])
+        profiler = ProfilingInterpreter(BufferedOutput(_DEVNULL))
+        profiler.interpret(stmts)
+        blocks = frames = 0
+        for stats in profiler.stats.values():
+            if isinstance(stats.node, BlockStmt):
+                blocks += stats.count
+                if stats.node.size:
+                    frames += stats.count
+        elapsed = _best_of(repeat, lambda: _engine("tree").interpret(stmts))
+        records.append(
+            {
+                "suite": "frames",
+                "workload": name,
+                "blocks": blocks,
+                "frames": frames,
+                "time": elapsed,
+            }
+        )
+    return records
+
+
+def large_source(copies: int) -> str:
+    """a big generated script mixing all kinds of lexemes"""
+    extra = """
+// comments and strings are part of the input too
+var greeting = "hello" + " " + "world";
+print greeting != "multi
+line string";
+"""
+    unit = "\n".join(WORKLOADS[name] for name in LOOP_WORKLOADS) + extra
+    return unit * copies
+
+
+def bench_scanner(repeat: int) -> List[Record]:
+    source_code = large_source(2000)
+    records = []
+    for scanner in (Scanner, FastScanner):
+        elapsed = _best_of(repeat, lambda: scanner(source_code).scan_tokens())
+        records.append(
+            {
+                "suite": "scanner",
+                "scanner": scanner.__name__,
+                "time": elapsed,
+                "mb_per_s": len(source_code) / 1e6 / elapsed,
+            }
+        )
+    return records
+
+
+def bench_tokens() -> List[Record]:
+    """memory kept by the tokens of a big script and the peak while parsing,
+    for a list of Token and for a TokenArray of offsets into the source"""
+    source_code = large_source(500)
+    scanners: Dict[str, Callable[[], Union[List[Token], TokenArray]]] = {
+        "list": lambda: FastScanner(source_code).scan_tokens(),
+        "array": lambda: FastScanner(source_code).scan_token_array(),
+    }
+    records = []
+    for name, scan in scanners.items():
+        tracemalloc.start()
+        tokens = scan()
+        size, _ = tracemalloc.get_traced_memory()
+        Parser(tokens).parse()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        records.append(
+            {
+                "suite": "tokens",
+                "storage": name,
+                "tokens": len(tokens),
+                "bytes_per_token": size / len(tokens),
+                "parse_peak": peak,
+            }
+        )
+        del tokens
+    return records
+
+
+def bench_deep(repeat: int, engines: List[str]) -> List[Record]:
+    """time to parse and run expressions of thousands of terms, with the
+    terms handled per second"""
+    size = 20000
+    records = []
+    for name, source_code in deep_expressions(size).items():
+        tokens = FastScanner(source_code).scan_tokens()
+        parse = _best_of(repeat, lambda: Parser(tokens).parse())
+        for engine_name in engines:
+            # the engines annotate the nodes, every run gets a fresh ast
+            interpret = _best_of(
+                repeat, lambda: _engine(engine_name).interpret(Parser(tokens).parse())
+            )
+            records.append(
+                {
+                    "suite": "deep",
+                    "workload": name,
+                    "engine": engine_name,
+                    "parse": parse,
+                    "parse_and_run": interpret,
+                    "terms_per_second": size / interpret,
+                }
+            )
+    return records
+
+
+def bench_edit(repeat: int) -> List[Record]:
+    """latency of edits of a 10k line script parsed incrementally, and of
+    undoing them, next to the time of parsing the whole script again"""
+    source_code = synthetic_program(9000)
+    middle = source_code.index("\n", len(source_code) // 2) + 1
+    edits = {
+        "type_character": (middle + 4, "x"),
+        "insert_line": (middle, "\n"),
+        "insert_statement": (0, "print 1;\n"),
+        # the block swallows the rest of the script, the worst case
+        "open_block": (middle, "{"),
+    }
+    full_parse = _best_of(repeat, lambda: _parse(source_code))
+    parser = IncrementalParser(source_code)
+    records = []
+    for name, (offset, text) in edits.items():
+        edit = undo = float("inf")
+        for _ in range(repeat):
+            # the syntax errors of the edits are reported on stdout
+            with contextlib.redirect_stdout(_DEVNULL):
+                start = time.perf_counter()
+                parser.edit(offset, 0, text)
+                edited = time.perf_counter()
+                parser.edit(offset, len(text), "")
+                undone = time.perf_counter()
+            edit = min(edit, edited - start)
+            undo = min(undo, undone - edited)
+        records.append(
+            {
+                "suite": "edit",
+                "edit": name,
+                "lines": source_code.count("\n"),
+                "full_parse": full_parse,
+                "edit_time": edit,
+                "undo_time": undo,
+                "speedup": full_parse / edit,
+            }
+        )
+    return records
+
+
+def prelude(size: int) -> str:
+    """a setup script of size global declarations, loops filling tables and
+    helper functions"""
+    lines = [f"var c{i} = {i} * 2 + 1;" for i in range(size)]
+    lines.append("var total = 0;")
+    lines.append("for (var i = 0; i < 50000; i = i + 1) total = total + i * i;")
+    lines.append('var text = "";')
+    lines.append('for (var i = 0; i < 2000; i = i + 1) text = text + "x";')
+    for i in range(size // 10):
+        lines.append(f"fun f{i}(x) {{ return x * c{i} + total; }}")
+    return "\n".join(lines)
+
+
+def bench_snapshot(repeat: int) -> List[Record]:
+    """time to run a prelude in a fresh interpreter and to restore the
+    snapshot of its globals instead, with the size of the snapshot"""
+    source_code = prelude(5000)
+    run = _best_of(repeat, lambda: Interpreter().interpret(_parse(source_code)))
+    interpreter = Interpreter()
+    interpreter.interpret(_parse(source_code))
+    dump = _best_of(repeat, lambda: snapshot.dumps(interpreter))
+    data = snapshot.dumps(interpreter)
+    restore = _best_of(repeat, lambda: snapshot.loads(Interpreter(), data))
+    return [
+        {
+            "suite": "snapshot",
+            "prelude": run,
+            "dump": dump,
+            "restore": restore,
+            "size": len(data),
+            "speedup": run / restore,
+        }
+    ]
+
+
+def bench_fork(repeat: int) -> List[Record]:
+    """time and memory per variant of a parameter sweep run after a prelude,
+    by forking a warm interpreter and by restoring a snapshot"""
+    variants = 1000
+    base = Interpreter(BufferedOutput(_DEVNULL))
+    base.interpret(_parse(prelude(5000)))
+    data = snapshot.dumps(base)
+    stmts = _parse("c1 = c1 * 3; var result = f1(c1) + f2(c2);")
+
+    def fork_and_run() -> List[Interpreter]:
+        forks = [base.fork(BufferedOutput(_DEVNULL)) for _ in range(variants)]
+        for fork in forks:
+            fork.interpret(stmts)
+        return forks
+
+    def restore_and_run() -> None:
+        for _ in range(variants):
+            interpreter = Interpreter(BufferedOutput(_DEVNULL))
+            snapshot.loads(interpreter, data)
+            interpreter.interpret(stmts)
+
+    fork = _best_of(repeat, fork_and_run)
+    restore = _best_of(1, restore_and_run)
+    tracemalloc.start()
+    forks = fork_and_run()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del forks
+    return [
+        {
+            "suite": "fork",
+            "variants": variants,
+            "fork_and_run": fork / variants,
+            "restore_and_run": restore / variants,
+            "bytes_per_fork": size / variants,
+        }
+    ]
+
+
+def bench_ast(repeat: int) -> List[Record]:
+    """memory taken by the ast of a big program and the time to run it"""
+    tokens = FastScanner(synthetic_program(20000)).scan_tokens()
+    tracemalloc.start()
+    stmts = Parser(tokens).parse()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    nodes = count_nodes(stmts)
+    elapsed = _best_of(repeat, lambda: Interpreter().interpret(stmts))
+    return [
+        {
+            "suite": "ast",
+            "nodes": nodes,
+            "size": size,
+            "bytes_per_node": size / nodes,
+            "time": elapsed,
+        }
+    ]
+
+
+def bench_cache(repeat: int) -> List[Record]:
+    """time to get the ast of a big script by parsing it and from the cache"""
+    source_code = synthetic_program(20000)
+    with tempfile.TemporaryDirectory() as directory:
+        script = os.path.join(directory, "script.lox")
+        cache.store(script, source_code, _parse(source_code))
+        parse = _best_of(repeat, lambda: _parse(source_code))
+        load = _best_of(repeat, lambda: cache.load(script, source_code))
+    return [{"suite": "cache", "parse": parse, "load": load, "speedup": parse / load}]
+
+
+def _key(record: Record) -> tuple:
+    return tuple(sorted((k, v) for k, v in record.items() if isinstance(v, str)))
+
+
+def compare(records: List[Record], baseline: List[Record]) -> None:
+    """add to the records the ratio of each result to the one of the matching
+    baseline record, below 1 is faster or smaller"""
+    previous = {_key(record): record for record in baseline}
+    for record in records:
+        old = previous.get(_key(record))
+        if old is None:
+            continue
+        for name, value in list(record.items()):
+            if not isinstance(value, str) and old.get(name):
+                record[f"{name}_ratio"] = value / old[name]
+
+
+def _format(record: Record) -> str:
+    fields = [
+        f"{name}={value:.4g}" if isinstance(value, float) else f"{name}={value}"
+        for name, value in record.items()
+        if name != "suite"
+    ]
+    return f"{record['suite']:<8} " + " ".join(fields)
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(prog="benchmark")
+    arg_parser.add_argument(
+        "suite",
+        nargs="?",
+        choices=[
+            "phases",
+            "engines",
+            "frames",
+            "deep",
+            "edit",
+            "scanner",
+            "tokens",
+            "ast",
+            "cache",
+            "snapshot",
+            "fork",
+        ],
+        default="phases",
+    )
+    arg_parser.add_argument("--repeat", type=int, default=3)
+    arg_parser.add_argument(
+        "--engine", action="append", choices=sorted(ENGINES), dest="engines"
+    )
+    arg_parser.add_argument(
+        "--json", action="store_true", help="print the results as a json document"
+    )
+    arg_parser.add_argument(
+        "--baseline",
+        metavar="FILE",
+        help="json output of an earlier run to compare the results with",
+    )
+    args = arg_parser.parse_args()
+    engines = args.engines or list(ENGINES)
+
+    if args.suite == "phases":
+        records = bench_phases(args.repeat, engines)
+    elif args.suite == "engines":
+        records = bench_engines(args.repeat, engines)
+    elif args.suite == "frames":
+        records = bench_frames(args.repeat)
+    elif args.suite == "deep":
+        records = bench_deep(args.repeat, engines)
+    elif args.suite == "edit":
+        records = bench_edit(args.repeat)
+    elif args.suite == "scanner":
+        records = bench_scanner(args.repeat)
+    elif args.suite == "tokens":
+        records = bench_tokens()
+    elif args.suite == "ast":
+        records = bench_ast(args.repeat)
+    elif args.suite == "cache":
+        records = bench_cache(args.repeat)
+    elif args.suite == "snapshot":
+        records = bench_snapshot(args.repeat)
+    else:
+        records = bench_fork(args.repeat)
+
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline: List[Record] = json.load(f)["records"]
+        compare(records, baseline)
+
+    if args.json:
+        document = {
+            "version": __version__,
+            "python": platform.python_version(),
+            "records": records,
+        }
+        json.dump(document, sys.stdout, indent=2)
+        print()
+    else:
+        for record in records:
+            print(_format(record))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+""" on disk cache of parsed scripts, the __pycache__ of pylox.
+
+The ast of a script is pickled next to it as
+`__pycache__/<script name>.pylox-<version>.ast`. The file starts with a
+header holding the pylox version, the digest of the layout of the ast
+classes and the hash of the source it was parsed from. A cache file that
+does not match the script, is from another version or layout or cannot be
+read is ignored and the script is parsed again. Like .pyc files the
+cache is trusted, it must not be writable by anyone who could not also edit
+the script. """
+import contextlib
+import hashlib
+import os
+import pickle
+from typing import List, Optional
+
+import expr
+import lox_token
+import stmt
+from stmt import Stmt
+from version import __version__
+
+
+def _layout() -> bytes:
+    """digest of the names and the fields of the classes of the ast"""
+    digest = hashlib.sha256()
+    for module in (lox_token, expr, stmt):
+        for name, value in sorted(vars(module).items()):
+            if not isinstance(value, type) or value.__module__ != module.__name__:
+                continue
+            slots = [s for cls in value.__mro__ for s in getattr(cls, "__slots__", ())]
+            reduce = getattr(value, "__reduce__", None)
+            reduce_name = getattr(reduce, "__qualname__", "")
+            digest.update(f"{name}({','.join(slots)}) {reduce_name}\n".encode())
+    return digest.digest()
+
+
+AST_LAYOUT = _layout()
+""" changes with the fields of any node, so that a cache written before they
+changed is ignored even if the version was not bumped, its nodes would lack
+fields the interpreters use """
+
+_MAGIC = b"PYLOXAST"
+_VERSION = __version__.encode().ljust(16)
+_HEADER_SIZE = (
+    len(_MAGIC) + len(_VERSION) + len(AST_LAYOUT) + hashlib.sha256().digest_size
+)
+
+
+def cache_path(script_path: str) -> str:
+    directory, name = os.path.split(os.path.abspath(script_path))
+    return os.path.join(directory, "__pycache__", f"{name}.pylox-{__version__}.ast")
+
+
+def _header(source_code: str) -> bytes:
+    digest = hashlib.sha256(source_code.encode("utf-8", "surrogatepass")).digest()
+    return _MAGIC + _VERSION + AST_LAYOUT + digest
+
+
+def load(script_path: str, source_code: str) -> Optional[List[Stmt]]:
+    """the cached ast of the script, None if there is no valid cache for this
+    source code"""
+    try:
+        with open(cache_path(script_path), "rb") as f:
+            data = f.read()
+    except OSError:
+        return None
+
+    if data[:_HEADER_SIZE] != _header(source_code):
+        return None
+    try:
+        stmts = pickle.loads(data[_HEADER_SIZE:])
+    except Exception:
+        # a truncated or corrupted file can fail in many ways
+        return None
+    if not isinstance(stmts, list) or not all(isinstance(s, Stmt) for s in stmts):
+        return None
+    return stmts
+
+
+def store(script_path: str, source_code: str, stmts: List[Stmt]) -> bool:
+    """cache the ast parsed from the source code of the script, returns False
+    if it could not be written"""
+    path = cache_path(script_path)
+    try:
+        data = pickle.dumps(stmts, protocol=pickle.HIGHEST_PROTOCOL)
+    except RecursionError:
+        # too deeply nested to pickle, it is parsed every time
+        return False
+
+    # write to a temporary file first so a concurrent run never reads a
+    # partially written cache
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(tmp_path, "wb") as f:
+            f.write(_header(source_code))
+            f.write(data)
+        os.replace(tmp_path, path)
+    except OSError:
+        with contextlib.suppress(OSError):
+            os.remove(tmp_path)
+        return False
+    return True
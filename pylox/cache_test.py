@@ -0,0 +1,91 @@
+import contextlib
+import io
+import os
+import pickle
+import pickletools
+import tempfile
+import unittest
+from parser import Parser
+from unittest import mock
+
+import cache
+from expr import NumberLessExpr, VarExpr
+from interpreter import Interpreter
+from scanner import Scanner
+
+SOURCE = "var a = 1;\n{ var b = a + 2; print b * -a; }\nwhile (a < 3) a = a + 1;"
+
+
+class CacheTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self._dir = tempfile.TemporaryDirectory()
+        self.script = os.path.join(self._dir.name, "script.lox")
+        self.stmts = Parser(Scanner(SOURCE).scan_tokens()).parse()
+
+    def tearDown(self) -> None:
+        self._dir.cleanup()
+
+    def test_load_stored(self) -> None:
+        self.assertIsNone(cache.load(self.script, SOURCE))
+        self.assertTrue(cache.store(self.script, SOURCE, self.stmts))
+        self.assertEqual(cache.load(self.script, SOURCE), self.stmts)
+
+    def test_source_changed(self) -> None:
+        cache.store(self.script, SOURCE, self.stmts)
+        self.assertIsNone(cache.load(self.script, SOURCE + "\nprint a;"))
+
+    def test_corrupted(self) -> None:
+        cache.store(self.script, SOURCE, self.stmts)
+        path = cache.cache_path(self.script)
+        with open(path, "rb") as f:
+            data = f.read()
+
+        for corrupted in [data[:-10], data[:20], data[:-10] + b"garbage..."]:
+            with self.subTest(msg=f"test {len(corrupted)} bytes"):
+                with open(path, "wb") as f:
+                    f.write(corrupted)
+                self.assertIsNone(cache.load(self.script, SOURCE))
+
+    def test_version_mismatch(self) -> None:
+        cache.store(self.script, SOURCE, self.stmts)
+        path = cache.cache_path(self.script)
+        with open(path, "rb") as f:
+            data = f.read()
+        with open(path, "wb") as f:
+            f.write(data.replace(cache.__version__.encode(), b"0.0.0", 1))
+        self.assertIsNone(cache.load(self.script, SOURCE))
+
+    def test_layout_mismatch(self) -> None:
+        # a node gaining a field changes the layout
+        with mock.patch.object(VarExpr, "__slots__", ("token",)):
+            stale_layout = cache._layout()
+        self.assertNotEqual(stale_layout, cache.AST_LAYOUT)
+
+        # a cache of the same version written before the field was added
+        cache.store(self.script, SOURCE, self.stmts)
+        path = cache.cache_path(self.script)
+        with open(path, "rb") as f:
+            data = f.read()
+        with open(path, "wb") as f:
+            f.write(data.replace(cache.AST_LAYOUT, stale_layout, 1))
+        self.assertIsNone(cache.load(self.script, SOURCE))
+
+    def test_nodes_pickled_as_calls(self) -> None:
+        with contextlib.redirect_stdout(io.StringIO()):
+            Interpreter().interpret(self.stmts)
+        cond = self.stmts[2].cond  # type: ignore[attr-defined]
+        self.assertIsInstance(cond, NumberLessExpr)
+        self.assertIsNotNone(cond.left.cell)
+
+        cache.store(self.script, SOURCE, self.stmts)
+        stmts = cache.load(self.script, SOURCE)
+        self.assertEqual(stmts, self.stmts)
+        loaded = stmts[2].cond  # type: ignore
+        self.assertIsInstance(loaded, NumberLessExpr)
+        self.assertIsNone(loaded.left.cell)
+        # no node or token is restored slot by slot, which is several times
+        # slower to load
+        data = pickle.dumps(self.stmts, protocol=pickle.HIGHEST_PROTOCOL)
+        opcodes = {opcode.name for opcode, _, _ in pickletools.genops(data)}
+        self.assertNotIn("BUILD", opcodes)
+        self.assertNotIn("NEWOBJ", opcodes)
@@ -0,0 +1,101 @@
+""" bytecode representation executed by the vm """
+from enum import IntEnum, unique
+from typing import Any, Dict, List, Tuple
+
+
+@unique
+class OpCode(IntEnum):
+    """the instruction set of the vm, operands follow the opcode inline"""
+
+    CONSTANT = 0
+    NIL = 1
+    TRUE = 2
+    FALSE = 3
+    POP = 4
+    POPN = 5
+    """ stack manipulation """
+
+    DEFINE_GLOBAL = 6
+    GET_GLOBAL = 7
+    SET_GLOBAL = 8
+    GET_LOCAL = 9
+    SET_LOCAL = 10
+    """ variables """
+
+    ADD = 11
+    SUBTRACT = 12
+    MULTIPLY = 13
+    DIVIDE = 14
+    NEGATE = 15
+    NOT = 16
+    EQUAL = 17
+    NOT_EQUAL = 18
+    GREATER = 19
+    GREATER_EQUAL = 20
+    LESS = 21
+    LESS_EQUAL = 22
+    """ operators """
+
+    JUMP = 23
+    JUMP_IF_FALSE = 24
+    JUMP_IF_TRUE = 25
+    POP_JUMP_IF_FALSE = 26
+    """ control flow, the operand is the absolute target offset """
+
+    PRINT = 27
+    RETURN = 28
+    CALL = 29
+    """ the operand is the number of arguments above the callee on the stack """
+
+    CLOSURE = 30
+    """ the operand is the constant of the function, then for each variable it
+    captures 1 and the slot of a local or 0 and the index of an upvalue """
+    GET_UPVALUE = 31
+    SET_UPVALUE = 32
+    CLOSE_UPVALUES = 33
+    """ closures, the operand of CLOSE_UPVALUES is the first slot of the locals
+    going out of scope """
+
+
+class Chunk:
+    def __init__(self) -> None:
+        self.code: List[int] = []
+        """ opcodes interleaved with their operands """
+        self.constants: List[Any] = []
+        """ the constant pool """
+        self.lines: List[int] = []
+        """ source line of every entry of code """
+        self._constant_index: Dict[Tuple[type, str], int] = {}
+
+    def write(self, byte: int, line: int) -> int:
+        # plain ints compare faster than IntEnum members in the dispatch loop
+        self.code.append(int(byte))
+        self.lines.append(line)
+        return len(self.code) - 1
+
+    def add_constant(self, value: Any) -> int:
+        # 1.0 == True and 0.0 == -0.0, so dedup on the type and the exact repr
+        key = (type(value), repr(value))
+        index = self._constant_index.get(key)
+        if index is None:
+            index = len(self.constants)
+            self.constants.append(value)
+            self._constant_index[key] = index
+        return index
+
+
+class Function:
+    """a function declared by the program, a constant of the chunk declaring it"""
+
+    __slots__ = ("name", "arity", "chunk", "upvalue_count")
+
+    def __init__(self, name: str, arity: int, chunk: Chunk, upvalue_count: int) -> None:
+        self.name = name
+        self.arity = arity
+        self.chunk = chunk
+        """ the body, the arguments are its first locals """
+        self.upvalue_count = upvalue_count
+        """ number of variables of the enclosing functions it captures """
+
+    def __str__(self) -> str:
+        return f"<fn {self.name}>"
@@ -0,0 +1,621 @@
+""" execution engine compiling the ast into nested python closures once, so
+the operator and variable kinds are decided at compile time instead of on
+every evaluation """
+import operator
+from typing import Any, Callable, List, Optional, Tuple
+
+from env import UNDEFINED, Environment, Frame
+from error import LoxRuntimeError, error
+from expr import (
+    AND_STEP,
+    ASSIGN_STEP,
+    BINARY_STEP,
+    LEAF_STEP,
+    OR_STEP,
+    UNARY_STEP,
+    AssignExpr,
+    BinaryExpr,
+    CallExpr,
+    DeepExpr,
+    Expr,
+    ExprVisitor,
+    GroupExpr,
+    LiteralExpr,
+    LogicExpr,
+    UnaryExpr,
+    VarExpr,
+)
+from interpreter import call_error, type_error
+from lox_token import Token
+from natives import NATIVES, NativeError, NativeFunction
+from output import BufferedOutput, Output
+from resolver import Resolver
+from stmt import (
+    BlockStmt,
+    ConditionalStmt,
+    DeclStmt,
+    ExprStmt,
+    FunStmt,
+    PrintStmt,
+    ReturnStmt,
+    Stmt,
+    StmtVisitor,
+    WhileStmt,
+)
+from token_type import TokenType
+
+Evaluator = Callable[[Frame], Any]
+""" evaluates a compiled expression in the frame of the enclosing block """
+Executor = Callable[[Frame], Any]
+""" executes a compiled statement in the frame of the enclosing block. In a
+function body the executor of a statement which can return gives the
+returned value in a tuple, or None if no return statement ran. """
+
+
+class ClosureFunction:
+    """a function declared by the program, run by the ClosureInterpreter"""
+
+    __slots__ = ("name", "arity", "size", "body", "closure")
+
+    def __init__(
+        self, name: str, arity: int, size: int, body: Executor, closure: Frame
+    ) -> None:
+        self.name = name
+        self.arity = arity
+        self.size = size
+        self.body = body
+        self.closure = closure
+        """ frame of the block declaring the function """
+
+    def __str__(self) -> str:
+        return f"<fn {self.name}>"
+
+
+class ClosureCompiler(ExprVisitor, StmtVisitor):
+    """compiles resolved statements into closures, see Resolver"""
+
+    def __init__(self, globals_: Environment, output: Output) -> None:
+        self._globals = globals_
+        self._output = output
+
+    def compile(self, stmts: List[Stmt]) -> Executor:
+        return self._sequence([self._compile_stmt(stmt) for stmt in stmts])
+
+    def compile_expr(self, expr: Expr) -> Evaluator:
+        return expr.accept(self)
+
+    def visit_literal(self, expr: LiteralExpr) -> Evaluator:
+        value = expr.value
+        return lambda frame: value
+
+    def visit_group(self, expr: GroupExpr) -> Evaluator:
+        return self.compile_expr(expr.expr)
+
+    def visit_unary(self, expr: UnaryExpr) -> Evaluator:
+        right = self.compile_expr(expr.right)
+        op = expr.op
+
+        if op.ttype == TokenType.MINUS:
+
+            def negate(frame: Frame) -> Any:
+                value = right(frame)
+                if value.__class__ is not float:
+                    raise type_error(op, float)
+                return -1 * value
+
+            return negate
+        elif op.ttype == TokenType.BANG:
+
+            def not_(frame: Frame) -> Any:
+                value = right(frame)
+                return value is None or value is False
+
+            return not_
+        else:
+            raise LoxRuntimeError(token=op, msg=f"Unsupported op {op.ttype}")
+
+    def visit_binary(self, expr: BinaryExpr) -> Evaluator:
+        left = self.compile_expr(expr.left)
+        right = self.compile_expr(expr.right)
+        op = expr.op
+        op_type = op.ttype
+
+        if op_type == TokenType.PLUS:
+
+            def add(frame: Frame) -> Any:
+                lhs = left(frame)
+                rhs = right(frame)
+                if lhs.__class__ is float:
+                    if rhs.__class__ is not float:
+                        raise type_error(op, float)
+                elif lhs.__class__ is str:
+                    if rhs.__class__ is not str:
+                        raise type_error(op, str)
+                return lhs + rhs
+
+            return add
+        elif op_type == TokenType.MINUS:
+
+            def subtract(frame: Frame) -> Any:
+                lhs = left(frame)
+                rhs = right(frame)
+                if lhs.__class__ is float and rhs.__class__ is float:
+                    return lhs - rhs
+                raise type_error(op, float)
+
+            return subtract
+        elif op_type == TokenType.STAR:
+
+            def multiply(frame: Frame) -> Any:
+                lhs = left(frame)
+                rhs = right(frame)
+                if lhs.__class__ is float and rhs.__class__ is float:
+                    return lhs * rhs
+                raise type_error(op, float)
+
+            return multiply
+        elif op_type == TokenType.SLASH:
+
+            def divide(frame: Frame) -> Any:
+                lhs = left(frame)
+                rhs = right(frame)
+                if lhs.__class__ is float and rhs.__class__ is float:
+                    return lhs / rhs
+                raise type_error(op, float)
+
+            return divide
+        elif op_type == TokenType.GREATER:
+
+            def greater(frame: Frame) -> Any:
+                lhs = left(frame)
+                rhs = right(frame)
+                if lhs.__class__ is float and rhs.__class__ is float:
+                    return lhs > rhs
+                raise type_error(op, float)
+
+            return greater
+        elif op_type == TokenType.GREATER_EQUAL:
+
+            def greater_equal(frame: Frame) -> Any:
+                lhs = left(frame)
+                rhs = right(frame)
+                if lhs.__class__ is float and rhs.__class__ is float:
+                    return lhs >= rhs
+                raise type_error(op, float)
+
+            return greater_equal
+        elif op_type == TokenType.LESS:
+
+            def less(frame: Frame) -> Any:
+                lhs = left(frame)
+                rhs = right(frame)
+                if lhs.__class__ is float and rhs.__class__ is float:
+                    return lhs < rhs
+                raise type_error(op, float)
+
+            return less
+        elif op_type == TokenType.LESS_EQUAL:
+
+            def less_equal(frame: Frame) -> Any:
+                lhs = left(frame)
+                rhs = right(frame)
+                if lhs.__class__ is float and rhs.__class__ is float:
+                    return lhs <= rhs
+                raise type_error(op, float)
+
+            return less_equal
+        elif op_type == TokenType.EQUAL_EQUAL:
+            return lambda frame: left(frame) == right(frame)
+        elif op_type == TokenType.BANG_EQUAL:
+            return lambda frame: left(frame) != right(frame)
+        else:
+            raise LoxRuntimeError(token=op, msg=f"Unsupported op {op_type}")
+
+    def visit_logic(self, expr: LogicExpr) -> Evaluator:
+        left = self.compile_expr(expr.left)
+        right = self.compile_expr(expr.right)
+        if expr.op.ttype == TokenType.OR:
+            return lambda frame: left(frame) or right(frame)
+        else:
+            return lambda frame: left(frame) and right(frame)
+
+    def visit_call(self, expr: CallExpr) -> Evaluator:
+        callee_of = self.compile_expr(expr.callee)
+        args_of = [self.compile_expr(arg) for arg in expr.args]
+        paren = expr.paren
+
+        def call(frame: Frame) -> Any:
+            return _call(paren, callee_of(frame), [arg_of(frame) for arg_of in args_of])
+
+        return call
+
+    def visit_deep(self, expr: DeepExpr) -> Evaluator:
+        steps = [
+            (kind, self._deep_step(kind, node), operand)
+            for kind, node, operand in expr.code
+        ]
+
+        def run(frame: Frame) -> Any:
+            stack: List[Any] = []
+            push = stack.append
+            pop = stack.pop
+            ip = 0
+            while ip < len(steps):
+                kind, function, operand = steps[ip]
+                ip += 1
+                if kind == LEAF_STEP:
+                    push(function(frame))
+                elif kind == BINARY_STEP:
+                    right = pop()
+                    stack[-1] = function(stack[-1], right)
+                elif kind == UNARY_STEP:
+                    stack[-1] = function(stack[-1])
+                elif kind == AND_STEP:
+                    if stack[-1]:
+                        pop()
+                    else:
+                        ip = operand
+                elif kind == OR_STEP:
+                    if stack[-1]:
+                        ip = operand
+                    else:
+                        pop()
+                elif kind == ASSIGN_STEP:
+                    function(frame, stack[-1])
+                else:
+                    args = stack[len(stack) - operand :]
+                    del stack[len(stack) - operand :]
+                    stack[-1] = function(stack[-1], args)
+            return stack[0]
+
+        return run
+
+    def _deep_step(self, kind: int, node: Expr) -> Any:
+        """the function running one step of a DeepExpr"""
+        if kind == LEAF_STEP:
+            return self.compile_expr(node)
+        if kind == UNARY_STEP:
+            assert isinstance(node, UnaryExpr)
+            return _unary_operation(node.op)
+        if kind == BINARY_STEP:
+            assert isinstance(node, BinaryExpr)
+            return _binary_operation(node.op)
+        if kind == ASSIGN_STEP:
+            assert isinstance(node, AssignExpr)
+            token, depth, slot = node.token, node.depth, node.slot
+            if depth is None:
+                assign = self._globals.assign
+                return lambda frame, value: assign(token, value)
+            return lambda frame, value: frame.assign_at(depth, slot, token, value)
+        if isinstance(node, CallExpr):
+            paren = node.paren
+            return lambda callee, args: _call(paren, callee, args)
+        return None
+
+    def visit_var(self, expr: VarExpr) -> Evaluator:
+        token = expr.token
+        depth = expr.depth
+        slot = expr.slot
+
+        if depth is None:
+            get_value = self._globals.get_value
+            return lambda frame: get_value(token)
+        elif depth == 0:
+
+            def get_local(frame: Frame) -> Any:
+                value = frame.values[slot]
+                if value is UNDEFINED:
+                    raise LoxRuntimeError(
+                        token=token, msg=f"Undefined variable {token.lexeme}"
+                    )
+                return value
+
+            return get_local
+        else:
+            return lambda frame: frame.get_at(depth, slot, token)
+
+    def visit_assign(self, expr: AssignExpr) -> Evaluator:
+        value_of = self.compile_expr(expr.expr)
+        token = expr.token
+        depth = expr.depth
+        slot = expr.slot
+
+        if depth is None:
+            assign = self._globals.assign
+
+            def assign_global(frame: Frame) -> Any:
+                value = value_of(frame)
+                assign(token, value)
+                return value
+
+            return assign_global
+        else:
+
+            def assign_local(frame: Frame) -> Any:
+                value = value_of(frame)
+                frame.assign_at(depth, slot, token, value)  # type: ignore
+                return value
+
+            return assign_local
+
+    def visit_print(self, stmt: PrintStmt) -> Executor:
+        value_of = self.compile_expr(stmt.expr)
+        write = self._output.write
+        return lambda frame: write(f"{value_of(frame)}\n")
+
+    def visit_expr(self, stmt: ExprStmt) -> Executor:
+        return self.compile_expr(stmt.expr)
+
+    def visit_decl(self, stmt: DeclStmt) -> Executor:
+        value_of = (
+            (lambda frame: None)
+            if stmt.initializer is None
+            else self.compile_expr(stmt.initializer)
+        )
+        name = stmt.token.lexeme
+        slot = stmt.slot
+
+        if slot is None:
+            define = self._globals.define
+            return lambda frame: define(name, value_of(frame))
+
+        def define_local(frame: Frame) -> None:
+            frame.values[slot] = value_of(frame)  # type: ignore
+
+        return define_local
+
+    def visit_block(self, stmt: BlockStmt) -> Executor:
+        if _returns(stmt):
+            body = self._returning_sequence(stmt.stmts)
+        else:
+            body = self._sequence([self._compile_stmt(s) for s in stmt.stmts])
+        size = stmt.size
+        if not size:
+            # the block declares nothing, see Resolver
+            return body
+        return lambda frame: body(Frame(size, frame))
+
+    def visit_conditional(self, stmt: ConditionalStmt) -> Executor:
+        cond = self.compile_expr(stmt.cond)
+        if _returns(stmt):
+            return self._returning_conditional(stmt, cond)
+        truthy = self._compile_stmt(stmt.truthy)
+
+        if stmt.falsy is None:
+
+            def if_(frame: Frame) -> None:
+                if cond(frame):
+                    truthy(frame)
+
+            return if_
+
+        falsy = self._compile_stmt(stmt.falsy)
+
+        def if_else(frame: Frame) -> None:
+            if cond(frame):
+                truthy(frame)
+            else:
+                falsy(frame)
+
+        return if_else
+
+    def visit_while(self, stmt: WhileStmt) -> Executor:
+        cond = self.compile_expr(stmt.cond)
+        body = self._compile_stmt(stmt.stmt)
+        if _returns(stmt):
+
+            def returning_while(frame: Frame) -> Optional[Tuple[Any]]:
+                while cond(frame):
+                    returned = body(frame)
+                    if returned is not None:
+                        return returned
+                return None
+
+            return returning_while
+
+        if isinstance(stmt.cond, LiteralExpr) and stmt.cond.value:
+
+            def loop(frame: Frame) -> None:
+                while True:
+                    body(frame)
+
+            return loop
+
+        def while_(frame: Frame) -> None:
+            while cond(frame):
+                body(frame)
+
+        return while_
+
+    def visit_function(self, stmt: FunStmt) -> Executor:
+        body = self._returning_sequence(stmt.body)
+        name = stmt.token.lexeme
+        arity = len(stmt.params)
+        size = stmt.size
+        slot = stmt.slot
+
+        if slot is None:
+            define = self._globals.define
+
+            def define_global(frame: Frame) -> None:
+                define(name, ClosureFunction(name, arity, size, body, frame))
+
+            return define_global
+
+        def define_local(frame: Frame) -> None:
+            frame.values[slot] = ClosureFunction(  # type: ignore
+                name, arity, size, body, frame
+            )
+
+        return define_local
+
+    def visit_return(self, stmt: ReturnStmt) -> Executor:
+        if stmt.value is None:
+            return lambda frame: (None,)
+        value_of = self.compile_expr(stmt.value)
+        return lambda frame: (value_of(frame),)
+
+    def _compile_stmt(self, stmt: Stmt) -> Executor:
+        return stmt.accept(self)
+
+    def _returning_sequence(self, stmts: List[Stmt]) -> Executor:
+        """executes the statements until one of them returns"""
+        steps = [(self._compile_stmt(s), _returns(s)) for s in stmts]
+
+        def sequence(frame: Frame) -> Optional[Tuple[Any]]:
+            for execute, returns in steps:
+                # only the result of a statement which can return is one
+                returned = execute(frame)
+                if returns and returned is not None:
+                    return returned
+            return None
+
+        return sequence
+
+    def _returning_conditional(
+        self, stmt: ConditionalStmt, cond: Evaluator
+    ) -> Executor:
+        truthy = self._returning(stmt.truthy)
+        falsy = None if stmt.falsy is None else self._returning(stmt.falsy)
+
+        def if_else(frame: Frame) -> Optional[Tuple[Any]]:
+            if cond(frame):
+                return truthy(frame)
+            elif falsy is not None:
+                return falsy(frame)
+            return None
+
+        return if_else
+
+    def _returning(self, stmt: Stmt) -> Executor:
+        """the executor of a branch whose result is a returned value"""
+        execute = self._compile_stmt(stmt)
+        if _returns(stmt):
+            return execute
+
+        def run(frame: Frame) -> None:
+            execute(frame)
+
+        return run
+
+    @staticmethod
+    def _sequence(executors: List[Executor]) -> Executor:
+        if len(executors) == 1:
+            return executors[0]
+
+        def sequence(frame: Frame) -> None:
+            for execute in executors:
+                execute(frame)
+
+        return sequence
+
+
+def _call(paren: Token, callee: Any, args: List[Any]) -> Any:
+    if callee.__class__ is ClosureFunction and len(args) == callee.arity:
+        try:
+            returned = callee.body(Frame.of_call(args, callee.size, callee.closure))
+        except RecursionError:
+            raise LoxRuntimeError(token=paren, msg="Stack overflow") from None
+        return None if returned is None else returned[0]
+
+    if callee.__class__ is not NativeFunction or len(args) != callee.arity:
+        raise call_error(paren, callee, len(args))
+    try:
+        return callee.function(*args)
+    except NativeError as e:
+        raise LoxRuntimeError(token=paren, msg=e.msg) from None
+
+
+_NUMBER_OPERATIONS = {
+    TokenType.MINUS: operator.sub,
+    TokenType.STAR: operator.mul,
+    TokenType.SLASH: operator.truediv,
+    TokenType.GREATER: operator.gt,
+    TokenType.GREATER_EQUAL: operator.ge,
+    TokenType.LESS: operator.lt,
+    TokenType.LESS_EQUAL: operator.le,
+}
+
+
+def _unary_operation(op: Token) -> Callable[[Any], Any]:
+    """the operator as a function of its operand, for the steps of a DeepExpr"""
+    if op.ttype == TokenType.BANG:
+        return lambda value: value is None or value is False
+
+    def negate(value: Any) -> Any:
+        if value.__class__ is not float:
+            raise type_error(op, float)
+        return -1 * value
+
+    return negate
+
+
+def _binary_operation(op: Token) -> Callable[[Any, Any], Any]:
+    """the operator as a function of its operands, for the steps of a DeepExpr"""
+    op_type = op.ttype
+    if op_type == TokenType.EQUAL_EQUAL:
+        return operator.eq
+    if op_type == TokenType.BANG_EQUAL:
+        return operator.ne
+    if op_type == TokenType.PLUS:
+
+        def add(lhs: Any, rhs: Any) -> Any:
+            if lhs.__class__ is float:
+                if rhs.__class__ is not float:
+                    raise type_error(op, float)
+            elif lhs.__class__ is str:
+                if rhs.__class__ is not str:
+                    raise type_error(op, str)
+            return lhs + rhs
+
+        return add
+
+    operation = _NUMBER_OPERATIONS[op_type]
+
+    def number_operation(lhs: Any, rhs: Any) -> Any:
+        if lhs.__class__ is float and rhs.__class__ is float:
+            return operation(lhs, rhs)
+        raise type_error(op, float)
+
+    return number_operation
+
+
+def _returns(stmt: Stmt) -> bool:
+    """whether a return statement of the enclosing function can run in the
+    statement, which is only the case inside function bodies"""
+    if isinstance(stmt, ReturnStmt):
+        return True
+    if isinstance(stmt, BlockStmt):
+        return any(_returns(s) for s in stmt.stmts)
+    if isinstance(stmt, ConditionalStmt):
+        return _returns(stmt.truthy) or (
+            stmt.falsy is not None and _returns(stmt.falsy)
+        )
+    if isinstance(stmt, WhileStmt):
+        return _returns(stmt.stmt)
+    return False
+
+
+class ClosureInterpreter:
+    """execution engine running the output of ClosureCompiler"""
+
+    def __init__(self, output: Optional[Output] = None) -> None:
+        self.output = output or BufferedOutput()
+        self._globals = Environment()
+        for name, function in NATIVES.items():
+            self._globals.define(name, function)
+        self._frame = Frame(0)
+        self._resolver = Resolver()
+
+    def interpret(self, stmts: List[Stmt]) -> bool:
+        """run the statements, returns False if a runtime error was reported"""
+        self._resolver.resolve(stmts)
+        try:
+            ClosureCompiler(self._globals, self.output).compile(stmts)(self._frame)
+        except LoxRuntimeError as e:
+            self.output.flush()
+            error(e.token.line, e.msg)
+            return False
+        finally:
+            self.output.flush()
+        return True
@@ -0,0 +1,13 @@
+import interpreter_test
+from closures import ClosureInterpreter
+
+
+class ClosureInterpreterTest(interpreter_test.InterpreterTest):
+    def setUp(self):
+        self.interpreter = ClosureInterpreter()
+
+    def test_runtime_error_line(self) -> None:
+        self.assertEqual(
+            self._interpret('var a = 1;\n\nprint a - "b";'),
+            "[line 3] Error: type mismatched for -, expected type is <class 'float'>\n",
+        )
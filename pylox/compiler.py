@@ -0,0 +1,360 @@
+""" lowers the ast produced by the parser into bytecode for the vm """
+from chunk import Chunk, Function, OpCode
+from typing import Dict, List, Optional, Set, Tuple
+
+from expr import (
+    AND_STEP,
+    ASSIGN_STEP,
+    BINARY_STEP,
+    LEAF_STEP,
+    OR_STEP,
+    UNARY_STEP,
+    AssignExpr,
+    BinaryExpr,
+    CallExpr,
+    DeepExpr,
+    Expr,
+    ExprVisitor,
+    GroupExpr,
+    LiteralExpr,
+    LogicExpr,
+    UnaryExpr,
+    VarExpr,
+)
+from lox_token import Token
+from stmt import (
+    BlockStmt,
+    ConditionalStmt,
+    DeclStmt,
+    ExprStmt,
+    FunStmt,
+    PrintStmt,
+    ReturnStmt,
+    Stmt,
+    StmtVisitor,
+    WhileStmt,
+)
+from token_type import TokenType
+
+
+class Compiler(ExprVisitor, StmtVisitor):
+    """compiles the program, or with an enclosing compiler the body of one of
+    its functions. A function using the locals of the functions and blocks
+    around it captures them as upvalues, like in clox."""
+
+    BINARY_OPS = {
+        TokenType.PLUS: OpCode.ADD,
+        TokenType.MINUS: OpCode.SUBTRACT,
+        TokenType.STAR: OpCode.MULTIPLY,
+        TokenType.SLASH: OpCode.DIVIDE,
+        TokenType.EQUAL_EQUAL: OpCode.EQUAL,
+        TokenType.BANG_EQUAL: OpCode.NOT_EQUAL,
+        TokenType.GREATER: OpCode.GREATER,
+        TokenType.GREATER_EQUAL: OpCode.GREATER_EQUAL,
+        TokenType.LESS: OpCode.LESS,
+        TokenType.LESS_EQUAL: OpCode.LESS_EQUAL,
+    }
+
+    def __init__(self, enclosing: Optional["Compiler"] = None) -> None:
+        self._enclosing = enclosing
+        self._chunk = Chunk()
+        self._line = 1
+        """ line of the most recently seen token, recorded for every emitted byte """
+        self._locals: List[Tuple[str, int]] = []
+        """ (name, scope depth) of the locals, the index is the stack slot """
+        self._scope_depth = 0
+        self._captured: Set[int] = set()
+        """ slots of the locals captured by a function declared in their scope """
+        self._upvalues: List[Tuple[bool, int]] = []
+        """ (is local, index) of the captured variables of the enclosing
+        function, a slot of its locals or the index of one of its upvalues """
+
+    def compile(self, stmts: List[Stmt]) -> Chunk:
+        for stmt in stmts:
+            self._compile_stmt(stmt)
+        self._emit(OpCode.NIL)
+        self._emit(OpCode.RETURN)
+        return self._chunk
+
+    def visit_literal(self, expr: LiteralExpr) -> None:
+        value = expr.value
+        if value is None:
+            self._emit(OpCode.NIL)
+        elif value is True:
+            self._emit(OpCode.TRUE)
+        elif value is False:
+            self._emit(OpCode.FALSE)
+        else:
+            self._emit(OpCode.CONSTANT, self._chunk.add_constant(value))
+
+    def visit_unary(self, expr: UnaryExpr) -> None:
+        self._compile_expr(expr.right)
+        self._emit_unary(expr.op)
+
+    def visit_binary(self, expr: BinaryExpr) -> None:
+        self._compile_expr(expr.left)
+        self._compile_expr(expr.right)
+        self._emit_binary(expr.op)
+
+    def visit_group(self, expr: GroupExpr) -> None:
+        self._compile_expr(expr.expr)
+
+    def visit_var(self, expr: VarExpr) -> None:
+        self._line = expr.token.line
+        slot = self._resolve_local(expr.token.lexeme)
+        if slot is not None:
+            self._emit(OpCode.GET_LOCAL, slot)
+            return
+        index = self._resolve_upvalue(expr.token.lexeme)
+        if index is None:
+            self._emit(OpCode.GET_GLOBAL, self._name_constant(expr.token))
+        else:
+            self._emit(OpCode.GET_UPVALUE, index)
+
+    def visit_assign(self, expr: AssignExpr) -> None:
+        self._compile_expr(expr.expr)
+        self._emit_assign(expr.token)
+
+    def visit_logic(self, expr: LogicExpr) -> None:
+        self._compile_expr(expr.left)
+        self._line = expr.op.line
+        if expr.op.ttype == TokenType.OR:
+            end_jump = self._emit_jump(OpCode.JUMP_IF_TRUE)
+        else:
+            end_jump = self._emit_jump(OpCode.JUMP_IF_FALSE)
+        self._emit(OpCode.POP)
+        self._compile_expr(expr.right)
+        self._patch_jump(end_jump)
+
+    def visit_call(self, expr: CallExpr) -> None:
+        self._compile_expr(expr.callee)
+        for arg in expr.args:
+            self._compile_expr(arg)
+        self._line = expr.paren.line
+        self._emit(OpCode.CALL, len(expr.args))
+
+    def visit_deep(self, expr: DeepExpr) -> None:
+        # emitted from the steps, compiling the operands would recurse
+        code = expr.code
+        # the offsets of the jumps to patch at the start of a step
+        jumps: Dict[int, List[int]] = {}
+        for ip, (kind, node, operand) in enumerate(code):
+            for offset in jumps.pop(ip, ()):
+                self._patch_jump(offset)
+            if kind == LEAF_STEP:
+                self._compile_expr(node)
+            elif kind == UNARY_STEP:
+                self._emit_unary(node.op)  # type: ignore[attr-defined]
+            elif kind == BINARY_STEP:
+                self._emit_binary(node.op)  # type: ignore[attr-defined]
+            elif kind == AND_STEP or kind == OR_STEP:
+                self._line = node.op.line  # type: ignore[attr-defined]
+                jump = OpCode.JUMP_IF_FALSE if kind == AND_STEP else OpCode.JUMP_IF_TRUE
+                jumps.setdefault(operand, []).append(self._emit_jump(jump))
+                self._emit(OpCode.POP)
+            elif kind == ASSIGN_STEP:
+                self._emit_assign(node.token)  # type: ignore[attr-defined]
+            else:
+                self._line = node.paren.line  # type: ignore[attr-defined]
+                self._emit(OpCode.CALL, operand)
+        for offset in jumps.pop(len(code), ()):
+            self._patch_jump(offset)
+
+    def visit_print(self, stmt: PrintStmt) -> None:
+        self._compile_expr(stmt.expr)
+        self._emit(OpCode.PRINT)
+
+    def visit_expr(self, stmt: ExprStmt) -> None:
+        self._compile_expr(stmt.expr)
+        self._emit(OpCode.POP)
+
+    def visit_decl(self, stmt: DeclStmt) -> None:
+        if stmt.initializer is None:
+            self._emit(OpCode.NIL)
+        else:
+            self._compile_expr(stmt.initializer)
+        self._line = stmt.token.line
+
+        if self._scope_depth == 0:
+            self._emit(OpCode.DEFINE_GLOBAL, self._name_constant(stmt.token))
+            return
+
+        slot = self._redeclared_slot(stmt.token.lexeme)
+        if slot is None:
+            # the initializer value stays on the stack and becomes the local's slot
+            self._locals.append((stmt.token.lexeme, self._scope_depth))
+        else:
+            # redeclaration in the same block overwrites the variable
+            self._emit(OpCode.SET_LOCAL, slot)
+            self._emit(OpCode.POP)
+
+    def visit_block(self, stmt: BlockStmt) -> None:
+        self._begin_scope()
+        for s in stmt.stmts:
+            self._compile_stmt(s)
+        self._end_scope()
+
+    def visit_conditional(self, stmt: ConditionalStmt) -> None:
+        self._compile_expr(stmt.cond)
+        else_jump = self._emit_jump(OpCode.POP_JUMP_IF_FALSE)
+        self._compile_stmt(stmt.truthy)
+
+        if stmt.falsy is None:
+            self._patch_jump(else_jump)
+        else:
+            end_jump = self._emit_jump(OpCode.JUMP)
+            self._patch_jump(else_jump)
+            self._compile_stmt(stmt.falsy)
+            self._patch_jump(end_jump)
+
+    def visit_while(self, stmt: WhileStmt) -> None:
+        loop_start = len(self._chunk.code)
+        if isinstance(stmt.cond, LiteralExpr) and stmt.cond.value:
+            # a constant condition never exits the loop, don't test it
+            self._compile_stmt(stmt.stmt)
+            self._emit(OpCode.JUMP, loop_start)
+            return
+
+        self._compile_expr(stmt.cond)
+        exit_jump = self._emit_jump(OpCode.POP_JUMP_IF_FALSE)
+        self._compile_stmt(stmt.stmt)
+        self._emit(OpCode.JUMP, loop_start)
+        self._patch_jump(exit_jump)
+
+    def visit_function(self, stmt: FunStmt) -> None:
+        self._line = stmt.token.line
+        name = stmt.token.lexeme
+        slot = None
+        if self._scope_depth > 0:
+            slot = self._redeclared_slot(name)
+            if slot is None:
+                # declared before the body is compiled so that it can't call
+                # itself through a global of the same name
+                self._locals.append((name, self._scope_depth))
+
+        compiler = Compiler(enclosing=self)
+        compiler._line = self._line
+        compiler._scope_depth = 1
+        compiler._locals = [(param.lexeme, 1) for param in stmt.params]
+        chunk = compiler.compile(stmt.body)
+        upvalues = compiler._upvalues
+        function = Function(name, len(stmt.params), chunk, len(upvalues))
+        self._emit(OpCode.CLOSURE, self._chunk.add_constant(function))
+        for is_local, index in upvalues:
+            self._emit(int(is_local), index)
+
+        if self._scope_depth == 0:
+            self._emit(OpCode.DEFINE_GLOBAL, self._name_constant(stmt.token))
+        elif slot is not None:
+            self._emit(OpCode.SET_LOCAL, slot)
+            self._emit(OpCode.POP)
+
+    def visit_return(self, stmt: ReturnStmt) -> None:
+        if stmt.value is None:
+            self._emit(OpCode.NIL)
+        else:
+            self._compile_expr(stmt.value)
+        self._line = stmt.token.line
+        self._emit(OpCode.RETURN)
+
+    def _emit_unary(self, op: Token) -> None:
+        self._line = op.line
+        if op.ttype == TokenType.MINUS:
+            self._emit(OpCode.NEGATE)
+        else:
+            self._emit(OpCode.NOT)
+
+    def _emit_binary(self, op: Token) -> None:
+        self._line = op.line
+        self._emit(self.BINARY_OPS[op.ttype])
+
+    def _emit_assign(self, token: Token) -> None:
+        self._line = token.line
+        slot = self._resolve_local(token.lexeme)
+        if slot is not None:
+            self._emit(OpCode.SET_LOCAL, slot)
+            return
+        index = self._resolve_upvalue(token.lexeme)
+        if index is None:
+            self._emit(OpCode.SET_GLOBAL, self._name_constant(token))
+        else:
+            self._emit(OpCode.SET_UPVALUE, index)
+
+    def _compile_expr(self, expr: Expr) -> None:
+        expr.accept(self)
+
+    def _compile_stmt(self, stmt: Stmt) -> None:
+        stmt.accept(self)
+
+    def _begin_scope(self) -> None:
+        self._scope_depth += 1
+
+    def _end_scope(self) -> None:
+        self._scope_depth -= 1
+        count = 0
+        while self._locals and self._locals[-1][1] > self._scope_depth:
+            self._locals.pop()
+            count += 1
+
+        first = len(self._locals)
+        captured = {slot for slot in self._captured if slot >= first}
+        if captured:
+            self._emit(OpCode.CLOSE_UPVALUES, first)
+            self._captured -= captured
+        if count == 1:
+            self._emit(OpCode.POP)
+        elif count > 1:
+            self._emit(OpCode.POPN, count)
+
+    def _resolve_local(self, name: str) -> Optional[int]:
+        for slot in range(len(self._locals) - 1, -1, -1):
+            if self._locals[slot][0] == name:
+                return slot
+        return None
+
+    def _resolve_upvalue(self, name: str) -> Optional[int]:
+        """the index of the upvalue of the local of an enclosing function, added
+        to this function and the ones in between, None for a global"""
+        enclosing = self._enclosing
+        if enclosing is None:
+            return None
+        slot = enclosing._resolve_local(name)
+        if slot is not None:
+            enclosing._captured.add(slot)
+            return self._add_upvalue(True, slot)
+        index = enclosing._resolve_upvalue(name)
+        if index is None:
+            return None
+        return self._add_upvalue(False, index)
+
+    def _add_upvalue(self, is_local: bool, index: int) -> int:
+        upvalue = (is_local, index)
+        if upvalue not in self._upvalues:
+            self._upvalues.append(upvalue)
+        return self._upvalues.index(upvalue)
+
+    def _redeclared_slot(self, name: str) -> Optional[int]:
+        """the slot of the local of the same name in the current block"""
+        for slot in range(len(self._locals) - 1, -1, -1):
+            local_name, depth = self._locals[slot]
+            if depth < self._scope_depth:
+                break
+            if local_name == name:
+                return slot
+        return None
+
+    def _name_constant(self, token: Token) -> int:
+        return self._chunk.add_constant(token.lexeme)
+
+    def _emit(self, *code: int) -> int:
+        offset = 0
+        for byte in code:
+            offset = self._chunk.write(byte, self._line)
+        return offset
+
+    def _emit_jump(self, op: OpCode) -> int:
+        """emit a forward jump and return the offset of its operand to patch"""
+        return self._emit(op, 0)
+
+    def _patch_jump(self, offset: int) -> None:
+        self._chunk.code[offset] = len(self._chunk.code)
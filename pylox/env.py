@@ -1,34 +1,131 @@
-from typing import Any, Dict, Optional
+from typing import Any, Callable, Dict, List, Optional
 
 from error import LoxRuntimeError
 from lox_token import Token
 
 
+class Cell:
+    """holds the value of a variable of an Environment, a cell stays the same
+    for the life of the environment so it can be cached by the nodes"""
+
+    __slots__ = ("value",)
+
+    def __init__(self, value: Any) -> None:
+        self.value = value
+
+
 class Environment:
     def __init__(self, enclosed: Optional["Environment"] = None) -> None:
-        self._map: Dict[str, Any] = {}
+        self._map: Dict[str, Cell] = {}
         self._enclosed = enclosed
 
     def define(self, name: str, value: Any) -> None:
-        self._map[name] = value
+        cell = self._map.get(name)
+        if cell is None:
+            self._map[name] = Cell(value)
+        else:
+            # redefining keeps the cell, caches of it stay valid
+            cell.value = value
 
     def assign(self, token: Token, value: Any) -> None:
-        name = token.lexeme
-        if name in self._map:
-            self._map[name] = value
-            return
+        self.cell(token).value = value
 
-        if self._enclosed is not None:
-            self._enclosed.assign(token, value)
-        else:
+    def get_value(self, token: Token) -> Any:
+        return self.cell(token).value
+
+    def cell(self, token: Token) -> Cell:
+        """the cell of the variable in this or an enclosing environment"""
+        env: Optional[Environment] = self
+        while env is not None:
+            cell = env._map.get(token.lexeme)
+            if cell is not None:
+                return cell
+            env = env._enclosed
+        raise LoxRuntimeError(token=token, msg=f"Undefined variable {token.lexeme}")
+
+
+class ForkedEnvironment(Environment):
+    """copy on write view of an environment nobody changes any more, the
+    globals of a forked interpreter. A variable is copied into this one the
+    first time its cell is asked for, since the interpreter keeps the cell in
+    its nodes and writes must never reach the shared one. The variables a
+    fork does not use cost it nothing."""
+
+    def __init__(self, shared: Environment, copy: Callable[[Any], Any]) -> None:
+        super().__init__()
+        self.shared = shared
+        self._copy = copy
+        """ copy of a shared value for this environment, values that can be
+        changed through, like the frames of a closure, must not be shared """
+
+    def cell(self, token: Token) -> Cell:
+        cell = self._map.get(token.lexeme)
+        if cell is None:
+            shared = self.shared.cell(token)
+            cell = self._map[token.lexeme] = Cell(self._copy(shared.value))
+        return cell
+
+    def merged(self) -> Environment:
+        """an environment with the shared variables and the ones of this one,
+        to be shared in turn"""
+        if not self._map:
+            return self.shared
+        env = Environment()
+        env._map = {**self.shared._map, **self._map}
+        return env
+
+
+class _Undefined:
+    __slots__ = ()
+
+    def __reduce__(self) -> str:
+        # unpickled as the UNDEFINED of this module, slots are compared by
+        # identity
+        return "UNDEFINED"
+
+
+UNDEFINED = _Undefined()
+""" marks a slot whose declaration has not been executed yet """
+
+
+class Frame:
+    """array backed environment of a block, variables are addressed by their
+    (depth, slot) coordinates computed by the resolver"""
+
+    __slots__ = ("values", "enclosed")
+
+    def __init__(self, size: int, enclosed: Optional["Frame"] = None) -> None:
+        self.values: List[Any] = [UNDEFINED] * size
+        self.enclosed = enclosed
+
+    @classmethod
+    def of_call(cls, args: List[Any], size: int, enclosed: "Frame") -> "Frame":
+        """the frame of a function call, the list of the arguments becomes the
+        storage of the frame, the parameters being its first slots"""
+        frame = cls.__new__(cls)
+        if size > len(args):
+            args += [UNDEFINED] * (size - len(args))
+        frame.values = args
+        frame.enclosed = enclosed
+        return frame
+
+    def get_at(self, depth: int, slot: int, token: Token) -> Any:
+        frame = self
+        while depth:
+            frame = frame.enclosed  # type: ignore[assignment]
+            depth -= 1
+
+        value = frame.values[slot]
+        if value is UNDEFINED:
             raise LoxRuntimeError(token=token, msg=f"Undefined variable {token.lexeme}")
+        return value
 
-    def get_value(self, token: Token) -> Any:
-        name = token.lexeme
-        if name in self._map:
-            return self._map[name]
+    def assign_at(self, depth: int, slot: int, token: Token, value: Any) -> None:
+        frame = self
+        while depth:
+            frame = frame.enclosed  # type: ignore[assignment]
+            depth -= 1
 
-        if self._enclosed is not None:
-            return self._enclosed.get_value(token)
-        else:
+        if frame.values[slot] is UNDEFINED:
             raise LoxRuntimeError(token=token, msg=f"Undefined variable {token.lexeme}")
+        frame.values[slot] = value
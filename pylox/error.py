@@ -10,6 +10,24 @@ class LoxRuntimeError(Exception):
     msg: str
 
 
+@dataclass
+class LoxLimitError(LoxRuntimeError):
+    """raised when a program exceeds a limit of the interpreter running it"""
+
+
+@dataclass
+class LoxParseError(Exception):
+    """a syntax error found by the parser, where is the location as printed
+    after Error, like " at ';'" """
+
+    line: int
+    where: str
+    msg: str
+
+    def __str__(self) -> str:
+        return f"[line {self.line}] Error{self.where}: {self.msg}"
+
+
 def report(line: int, where: str, msg: str) -> None:
     print(f"[line {line}] Error{where}: {msg}")
 
@@ -1,9 +1,12 @@
 """ class that models expressions """
 import abc
-from dataclasses import dataclass
-from typing import Any
+import operator
+from dataclasses import dataclass, field
+from typing import Any, ClassVar, List, Optional, Tuple
 
+from env import Cell, Environment
 from lox_token import Token
+from token_type import TokenType
 
 
 class ExprVisitor(abc.ABC):
@@ -35,14 +38,39 @@ class ExprVisitor(abc.ABC):
     def visit_logic(self, expr: "LogicExpr") -> Any:
         pass
 
+    @abc.abstractmethod
+    def visit_call(self, expr: "CallExpr") -> Any:
+        pass
+
+    @abc.abstractmethod
+    def visit_deep(self, expr: "DeepExpr") -> Any:
+        pass
+
+    def visit_specialized_binary(self, expr: "SpecializedBinaryExpr") -> Any:
+        """only visitors running specialized code need to tell the variants
+        apart from a plain BinaryExpr"""
+        return self.visit_binary(expr)
+
 
 class Expr(abc.ABC):
+    # the nodes are slotted dataclasses without a __dict__, large programs
+    # have many of them
+    __slots__ = ()
+
+    __match_args__: ClassVar[Tuple[str, ...]]
+
+    def __reduce__(self) -> Tuple[type, Tuple]:
+        # pickled as a call of the class with its fields, unpickling restores
+        # the slots of the default state one setattr at a time, several times
+        # slower for the many nodes of a cached script
+        return self.__class__, tuple(getattr(self, f) for f in self.__match_args__)
+
     @abc.abstractmethod
     def accept(self, expr_visitor: ExprVisitor) -> Any:
         pass
 
 
-@dataclass
+@dataclass(slots=True)
 class LiteralExpr(Expr):
     value: Any
 
@@ -50,7 +78,7 @@ class LiteralExpr(Expr):
         return expr_visitor.visit_literal(self)
 
 
-@dataclass
+@dataclass(slots=True)
 class UnaryExpr(Expr):
     op: Token
     right: Expr
@@ -59,7 +87,7 @@ class UnaryExpr(Expr):
         return expr_visitor.visit_unary(self)
 
 
-@dataclass
+@dataclass(slots=True)
 class BinaryExpr(Expr):
     left: Expr
     op: Token
@@ -69,7 +97,91 @@ class BinaryExpr(Expr):
         return expr_visitor.visit_binary(self)
 
 
-@dataclass
+class GenericBinaryExpr(BinaryExpr):
+    """a BinaryExpr that is not worth specializing, see SpecializedBinaryExpr"""
+
+    __slots__ = ()
+
+
+class SpecializedBinaryExpr(BinaryExpr):
+    """a BinaryExpr whose operands had the same type so far.
+
+    An interpreter changes the class of a BinaryExpr to one of the subclasses
+    after running it once, they have the same fields and it keeps its
+    identity. operation must only be applied after checking that both
+    operands are of operand_type, otherwise the node goes back to
+    GenericBinaryExpr."""
+
+    __slots__ = ()
+
+    operand_type: ClassVar[type]
+    # quoted, staticmethod can only be subscripted by the type checkers
+    operation: ClassVar["staticmethod[[Any, Any], Any]"]
+
+    def accept(self, expr_visitor: ExprVisitor) -> Any:
+        return expr_visitor.visit_specialized_binary(self)
+
+
+def generalize(expr: BinaryExpr) -> None:
+    """make a specialized node run the generic code from now on"""
+    expr.__class__ = GenericBinaryExpr
+
+
+class NumberAddExpr(SpecializedBinaryExpr):
+    __slots__ = ()
+    operand_type = float
+    operation = staticmethod(operator.add)
+
+
+class NumberSubtractExpr(SpecializedBinaryExpr):
+    __slots__ = ()
+    operand_type = float
+    operation = staticmethod(operator.sub)
+
+
+class NumberMultiplyExpr(SpecializedBinaryExpr):
+    __slots__ = ()
+    operand_type = float
+    operation = staticmethod(operator.mul)
+
+
+class NumberDivideExpr(SpecializedBinaryExpr):
+    __slots__ = ()
+    operand_type = float
+    operation = staticmethod(operator.truediv)
+
+
+class NumberLessExpr(SpecializedBinaryExpr):
+    __slots__ = ()
+    operand_type = float
+    operation = staticmethod(operator.lt)
+
+
+class NumberLessEqualExpr(SpecializedBinaryExpr):
+    __slots__ = ()
+    operand_type = float
+    operation = staticmethod(operator.le)
+
+
+class NumberGreaterExpr(SpecializedBinaryExpr):
+    __slots__ = ()
+    operand_type = float
+    operation = staticmethod(operator.gt)
+
+
+class NumberGreaterEqualExpr(SpecializedBinaryExpr):
+    __slots__ = ()
+    operand_type = float
+    operation = staticmethod(operator.ge)
+
+
+class StringConcatExpr(SpecializedBinaryExpr):
+    __slots__ = ()
+    operand_type = str
+    operation = staticmethod(operator.add)
+
+
+@dataclass(slots=True)
 class LogicExpr(Expr):
     left: Expr
     op: Token
@@ -79,7 +191,18 @@ class LogicExpr(Expr):
         return expr_visitor.visit_logic(self)
 
 
-@dataclass
+@dataclass(slots=True)
+class CallExpr(Expr):
+    callee: Expr
+    paren: Token
+    """ the closing parenthesis, its line is reported for errors of the call """
+    args: List[Expr]
+
+    def accept(self, expr_visitor: ExprVisitor) -> Any:
+        return expr_visitor.visit_call(self)
+
+
+@dataclass(slots=True)
 class GroupExpr(Expr):
     expr: Expr
 
@@ -87,18 +210,120 @@ class GroupExpr(Expr):
         return expr_visitor.visit_group(self)
 
 
-@dataclass
+@dataclass(slots=True)
 class VarExpr(Expr):
     token: Token
+    depth: Optional[int] = field(default=None, compare=False, repr=False)
+    """ number of enclosing frames to walk up, None for a global variable """
+    slot: int = field(default=0, compare=False, repr=False)
+    """ index of the variable in its frame, meaningless for a global """
+    cell: Optional[Cell] = field(default=None, compare=False, repr=False)
+    """ inline cache of a global, the cell of the variable in cell_env """
+    cell_env: Optional[Environment] = field(default=None, compare=False, repr=False)
+
+    def __reduce__(self) -> Tuple[type, Tuple]:
+        # without the inline cache, the cell belongs to the globals of the
+        # interpreter which ran the node
+        return self.__class__, (self.token, self.depth, self.slot)
 
     def accept(self, expr_visitor: ExprVisitor) -> Any:
         return expr_visitor.visit_var(self)
 
 
-@dataclass
+@dataclass(slots=True)
 class AssignExpr(Expr):
     token: Token
     expr: Expr
+    depth: Optional[int] = field(default=None, compare=False, repr=False)
+    slot: int = field(default=0, compare=False, repr=False)
+    cell: Optional[Cell] = field(default=None, compare=False, repr=False)
+    cell_env: Optional[Environment] = field(default=None, compare=False, repr=False)
+
+    def __reduce__(self) -> Tuple[type, Tuple]:
+        # without the inline cache, like VarExpr
+        return self.__class__, (self.token, self.expr, self.depth, self.slot)
 
     def accept(self, expr_visitor: ExprVisitor) -> Any:
         return expr_visitor.visit_assign(self)
+
+
+LEAF_STEP = 0
+""" push the value of a literal or a variable """
+UNARY_STEP = 1
+BINARY_STEP = 2
+""" replace the operands on top of the stack with the result """
+AND_STEP = 3
+OR_STEP = 4
+""" jump to the operand keeping the left value if it decides the result,
+otherwise pop it and go on with the right operand """
+ASSIGN_STEP = 5
+""" assign the value on top of the stack, leaving it there """
+CALL_STEP = 6
+""" replace the callee and the operand arguments above it with the result """
+
+Step = Tuple[int, Expr, int]
+""" (kind, node, operand) of one step of DeepExpr.code """
+
+
+@dataclass(slots=True)
+class DeepExpr(Expr):
+    """an expression nested too deeply for the recursive visitors, wrapped by
+    the parser. Its code lists the nodes in postfix order, the visitors run it
+    over an explicit stack instead of recursing into expr, so any depth fits
+    in a bounded python stack. Groups have no step."""
+
+    expr: Expr
+    code: List[Step] = field(init=False, compare=False, repr=False)
+
+    def __post_init__(self) -> None:
+        self.code = postfix(self.expr)
+
+    def accept(self, expr_visitor: ExprVisitor) -> Any:
+        return expr_visitor.visit_deep(self)
+
+
+def postfix(expr: Expr) -> List[Step]:
+    """the steps evaluating the expression, built without recursion"""
+    code: List[Step] = []
+    # actions still to do, the last one first: expand a node, emit the step of
+    # a node whose operands have been emitted, or patch the target of a jump
+    todo: List[Tuple[int, Any, int]] = [(_EXPAND, expr, 0)]
+    while todo:
+        action, node, arg = todo.pop()
+        if action == _EMIT:
+            if arg == AND_STEP or arg == OR_STEP:
+                todo.append((_PATCH, node, len(code)))
+                todo.append((_EXPAND, node.right, 0))
+            code.append((arg, node, len(node.args) if arg == CALL_STEP else 0))
+        elif action == _PATCH:
+            code[arg] = (code[arg][0], node, len(code))
+        # the exact classes are checked first, isinstance of an abc is slow
+        elif node.__class__ is LiteralExpr or node.__class__ is VarExpr:
+            code.append((LEAF_STEP, node, 0))
+        elif node.__class__ is GroupExpr or node.__class__ is DeepExpr:
+            todo.append((_EXPAND, node.expr, 0))
+        elif node.__class__ is UnaryExpr:
+            todo.append((_EMIT, node, UNARY_STEP))
+            todo.append((_EXPAND, node.right, 0))
+        elif isinstance(node, BinaryExpr):
+            todo.append((_EMIT, node, BINARY_STEP))
+            todo.append((_EXPAND, node.right, 0))
+            todo.append((_EXPAND, node.left, 0))
+        elif node.__class__ is LogicExpr:
+            kind = OR_STEP if node.op.ttype == TokenType.OR else AND_STEP
+            # the right operand is expanded after the jump has been emitted
+            todo.append((_EMIT, node, kind))
+            todo.append((_EXPAND, node.left, 0))
+        elif node.__class__ is AssignExpr:
+            todo.append((_EMIT, node, ASSIGN_STEP))
+            todo.append((_EXPAND, node.expr, 0))
+        elif node.__class__ is CallExpr:
+            todo.append((_EMIT, node, CALL_STEP))
+            todo.extend((_EXPAND, arg, 0) for arg in reversed(node.args))
+            todo.append((_EXPAND, node.callee, 0))
+        else:
+            raise TypeError(f"unexpected expression {node!r}")
+    return code
+
+
+_EXPAND, _EMIT, _PATCH = range(3)
@@ -1,8 +1,26 @@
 import unittest
+from parser import Parser
+from typing import cast
 
-from expr import BinaryExpr, GroupExpr, LiteralExpr, UnaryExpr
+from expr import (
+    AND_STEP,
+    BINARY_STEP,
+    CALL_STEP,
+    LEAF_STEP,
+    OR_STEP,
+    UNARY_STEP,
+    BinaryExpr,
+    CallExpr,
+    DeepExpr,
+    Expr,
+    GroupExpr,
+    LiteralExpr,
+    UnaryExpr,
+    VarExpr,
+)
 from lox_token import Token
 from pretty_printer import pprint_expr
+from scanner import Scanner
 from token_type import TokenType
 
 
@@ -17,3 +35,39 @@ class ExprText(unittest.TestCase):
         )
 
         self.assertEqual(pprint_expr(expr), "(* (- 123) (group 45.67))")
+
+    def test_call_expr(self) -> None:
+        expr = CallExpr(
+            callee=VarExpr(Token(ttype=TokenType.IDENTIFIER, lexeme="max")),
+            paren=Token(ttype=TokenType.RIGHT_PAREN, lexeme=")"),
+            args=[LiteralExpr(value=1), LiteralExpr(value=2)],
+        )
+
+        self.assertEqual(pprint_expr(expr), "(call max 1 2)")
+
+    def test_deep_expr_code(self) -> None:
+        source = "f(-a, b or c and d) + (1)"
+        expr = cast(Expr, Parser(Scanner(source).scan_tokens())._expression())
+        deep = DeepExpr(expr=expr)
+        self.assertEqual(
+            [(kind, operand) for kind, _, operand in deep.code],
+            [
+                (LEAF_STEP, 0),
+                (LEAF_STEP, 0),
+                (UNARY_STEP, 0),
+                (LEAF_STEP, 0),
+                # the jumps go past the right operand
+                (OR_STEP, 8),
+                (LEAF_STEP, 0),
+                (AND_STEP, 8),
+                (LEAF_STEP, 0),
+                (CALL_STEP, 2),
+                (LEAF_STEP, 0),
+                (BINARY_STEP, 0),
+            ],
+        )
+        self.assertEqual(
+            pprint_expr(expr), "(+ (call f (- a) (or b (and c d))) (group 1.0))"
+        )
+        # the groups have no step
+        self.assertEqual(pprint_expr(deep), "(+ (call f (- a) (or b (and c d))) 1.0)")
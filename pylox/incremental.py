@@ -0,0 +1,192 @@
+""" incremental scanning and parsing of a source while it is edited.
+
+Editors and REPLs send the edits of a script instead of its whole text. Only
+the lexemes from the top level statement before an edit are scanned again,
+until the tokens meet the first token of an untouched statement, and only
+the statements holding new tokens are parsed again, until the parser stops
+right before an untouched statement. The tokens and the statements of the
+rest of the source are kept, the ones after the edit get their lines moved
+when the edit adds or removes lines. """
+import bisect
+from dataclasses import dataclass
+from parser import Parser
+from typing import Iterator, List, Optional, Tuple
+
+from error import LoxParseError
+from lox_token import Token
+from scanner import FastScanner, Span
+from stmt import Stmt
+from token_type import TokenType
+
+
+@dataclass(slots=True)
+class _Unit:
+    """a top level statement with the tokens it was parsed from"""
+
+    start: int
+    """ offset of the first token in the source """
+    spans: List[int]
+    """ start and end offsets of every token, relative to start """
+    tokens: List[Token]
+    stmt: Optional[Stmt]
+    """ None if the statement has a syntax error """
+    errors: List[LoxParseError]
+
+    @property
+    def end(self) -> int:
+        """offset right after the last token"""
+        return self.start + self.spans[-1]
+
+
+_Taken = Tuple[Token, int, int, int]
+""" a token given to the parser with the start and end offsets of its lexeme,
+and the index of the kept unit it starts or -1 """
+
+
+class _UnitParser(Parser):
+    """parses the top level statements one at a time"""
+
+    def unit(self) -> Tuple[Optional[Stmt], List[LoxParseError]]:
+        """the next statement, None if it has a syntax error, and its errors"""
+        errors = len(self.errors)
+        stmt = self._recovering_statement()
+        return stmt, self.errors[errors:]
+
+    def at_end(self) -> bool:
+        return self._eof()
+
+
+class IncrementalParser:
+    """the statements of a source kept up to date as it is edited.
+
+    The kept statements are the same objects after an edit, only the lines
+    of their tokens change, so anything annotating them has to do it again.
+    Like the Parser every new syntax error is reported."""
+
+    def __init__(self, source: str = "") -> None:
+        self.source = ""
+        self._units: List[_Unit] = []
+        self._eof = Token(TokenType.EOF, "", None, 1)
+        self.parsed = 0
+        """ number of statements the last edit parsed """
+        self.edit(0, 0, source)
+
+    @property
+    def statements(self) -> List[Stmt]:
+        """the statements without syntax errors, check errors before running
+        them"""
+        return [unit.stmt for unit in self._units if unit.stmt is not None]
+
+    @property
+    def errors(self) -> List[LoxParseError]:
+        return [error for unit in self._units for error in unit.errors]
+
+    def edit(self, offset: int, length: int, text: str) -> None:
+        """replace the length characters at offset with text"""
+        old = self.source
+        end = offset + length
+        if not 0 <= offset <= end <= len(old):
+            raise ValueError(
+                f"edit of {offset}:{end} out of a source of length {len(old)}"
+            )
+        self.source = old[:offset] + text + old[end:]
+        delta = len(text) - length
+        lines = text.count("\n") - old.count("\n", offset, end)
+
+        units = self._units
+        # the units touching the edit are parsed again, and the one before
+        # them as its last token may have been followed by an else
+        first = max(bisect.bisect_left(units, offset, key=_unit_end) - 1, 0)
+        last = bisect.bisect_right(units, end, key=_unit_start)
+        following = units[last:]
+        for unit in following:
+            unit.start += delta
+            if lines:
+                for token in unit.tokens:
+                    token.line += lines
+                for error in unit.errors:
+                    error.line += lines
+        self._eof.line += lines
+
+        if first:
+            previous = units[first - 1]
+            pos, line = previous.end, previous.tokens[-1].line
+        else:
+            pos, line = 0, 1
+        spans, kept = self._scan(pos, line, following)
+        units[first:] = self._parse(spans, following[kept:])
+
+    def _scan(
+        self, pos: int, line: int, following: List[_Unit]
+    ) -> Tuple[List[Span], int]:
+        """the tokens from pos up to the first token of a following unit, with
+        the index of that unit, or up to the end of the source"""
+        spans: List[Span] = []
+        kept = 0
+        for span in FastScanner(self.source).scan_spans(pos, line):
+            start = span[1]
+            # units starting before the token were swallowed, by a string
+            # opened before them
+            while kept < len(following) and following[kept].start < start:
+                kept += 1
+            if kept < len(following) and following[kept].start == start:
+                return spans, kept
+            spans.append(span)
+        self._eof = spans.pop()[0]
+        return spans, kept
+
+    def _parse(self, spans: List[Span], following: List[_Unit]) -> List[_Unit]:
+        """parse the new tokens, then the tokens of the following units until
+        a statement ends right before one of them"""
+        taken: List[_Taken] = []
+        parser = _UnitParser(self._tokens(spans, following, taken))
+        units = []
+        while not parser.at_end():
+            index = taken[-1][3]
+            if index >= 0:
+                break
+            stmt, errors = parser.unit()
+            # the last token taken is the first one of the next statement
+            units.append(_new_unit(taken[:-1], stmt, errors))
+            del taken[:-1]
+        else:
+            index = len(following)
+        self.parsed = len(units)
+        return units + following[index:]
+
+    def _tokens(
+        self, spans: List[Span], following: List[_Unit], taken: List[_Taken]
+    ) -> Iterator[Token]:
+        """the new tokens then the kept ones, recording them in taken"""
+        for token, start, stop in spans:
+            taken.append((token, start, stop, -1))
+            yield token
+        for index, unit in enumerate(following):
+            offsets = unit.spans
+            for i, token in enumerate(unit.tokens):
+                start = unit.start + offsets[2 * i]
+                stop = unit.start + offsets[2 * i + 1]
+                taken.append((token, start, stop, -1 if i else index))
+                yield token
+        end = len(self.source)
+        taken.append((self._eof, end, end, -1))
+        yield self._eof
+
+
+def _new_unit(
+    taken: List[_Taken], stmt: Optional[Stmt], errors: List[LoxParseError]
+) -> _Unit:
+    start = taken[0][1]
+    spans = []
+    for _, token_start, token_stop, _ in taken:
+        spans.append(token_start - start)
+        spans.append(token_stop - start)
+    return _Unit(start, spans, [token for token, *_ in taken], stmt, errors)
+
+
+def _unit_start(unit: _Unit) -> int:
+    return unit.start
+
+
+def _unit_end(unit: _Unit) -> int:
+    return unit.end
@@ -0,0 +1,92 @@
+import contextlib
+import io
+import unittest
+from parser import Parser
+
+from error import LoxParseError
+from incremental import IncrementalParser
+from scanner import Scanner
+from stmt import ConditionalStmt
+
+SOURCE = """var a = 1;
+fun f(x) {
+    if (x > 0) return "pos
+itive";
+    return nil;
+}
+print f(a);
+{ var b = a + 2; print b; }
+while (a < 3) a = a + 1;
+"""
+
+
+class IncrementalParserTest(unittest.TestCase):
+    def test_same_as_full_parse(self) -> None:
+        parser = IncrementalParser(SOURCE)
+        source = SOURCE
+        # (text at the edit or None for the end, replaced length, new text)
+        edits = [
+            ("1;", 1, "12"),
+            ("", 0, "\n\n"),
+            ("print f", 0, "print 0;\n"),
+            # a string swallowing statements, then closed again
+            ("{ var b", 0, '"'),
+            ('"{ var b', 1, ""),
+            # a block swallowing statements, then closed again
+            ("print f", 0, "{"),
+            ("{print f", 1, ""),
+            ("}\nprint 0", 1, ""),
+            ("\nprint 0", 0, "}"),
+            ("a + 2", 5, "a +"),
+            ("a +;", 3, "-a"),
+            (None, 0, "print"),
+            (None, 0, " 1;"),
+            ("fun", len("fun f(x) {"), ""),
+            ("", len(SOURCE), ""),
+            ("", 0, SOURCE),
+        ]
+        with contextlib.redirect_stdout(io.StringIO()):
+            for at, length, text in edits:
+                offset = len(source) if at is None else source.index(at)
+                length = min(length, len(source) - offset)
+                with self.subTest(msg=f"test replacing {length} at {offset}"):
+                    parser.edit(offset, length, text)
+                    source = source[:offset] + text + source[offset + length :]
+                    self.assertEqual(parser.source, source)
+                    full = Parser(Scanner(source).scan_tokens())
+                    self.assertEqual(parser.statements, full.parse())
+                    self.assertEqual(parser.errors, full.errors)
+
+    def test_untouched_statements_kept(self) -> None:
+        parser = IncrementalParser(SOURCE)
+        before = parser.statements
+        parser.edit(SOURCE.index("f(a)"), 0, "\n")
+        after = parser.statements
+        self.assertEqual(parser.parsed, 2)
+        self.assertEqual(len(after), len(before))
+        for index in [0, 3, 4]:
+            self.assertIs(after[index], before[index])
+        # the statements after the edit are on the next line
+        self.assertEqual(after[4].cond.left.token.line, 10)  # type: ignore
+
+    def test_else_added_to_if(self) -> None:
+        parser = IncrementalParser("if (true) print 1;")
+        parser.edit(len(parser.source), 0, " else print 2;")
+        self.assertEqual(len(parser.statements), 1)
+        self.assertIsInstance(parser.statements[0], ConditionalStmt)
+        self.assertIsNotNone(parser.statements[0].falsy)  # type: ignore
+
+    def test_errors_follow_their_lines(self) -> None:
+        with contextlib.redirect_stdout(io.StringIO()) as out:
+            parser = IncrementalParser("print 1;\nprint ;\n")
+            parser.edit(0, 0, "\n")
+        self.assertEqual(
+            parser.errors, [LoxParseError(3, " at ';'", "Expect Expression")]
+        )
+        # the error is only reported when it is found
+        self.assertEqual(out.getvalue(), "[line 2] Error at ';': Expect Expression\n")
+
+    def test_edit_out_of_the_source(self) -> None:
+        parser = IncrementalParser("print 1;")
+        with self.assertRaises(ValueError):
+            parser.edit(5, 4, "")
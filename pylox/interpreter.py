@@ -1,26 +1,52 @@
+import copy
 import itertools
-from typing import Any, List
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
 
-from env import Environment
+from env import Cell, Environment, ForkedEnvironment, Frame
 from error import LoxRuntimeError, error
 from expr import (
+    AND_STEP,
+    ASSIGN_STEP,
+    BINARY_STEP,
+    LEAF_STEP,
+    OR_STEP,
+    UNARY_STEP,
     AssignExpr,
     BinaryExpr,
+    CallExpr,
+    DeepExpr,
     Expr,
     ExprVisitor,
+    GenericBinaryExpr,
     GroupExpr,
     LiteralExpr,
     LogicExpr,
+    NumberAddExpr,
+    NumberDivideExpr,
+    NumberGreaterEqualExpr,
+    NumberGreaterExpr,
+    NumberLessEqualExpr,
+    NumberLessExpr,
+    NumberMultiplyExpr,
+    NumberSubtractExpr,
+    SpecializedBinaryExpr,
+    StringConcatExpr,
     UnaryExpr,
     VarExpr,
+    generalize,
 )
 from lox_token import Token
+from natives import NATIVES, NativeError, NativeFunction
+from output import BufferedOutput, Output
+from resolver import Resolver
 from stmt import (
     BlockStmt,
     ConditionalStmt,
     DeclStmt,
     ExprStmt,
+    FunStmt,
     PrintStmt,
+    ReturnStmt,
     Stmt,
     StmtVisitor,
     WhileStmt,
@@ -28,21 +54,162 @@ from stmt import (
 from token_type import TokenType
 
 
+def require_type(
+    token: Token, expected_type: type, value: Any, *more_values: Any
+) -> None:
+    """raise the runtime error of the operator token unless all values are of
+    expected_type, shared by the execution engines"""
+    for v in itertools.chain([value], more_values):
+        if not isinstance(v, expected_type):
+            raise type_error(token, expected_type)
+
+
+def type_error(token: Token, expected_type: type) -> LoxRuntimeError:
+    return LoxRuntimeError(
+        token=token,
+        msg=f"type mismatched for {token.lexeme}, expected type is {expected_type}",
+    )
+
+
+def call_error(token: Token, callee: Any, count: int) -> LoxRuntimeError:
+    """the runtime error of calling callee with count arguments, which is
+    not a function or takes another number of arguments"""
+    if getattr(callee, "arity", None) is None:
+        return LoxRuntimeError(token=token, msg="Can only call functions")
+    return LoxRuntimeError(
+        token=token, msg=f"Expected {callee.arity} arguments but got {count}"
+    )
+
+
+SPECIALIZATIONS: Dict[Tuple[TokenType, type], type] = {
+    (TokenType.PLUS, float): NumberAddExpr,
+    (TokenType.MINUS, float): NumberSubtractExpr,
+    (TokenType.STAR, float): NumberMultiplyExpr,
+    (TokenType.SLASH, float): NumberDivideExpr,
+    (TokenType.LESS, float): NumberLessExpr,
+    (TokenType.LESS_EQUAL, float): NumberLessEqualExpr,
+    (TokenType.GREATER, float): NumberGreaterExpr,
+    (TokenType.GREATER_EQUAL, float): NumberGreaterEqualExpr,
+    (TokenType.PLUS, str): StringConcatExpr,
+}
+""" the BinaryExpr variant for an operator applied to operands of a type """
+
+
+class LoxFunction:
+    """a function declared by the program, run by the Interpreter"""
+
+    __slots__ = ("decl", "closure", "arity")
+
+    def __init__(self, decl: FunStmt, closure: Frame) -> None:
+        self.decl = decl
+        self.closure = closure
+        """ frame of the block declaring the function """
+        self.arity = len(decl.params)
+
+    def __str__(self) -> str:
+        return f"<fn {self.decl.token.lexeme}>"
+
+
+def _fork_copier() -> Callable[[Any], Any]:
+    """copies the values of the globals for one fork. A function with a
+    closure gets copies of its frames, so calling it in the fork changes
+    nothing elsewhere, the functions sharing a frame still share its copy."""
+    frames: Dict[int, Frame] = {}
+
+    def copy_value(value: Any) -> Any:
+        if value.__class__ is not LoxFunction:
+            # the other values can not be changed
+            return value
+        closure = copy_frame(value.closure)
+        if closure is value.closure:
+            return value
+        return LoxFunction(value.decl, closure)
+
+    def copy_frame(frame: Frame) -> Frame:
+        if frame.enclosed is None and not frame.values:
+            # the empty frame of the top level
+            return frame
+        copied = frames.get(id(frame))
+        if copied is None:
+            copied = frames[id(frame)] = Frame(0)
+            if frame.enclosed is not None:
+                copied.enclosed = copy_frame(frame.enclosed)
+            copied.values = [copy_value(value) for value in frame.values]
+        return copied
+
+    return copy_value
+
+
 class Interpreter(ExprVisitor, StmtVisitor):
-    def __init__(self) -> None:
-        self._env = Environment()
+    """runs the statements by walking the ast. Executing a statement returns
+    True when a return statement ran, the value is kept in _returned until
+    the call gets it, so returning unwinds without raising an exception."""
+
+    def __init__(self, output: Optional[Output] = None) -> None:
+        self.output = output or BufferedOutput()
+        """ receives what print writes, flushed when interpret returns """
+        self._globals = Environment()
+        for name, function in NATIVES.items():
+            self._globals.define(name, function)
+        self._env = Frame(0)
+        """ frame of the innermost block being executed """
+        self._returned: Any = None
+        self._resolver = Resolver()
+
+    @property
+    def globals(self) -> Environment:
+        """the global variables and functions, the snapshot module saves them
+        and restores them by setting this"""
+        return self._globals
 
-    def interpret(self, stmts: List[Stmt]) -> None:
+    @globals.setter
+    def globals(self, globals_: Environment) -> None:
+        self._globals = globals_
+
+    def fork(self, output: Optional[Output] = None) -> "Interpreter":
+        """a copy of the interpreter starting with the same globals, e.g. to
+        run many variants of a script after a shared prelude. The globals are
+        frozen and shared copy on write by this interpreter and the fork, a
+        fork only pays for the variables it uses. The other attributes are
+        copied shallowly, a ProfilingInterpreter and its forks share the
+        stats."""
+        shared = self._globals
+        if isinstance(shared, ForkedEnvironment):
+            # no chain of shared environments, lookups stay one level deep
+            shared = shared.merged()
+        self._globals = ForkedEnvironment(shared, _fork_copier())
+        fork = copy.copy(self)
+        fork.output = output or BufferedOutput()
+        fork._globals = ForkedEnvironment(shared, _fork_copier())
+        fork._resolver = Resolver()
+        return fork
+
+    def interpret(self, stmts: List[Stmt]) -> bool:
+        """run the statements, returns False if a runtime error was reported"""
+        self._resolver.resolve(stmts)
         try:
             for stmt in stmts:
                 self._execute(stmt)
         except LoxRuntimeError as e:
+            # the output printed before the error comes first
+            self.output.flush()
             error(e.token.line, e.msg)
-            return None
+            return False
+        finally:
+            self.output.flush()
+        return True
 
     def visit_assign(self, expr: AssignExpr) -> Any:
-        value = self._evaluate(expr.expr)
-        self._env.assign(expr.token, value)
+        return self._assign(expr, self._evaluate(expr.expr))
+
+    def _assign(self, expr: AssignExpr, value: Any) -> Any:
+        if expr.depth is None:
+            if expr.cell_env is self._globals:
+                expr.cell.value = value  # type: ignore[union-attr]
+            else:
+                self._global_cell(expr).value = value
+        else:
+            self._env.assign_at(expr.depth, expr.slot, expr.token, value)
         return value
 
     def visit_literal(self, expr: LiteralExpr) -> Any:
@@ -52,22 +219,36 @@ class Interpreter(ExprVisitor, StmtVisitor):
         return self._evaluate(expr.expr)
 
     def visit_var(self, expr: VarExpr) -> Any:
-        return self._env.get_value(expr.token)
+        if expr.depth is None:
+            if expr.cell_env is self._globals:
+                return expr.cell.value  # type: ignore[union-attr]
+            return self._global_cell(expr).value
+        return self._env.get_at(expr.depth, expr.slot, expr.token)
+
+    def _global_cell(self, expr: Union[VarExpr, AssignExpr]) -> Cell:
+        """inline cache miss, looks the global up and keeps its cell in the
+        node. The cache is valid as long as the node runs against the same
+        globals, e.g. not in another session sharing the ast."""
+        cell = self._globals.cell(expr.token)
+        expr.cell = cell
+        expr.cell_env = self._globals
+        return cell
 
     def visit_unary(self, expr: UnaryExpr) -> Any:
-        right = self._evaluate(expr.right)
+        return self._unary(expr.op, self._evaluate(expr.right))
 
-        op_type = expr.op.ttype
+    def _unary(self, op: Token, right: Any) -> Any:
+        op_type = op.ttype
         if op_type == TokenType.MINUS:
-            self._require_type(expr.op, float, right)
+            require_type(op, float, right)
             return -1 * right
         elif op_type == TokenType.BANG:
             return not self._truthy(right)
         else:
-            raise self._runtime_error(expr.op, f"Unsupported op {op_type}")
+            raise self._runtime_error(op, f"Unsupported op {op_type}")
 
     def visit_logic(self, expr: LogicExpr) -> Any:
-        if expr.op == TokenType.OR:
+        if expr.op.ttype == TokenType.OR:
             return self._evaluate(expr.left) or self._evaluate(expr.right)
         else:
             return self._evaluate(expr.left) and self._evaluate(expr.right)
@@ -75,79 +256,200 @@ class Interpreter(ExprVisitor, StmtVisitor):
     def visit_binary(self, expr: BinaryExpr) -> Any:
         left = self._evaluate(expr.left)
         right = self._evaluate(expr.right)
+        value = self._binary(expr.op, left, right)
+
+        if expr.__class__ is BinaryExpr:
+            # first run, pick the variant for the operand types seen now
+            specialized = None
+            if left.__class__ is right.__class__:
+                specialized = SPECIALIZATIONS.get((expr.op.ttype, left.__class__))
+            expr.__class__ = specialized or GenericBinaryExpr
+        return value
+
+    def visit_specialized_binary(self, expr: SpecializedBinaryExpr) -> Any:
+        left = self._evaluate(expr.left)
+        right = self._evaluate(expr.right)
+        operand_type = expr.operand_type
+        if left.__class__ is operand_type and right.__class__ is operand_type:
+            return expr.operation(left, right)
+
+        # the guard failed, the node runs the generic code from now on
+        generalize(expr)
+        return self._binary(expr.op, left, right)
 
-        op_type = expr.op.ttype
+    def _binary(self, op: Token, left: Any, right: Any) -> Any:
+        op_type = op.ttype
         if op_type == TokenType.STAR:
-            self._require_type(expr.op, float, left, right)
+            require_type(op, float, left, right)
             return left * right
         elif op_type == TokenType.SLASH:
-            self._require_type(expr.op, float, left, right)
+            require_type(op, float, left, right)
             return left / right
         elif op_type == TokenType.MINUS:
-            self._require_type(expr.op, float, left, right)
+            require_type(op, float, left, right)
             return left - right
         elif op_type == TokenType.PLUS:
             if isinstance(left, float):
-                self._require_type(expr.op, float, right)
+                require_type(op, float, right)
             if isinstance(left, str):
-                self._require_type(expr.op, str, right)
+                require_type(op, str, right)
             return left + right
         elif op_type == TokenType.GREATER:
-            self._require_type(expr.op, float, left, right)
+            require_type(op, float, left, right)
             return left > right
         elif op_type == TokenType.GREATER_EQUAL:
-            self._require_type(expr.op, float, left, right)
+            require_type(op, float, left, right)
             return left >= right
         elif op_type == TokenType.LESS:
-            self._require_type(expr.op, float, left, right)
+            require_type(op, float, left, right)
             return left < right
         elif op_type == TokenType.LESS_EQUAL:
-            self._require_type(expr.op, float, left, right)
+            require_type(op, float, left, right)
             return left <= right
         elif op_type == TokenType.EQUAL_EQUAL:
             return left == right
         elif op_type == TokenType.BANG_EQUAL:
             return left != right
         else:
-            raise self._runtime_error(expr.op, f"Unsupported op {op_type}")
+            raise self._runtime_error(op, f"Unsupported op {op_type}")
+
+    def visit_call(self, expr: CallExpr) -> Any:
+        callee = self._evaluate(expr.callee)
+        return self._invoke(expr, callee, [self._evaluate(arg) for arg in expr.args])
+
+    def visit_deep(self, expr: DeepExpr) -> Any:
+        """runs the steps of the expression over a stack of values"""
+        code = expr.code
+        stack: List[Any] = []
+        push = stack.append
+        pop = stack.pop
+        ip = 0
+        while ip < len(code):
+            kind, node, operand = code[ip]
+            ip += 1
+            if kind == LEAF_STEP:
+                push(node.accept(self))
+            elif kind == BINARY_STEP:
+                right = pop()
+                stack[-1] = self._binary(node.op, stack[-1], right)  # type: ignore
+            elif kind == UNARY_STEP:
+                stack[-1] = self._unary(node.op, stack[-1])  # type: ignore
+            elif kind == AND_STEP:
+                if stack[-1]:
+                    pop()
+                else:
+                    ip = operand
+            elif kind == OR_STEP:
+                if stack[-1]:
+                    ip = operand
+                else:
+                    pop()
+            elif kind == ASSIGN_STEP:
+                self._assign(node, stack[-1])  # type: ignore
+            else:
+                args = stack[len(stack) - operand :]
+                del stack[len(stack) - operand :]
+                stack[-1] = self._invoke(node, stack[-1], args)  # type: ignore
+        return stack[0]
+
+    def _invoke(self, expr: CallExpr, callee: Any, args: List[Any]) -> Any:
+        if callee.__class__ is LoxFunction and len(args) == callee.arity:
+            try:
+                return self._call(callee, args)
+            except RecursionError:
+                raise LoxRuntimeError(token=expr.paren, msg="Stack overflow") from None
+
+        if callee.__class__ is not NativeFunction or len(args) != callee.arity:
+            raise call_error(expr.paren, callee, len(args))
+        try:
+            return callee.function(*args)
+        except NativeError as e:
+            raise LoxRuntimeError(token=expr.paren, msg=e.msg) from None
 
     def visit_print(self, stmt: PrintStmt) -> None:
         value = self._evaluate(stmt.expr)
-        print(value)
+        self.output.write(f"{value}\n")
 
     def visit_expr(self, stmt: ExprStmt) -> None:
         self._evaluate(stmt.expr)
 
     def visit_decl(self, stmt: DeclStmt) -> None:
         value = None if stmt.initializer is None else self._evaluate(stmt.initializer)
-        self._env.define(stmt.token.lexeme, value)
+        if stmt.slot is None:
+            self._globals.define(stmt.token.lexeme, value)
+        else:
+            self._env.values[stmt.slot] = value
+
+    def visit_block(self, stmt: BlockStmt) -> Optional[bool]:
+        if stmt.size:
+            return self._execute_block(stmt, Frame(stmt.size, self._env))
 
-    def visit_block(self, stmt: BlockStmt) -> None:
-        self._execute_block(stmt, Environment(self._env))
+        # the block declares nothing, see Resolver
+        for s in stmt.stmts:
+            if self._execute(s):
+                return True
+        return None
 
-    def visit_conditional(self, stmt: ConditionalStmt) -> None:
+    def visit_conditional(self, stmt: ConditionalStmt) -> Optional[bool]:
         if self._evaluate(stmt.cond):
-            self._execute(stmt.truthy)
-        else:
-            if stmt.falsy is not None:
-                self._execute(stmt.falsy)
+            return self._execute(stmt.truthy)
+        elif stmt.falsy is not None:
+            return self._execute(stmt.falsy)
+        return None
+
+    def visit_while(self, stmt: WhileStmt) -> Optional[bool]:
+        if isinstance(stmt.cond, LiteralExpr) and stmt.cond.value:
+            # e.g. a `for` without condition, no need to re-evaluate it
+            while True:
+                if self._execute(stmt.stmt):
+                    return True
 
-    def visit_while(self, stmt: WhileStmt) -> None:
         while self._evaluate(stmt.cond):
-            self._execute(stmt.stmt)
+            if self._execute(stmt.stmt):
+                return True
+        return None
+
+    def visit_function(self, stmt: FunStmt) -> None:
+        function = LoxFunction(stmt, self._env)
+        if stmt.slot is None:
+            self._globals.define(stmt.token.lexeme, function)
+        else:
+            self._env.values[stmt.slot] = function
+
+    def visit_return(self, stmt: ReturnStmt) -> bool:
+        self._returned = None if stmt.value is None else self._evaluate(stmt.value)
+        return True
 
     def _evaluate(self, expr: Expr) -> Any:
         return expr.accept(self)
 
-    def _execute(self, stmt: Stmt) -> None:
-        stmt.accept(self)
+    def _execute(self, stmt: Stmt) -> Optional[bool]:
+        """True if a return statement ran"""
+        return stmt.accept(self)
 
-    def _execute_block(self, block: BlockStmt, env: Environment) -> None:
+    def _execute_block(self, block: BlockStmt, env: Frame) -> Optional[bool]:
         previous_env = self._env
         try:
             self._env = env
             for stmt in block.stmts:
-                self._execute(stmt)
+                if self._execute(stmt):
+                    return True
+            return None
+        finally:
+            self._env = previous_env
+
+    def _call(self, function: LoxFunction, args: List[Any]) -> Any:
+        decl = function.decl
+        previous_env = self._env
+        try:
+            # the arguments are bound by using their list as the new frame
+            self._env = Frame.of_call(args, decl.size, function.closure)
+            for stmt in decl.body:
+                if self._execute(stmt):
+                    returned = self._returned
+                    self._returned = None
+                    return returned
+            return None
         finally:
             self._env = previous_env
 
@@ -156,16 +458,6 @@ class Interpreter(ExprVisitor, StmtVisitor):
             return value
         return value is not None
 
-    def _require_type(
-        self, token: Token, expected_type: type, value: Any, *more_values: Any
-    ) -> None:
-        for v in itertools.chain([value], more_values):
-            if not isinstance(v, expected_type):
-                raise self._runtime_error(
-                    token,
-                    f"type mismatched for {token.lexeme}, expected type is {expected_type}",
-                )
-
     @staticmethod
     def _runtime_error(token: Token, msg: str) -> LoxRuntimeError:
         return LoxRuntimeError(token=token, msg=msg)
@@ -1,13 +1,76 @@
+import contextlib
+import io
 import unittest
 from parser import Parser
 from typing import Any, cast
 
-from expr import Expr
+from expr import BinaryExpr, Expr, GenericBinaryExpr, NumberAddExpr, StringConcatExpr
 from interpreter import Interpreter, LoxRuntimeError
+from output import CaptureOutput
 from scanner import Scanner
+from stmt import BlockStmt, PrintStmt, WhileStmt
+
+PROGRAMS = [
+    """
+var a = 1;
+{ var b = 2; var c = a + b; print c; { var a = 10; print a + b; } print a; }
+var s = "x";
+for (var i = 0; i < 3; i = i + 1) { s = s + "y"; }
+print s;
+print nil or "default";
+print false and 1;
+var n = 0;
+while (n < 5) n = n + 1;
+if (n == 5) print "five"; else print "not five";
+{ var q = 1; var q = q + 1; print q; }
+{ if (true) { var a = 2; print a; } print a; }
+print !nil;
+print undefined;
+""",
+    "{ if (true) var a = 1; print a; }",
+    """
+var first; var second; var get; var set;
+for (var i = 0; i < 2; i = i + 1) {
+  var j = i;
+  fun f() { return j; }
+  if (i == 0) first = f; else second = f;
+}
+print first(); print second();
+{
+  var shared = "a";
+  fun g() { return shared; }
+  fun s(v) { shared = v; }
+  get = g; set = s;
+  s("b");
+  print shared;
+}
+set("c");
+print get();
+fun outer(x) {
+  fun middle() { fun inner() { x = x + 1; return x; } return inner; }
+  return middle();
+}
+var inc = outer(10);
+inc();
+print inc();
+{ fun fact(n) { if (n < 2) return 1; return n * fact(n - 1); } print fact(5); }
+""",
+]
+""" programs every engine must run printing the same as the tree interpreter """
+
+
+def run(interpreter: Any, source: str) -> str:
+    """what the engine prints running the source, errors included"""
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        interpreter.interpret(Parser(Scanner(source).scan_tokens()).parse())
+    return out.getvalue()
 
 
 class InterpreterTest(unittest.TestCase):
+    """the tests of the tree interpreter, the tests of the other engines
+    subclass it to run them too. An engine is only run through interpret."""
+
     def setUp(self):
         self.interpreter = Interpreter()
 
@@ -47,10 +110,238 @@ class InterpreterTest(unittest.TestCase):
         self.assertIsNone(self._evaluate('"a"<1'))
         self.assertIsNone(self._evaluate('"a"<=1'))
 
+    def test_undefined_variable(self) -> None:
+        self.assertEqual(
+            self._interpret("{\n  print a;\n  var a = 1;\n}"),
+            "[line 2] Error: Undefined variable a\n",
+        )
+        # a variable is local from its declaration on
+        self.assertEqual(
+            self._interpret('var a = "g";\n{ print a; var a = 1; print a; }'),
+            "g\n1.0\n",
+        )
+        self.assertEqual(
+            self._interpret("{ var a = 1; { b = a; } }"),
+            "[line 1] Error: Undefined variable b\n",
+        )
+
+    def test_native_functions(self) -> None:
+        self.assertEqual(self._evaluate("sqrt(16)"), 4.0)
+        self.assertEqual(self._evaluate("abs(-2) + floor(1.5) + ceil(1.5)"), 5.0)
+        self.assertEqual(self._evaluate("pow(2, 10)"), 1024.0)
+        self.assertEqual(self._evaluate("min(1, 2) - max(1, 2)"), -1.0)
+        self.assertEqual(self._evaluate('len("hello")'), 5.0)
+        self.assertEqual(self._evaluate('substr("hello", 1, -1)'), "ell")
+        self.assertEqual(self._evaluate('upper("a") + lower("B")'), "Ab")
+        self.assertEqual(self._evaluate("str(1) + str(nil)"), "1.0None")
+        self.assertEqual(self._evaluate('num("2.5")'), 2.5)
+        self.assertIsNone(self._evaluate('num("x")'))
+        self.assertTrue(self._evaluate("clock() <= clock()"))
+
+        output = self._interpret("var f = clock;\nprint f;\nprint f() > 0;")
+        self.assertEqual(output, "<native fn clock>\nTrue\n")
+
+    def test_call_errors(self) -> None:
+        self.assertEqual(
+            self._interpret('print 1;\nprint sqrt(\n"a");'),
+            "1.0\n[line 3] Error: sqrt expects a number, got string\n",
+        )
+        self.assertEqual(
+            self._interpret("len();"),
+            "[line 1] Error: Expected 1 arguments but got 0\n",
+        )
+        self.assertEqual(
+            self._interpret('"f"();'), "[line 1] Error: Can only call functions\n"
+        )
+
+    def test_functions(self) -> None:
+        source = """
+fun fib(n) {
+  if (n < 2) return n;
+  return fib(n - 2) + fib(n - 1);
+}
+print fib(10);
+fun first(limit) {
+  var i = 0;
+  while (true) { { i = i + 1; if (i >= limit) return i; } }
+}
+print first(3);
+fun nothing() { 1; }
+print nothing();
+print fib;
+{ var a = 2; fun twice(x) { return x * 2; } print twice(a); }
+"""
+        self.assertEqual(self._interpret(source), "55.0\n3.0\nNone\n<fn fib>\n4.0\n")
+        self.assertEqual(
+            self._interpret("fun f(a, b) {}\nf(1);"),
+            "[line 2] Error: Expected 2 arguments but got 1\n",
+        )
+        self.assertEqual(
+            self._interpret("fun f() { f(); }\nf();"),
+            "[line 1] Error: Stack overflow\n",
+        )
+
+    def test_closures(self) -> None:
+        source = """
+fun counter() {
+  var i = 0;
+  fun increment() { i = i + 1; return i; }
+  return increment;
+}
+var c = counter();
+c();
+print c();
+print counter()();
+"""
+        self.assertEqual(self._interpret(source), "2.0\n1.0\n")
+
+    def test_deep_expressions(self) -> None:
+        n = 3000
+        source = f"""
+var x = 0;
+print 1{" + 1" * n};
+print {"(" * n}"a"{")" * n} + "b";
+print {"1 + (" * n}1{")" * n};
+print {"!" * n}true;
+print {"abs(" * n}-2{")" * n};
+print {" or ".join(["false"] * n)} or (x = 3) or (x = 4);
+print x;
+{{ var a = 2; print {" * ".join(["a"] * 10)}{" - a" * n}; }}
+print 1{" + 1" * n} + nil;
+"""
+        self.assertEqual(
+            self._interpret(source),
+            f"{n + 1.0}\nab\n{n + 1.0}\nTrue\n2.0\n3.0\n3.0\n{1024.0 - 2 * n}\n"
+            "[line 11] Error: type mismatched for +, expected type is "
+            "<class 'float'>\n",
+        )
+
+    def test_output_flushed_before_error(self) -> None:
+        self.assertEqual(
+            self._interpret('print 1;\nprint "a" + 1;\nprint 2;'),
+            "1.0\n[line 2] Error: type mismatched for +, expected type is "
+            "<class 'str'>\n",
+        )
+
+    def test_capture_output(self) -> None:
+        output = CaptureOutput()
+        self.interpreter = type(self.interpreter)(output)
+        self.assertEqual(self._interpret("print 1; print nil;"), "")
+        self.assertEqual(output.getvalue(), "1.0\nNone\n")
+
+    def test_same_output_as_interpreter(self) -> None:
+        for source in PROGRAMS:
+            with self.subTest(msg=f"test running {source!r}"):
+                self.assertEqual(self._interpret(source), run(Interpreter(), source))
+
+    def _interpret(self, source: str) -> str:
+        return run(self.interpreter, source)
+
     def _evaluate(self, source: str) -> Any:
+        """the value of the expression, once the engine printed it like the
+        tree interpreter does, None if it is a runtime error"""
+        print_stmt = f"print {source};"
+        self.assertEqual(self._interpret(print_stmt), run(Interpreter(), print_stmt))
         try:
             expr = Parser(Scanner(source).scan_tokens())._expression()
             self.assertIsNotNone(expr)
-            return self.interpreter._evaluate(cast(Expr, expr))
+            return Interpreter()._evaluate(cast(Expr, expr))
         except LoxRuntimeError:
             return None
+
+
+class SpecializationTest(unittest.TestCase):
+    def test_specialize_after_first_run(self) -> None:
+        stmts = Parser(Scanner('print 1 + 2;\nprint "a" + "b";').scan_tokens()).parse()
+        add, concat = [cast(PrintStmt, stmt).expr for stmt in stmts]
+        self.assertIs(type(add), BinaryExpr)
+
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            Interpreter().interpret(stmts)
+        self.assertEqual(out.getvalue(), "3.0\nab\n")
+        self.assertIs(type(add), NumberAddExpr)
+        self.assertIs(type(concat), StringConcatExpr)
+
+    def test_deoptimize_on_type_change(self) -> None:
+        source = """
+var x = 1;
+for (var i = 0; i < 3; i = i + 1) {
+    print x + x;
+    if (i == 1) x = "s";
+}
+print x == "s";
+print 1 + "a";
+"""
+        stmts = Parser(Scanner(source).scan_tokens()).parse()
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            Interpreter().interpret(stmts)
+        self.assertEqual(
+            out.getvalue(),
+            "2.0\n2.0\nss\nTrue\n"
+            "[line 8] Error: type mismatched for +, expected type is <class 'float'>\n",
+        )
+        loop = cast(BlockStmt, stmts[1]).stmts[1]
+        body = cast(BlockStmt, cast(BlockStmt, cast(WhileStmt, loop).stmt).stmts[0])
+        self.assertIs(type(cast(PrintStmt, body.stmts[0]).expr), GenericBinaryExpr)
+        # == has no specialization
+        self.assertIs(type(cast(PrintStmt, stmts[2]).expr), GenericBinaryExpr)
+
+
+class ForkTest(unittest.TestCase):
+    PRELUDE = """
+var x = 1;
+fun get_x() { return x; }
+fun counter() {
+    var n = 0;
+    fun next() { n = n + 1; return n; }
+    return next;
+}
+var next = counter();
+var get;
+var set;
+{
+    var shared = 0;
+    fun get_shared() { return shared; }
+    fun set_shared(value) { shared = value; }
+    get = get_shared;
+    set = set_shared;
+}
+"""
+
+    def setUp(self) -> None:
+        self.base = Interpreter()
+        run(self.base, self.PRELUDE)
+
+    def test_forks_do_not_see_each_other(self) -> None:
+        first, second = self.base.fork(), self.base.fork()
+        self.assertEqual(
+            run(first, "x = 2; var y = 3; print get_x(); print y;"), "2.0\n3.0\n"
+        )
+        self.assertEqual(
+            run(second, "print get_x(); print y;"),
+            "1.0\n[line 1] Error: Undefined variable y\n",
+        )
+        self.assertEqual(run(self.base, "print x;"), "1.0\n")
+
+    def test_closures_are_copied(self) -> None:
+        first, second = self.base.fork(), self.base.fork()
+        run(first, "next(); next(); set(5);")
+        # the functions closing over the same frame still share it in a fork
+        self.assertEqual(run(first, "print next(); print get();"), "3.0\n5.0\n")
+        self.assertEqual(run(second, "print next(); print get();"), "1.0\n0.0\n")
+        self.assertEqual(run(self.base, "print next(); print get();"), "1.0\n0.0\n")
+
+    def test_fork_of_a_fork(self) -> None:
+        parent = self.base.fork()
+        run(parent, "x = 2; next();")
+        child = parent.fork()
+        run(parent, "x = 3; next();")
+        self.assertEqual(run(child, "print x; print next();"), "2.0\n2.0\n")
+        self.assertEqual(run(parent, "print x; print next();"), "3.0\n3.0\n")
+
+    def test_fork_copies_what_it_uses(self) -> None:
+        fork = self.base.fork()
+        run(fork, "x = x + 1;")
+        self.assertEqual(list(fork.globals._map), ["x"])
@@ -0,0 +1,129 @@
+""" resource limits of the tree interpreter for running untrusted scripts """
+import math
+import time
+from dataclasses import dataclass
+from typing import Any, List, Optional
+
+from env import Frame
+from error import LoxLimitError
+from expr import BinaryExpr, SpecializedBinaryExpr, StringConcatExpr, generalize
+from interpreter import Interpreter, LoxFunction
+from lox_token import Token
+from output import Output
+from profiler import first_line
+from stmt import BlockStmt, Stmt, WhileStmt
+from token_type import TokenType
+
+CLOCK_INTERVAL = 1024
+""" steps between two checks of the wall clock """
+
+
+@dataclass
+class Limits:
+    """the limits of one call of interpret, None is unlimited"""
+
+    steps: Optional[int] = None
+    """ loop iterations and function calls, what makes statements run again """
+    time: Optional[float] = None
+    """ wall clock seconds """
+    depth: Optional[int] = None
+    """ nested block frames and function calls """
+    string_size: Optional[int] = None
+    """ characters of a string built by + """
+
+
+class LimitedInterpreter(Interpreter):
+    """an Interpreter stopping the program with a LoxLimitError once it
+    exceeds one of its limits. The checks live in this class only, the plain
+    Interpreter pays nothing for them."""
+
+    def __init__(
+        self, output: Optional[Output] = None, limits: Optional[Limits] = None
+    ) -> None:
+        super().__init__(output)
+        self.limits = limits = limits or Limits()
+        self.exceeded: Optional[LoxLimitError] = None
+        """ the limit error which ended the last run, if any """
+        self._max_steps = _or_inf(limits.steps)
+        self._max_depth = _or_inf(limits.depth)
+        self._max_string = _or_inf(limits.string_size)
+        self._steps = 0
+        self._depth = 0
+        self._deadline = math.inf
+
+    def interpret(self, stmts: List[Stmt]) -> bool:
+        self.exceeded = None
+        self._steps = 0
+        self._depth = 0
+        if self.limits.time is not None:
+            self._deadline = time.monotonic() + self.limits.time
+        return super().interpret(stmts)
+
+    def visit_while(self, stmt: WhileStmt) -> Optional[bool]:
+        while self._evaluate(stmt.cond):
+            self._step(stmt)
+            if self._execute(stmt.stmt):
+                return True
+        return None
+
+    def _call(self, function: LoxFunction, args: List[Any]) -> Any:
+        self._step(function.decl)
+        self._depth += 1
+        try:
+            if self._depth > self._max_depth:
+                raise self._exceeded(
+                    function.decl, f"depth limit of {self._max_depth} exceeded"
+                )
+            return super()._call(function, args)
+        finally:
+            self._depth -= 1
+
+    def _step(self, node: Any) -> None:
+        self._steps += 1
+        if self._steps > self._max_steps:
+            raise self._exceeded(node, f"step limit of {self._max_steps} exceeded")
+        if not self._steps % CLOCK_INTERVAL and time.monotonic() > self._deadline:
+            raise self._exceeded(node, f"time limit of {self.limits.time}s exceeded")
+
+    def visit_binary(self, expr: BinaryExpr) -> Any:
+        value = super().visit_binary(expr)
+        if expr.__class__ is StringConcatExpr:
+            # strings are only built by _binary, which checks their size
+            generalize(expr)
+        return value
+
+    def visit_specialized_binary(self, expr: SpecializedBinaryExpr) -> Any:
+        if expr.__class__ is StringConcatExpr:
+            # specialized by a run of another interpreter
+            generalize(expr)
+            return self.visit_binary(expr)
+        return super().visit_specialized_binary(expr)
+
+    def _binary(self, op: Token, left: Any, right: Any) -> Any:
+        value = super()._binary(op, left, right)
+        if value.__class__ is str and len(value) > self._max_string:
+            msg = f"string size limit of {self._max_string} exceeded"
+            raise self._exceeded(op, msg)
+        return value
+
+    def _execute_block(self, block: BlockStmt, env: Frame) -> Optional[bool]:
+        self._depth += 1
+        try:
+            if self._depth > self._max_depth:
+                raise self._exceeded(
+                    block, f"depth limit of {self._max_depth} exceeded"
+                )
+            return super()._execute_block(block, env)
+        finally:
+            self._depth -= 1
+
+    def _exceeded(self, node: Any, msg: str) -> LoxLimitError:
+        if not isinstance(node, Token):
+            # nodes like blocks have no token of their own to report the line of
+            node = Token(ttype=TokenType.EOF, lexeme="", line=first_line(node))
+        self.exceeded = LoxLimitError(token=node, msg=msg)
+        return self.exceeded
+
+
+def _or_inf(limit: Optional[int]) -> float:
+    return math.inf if limit is None else limit
@@ -0,0 +1,69 @@
+import contextlib
+import io
+from parser import Parser
+
+import interpreter_test
+from error import LoxLimitError
+from interpreter import Interpreter
+from limits import LimitedInterpreter, Limits
+from scanner import Scanner
+
+
+class LimitedInterpreterTest(interpreter_test.InterpreterTest):
+    def setUp(self):
+        self.interpreter = LimitedInterpreter(limits=Limits())
+
+    def test_step_limit(self) -> None:
+        self.interpreter = LimitedInterpreter(limits=Limits(steps=10))
+        output = self._interpret("var i = 0;\nwhile (i < 10) i = i + 1;\nprint i;")
+        self.assertEqual(output, "10.0\n")
+        self.assertIsNone(self.interpreter.exceeded)
+
+        output = self._interpret("print 1;\nwhile (true)\n  i = i + 1;\nprint 2;")
+        self.assertEqual(output, "1.0\n[line 3] Error: step limit of 10 exceeded\n")
+        self.assertIsInstance(self.interpreter.exceeded, LoxLimitError)
+
+        # the budget is per run
+        self.assertEqual(self._interpret("for (var i = 0; i < 5; i = i + 1) {}"), "")
+
+    def test_time_limit(self) -> None:
+        self.interpreter = LimitedInterpreter(limits=Limits(time=0.05))
+        output = self._interpret("var i = 0;\nwhile (i >= 0)\n  i = i + 1;")
+        self.assertEqual(output, "[line 2] Error: time limit of 0.05s exceeded\n")
+
+    def test_depth_limit(self) -> None:
+        self.interpreter = LimitedInterpreter(limits=Limits(depth=2))
+        self.assertEqual(self._interpret("{ var a; { var b; print 1; } }"), "1.0\n")
+        # blocks without a frame do not count
+        self.assertEqual(self._interpret("{ var a; { { var b; } } }"), "")
+        output = self._interpret("{ var a;\n{ var b;\n{ var c; } } }")
+        self.assertEqual(output, "[line 3] Error: depth limit of 2 exceeded\n")
+
+    def test_calls_count_as_steps_and_depth(self) -> None:
+        source = "fun f(n) {\n  if (n > 0) f(n - 1);\n}\nf(4);"
+        self.interpreter = LimitedInterpreter(limits=Limits(steps=5, depth=5))
+        self.assertEqual(self._interpret(source), "")
+        self.interpreter = LimitedInterpreter(limits=Limits(steps=4))
+        output = self._interpret(source)
+        self.assertEqual(output, "[line 1] Error: step limit of 4 exceeded\n")
+        self.interpreter = LimitedInterpreter(limits=Limits(depth=4))
+        output = self._interpret(source)
+        self.assertEqual(output, "[line 1] Error: depth limit of 4 exceeded\n")
+
+    def test_string_size_limit(self) -> None:
+        self.interpreter = LimitedInterpreter(limits=Limits(string_size=4))
+        source = 'var s = "";\nwhile (true)\n  s = s + "ab";'
+        output = self._interpret(source)
+        self.assertEqual(output, "[line 3] Error: string size limit of 4 exceeded\n")
+
+    def test_string_size_limit_after_another_run(self) -> None:
+        source = 'var s = "";\nfor (var i = 0; i < 3; i = i + 1)\n  s = s + "ab";'
+        stmts = Parser(Scanner(source).scan_tokens()).parse()
+        # the plain interpreter specializes the + to concatenate strings
+        self.assertTrue(Interpreter().interpret(stmts))
+        self.interpreter = LimitedInterpreter(limits=Limits(string_size=4))
+        with contextlib.redirect_stdout(io.StringIO()) as out:
+            self.interpreter.interpret(stmts)
+        self.assertEqual(
+            out.getvalue(), "[line 3] Error: string size limit of 4 exceeded\n"
+        )
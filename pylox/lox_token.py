@@ -1,12 +1,74 @@
+import sys
+from array import array
 from dataclasses import dataclass
-from typing import Any, Optional
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
 from token_type import TokenType
 
 
-@dataclass
+@dataclass(slots=True)
 class Token:
     ttype: TokenType
     lexeme: str
     literal: Optional[Any] = None
     line: int = 1
+
+    def __reduce__(self) -> Tuple[type, Tuple]:
+        # a call of the class like the nodes of the ast, see Expr
+        return Token, (self.ttype, self.lexeme, self.literal, self.line)
+
+
+_TYPES: List[TokenType] = list(TokenType)
+_TYPE_CODES: Dict[TokenType, int] = {ttype: code for code, ttype in enumerate(_TYPES)}
+
+
+class TokenArray:
+    """the tokens of one source stored as offsets into it.
+
+    The type, the start and end offsets of the lexeme and the line of every
+    token are packed in arrays, a Token is only built when the array is indexed
+    or iterated. A parser keeps just the current and the previous token, so
+    the tokens of a whole script cost a few bytes each instead of an object
+    and a lexeme string."""
+
+    __slots__ = ("source", "_types", "_starts", "_ends", "_lines")
+
+    def __init__(self, source: str) -> None:
+        self.source = source
+        self._types = array("B")
+        self._starts = array("I")
+        self._ends = array("I")
+        self._lines = array("I")
+
+    def append(self, ttype: TokenType, start: int, end: int, line: int) -> None:
+        self._types.append(_TYPE_CODES[ttype])
+        self._starts.append(start)
+        self._ends.append(end)
+        self._lines.append(line)
+
+    def __len__(self) -> int:
+        return len(self._types)
+
+    def __getitem__(self, index: int) -> Token:
+        return self._token(
+            _TYPES[self._types[index]],
+            self._starts[index],
+            self._ends[index],
+            self._lines[index],
+        )
+
+    def __iter__(self) -> Iterator[Token]:
+        token = self._token
+        for code, start, end, line in zip(
+            self._types, self._starts, self._ends, self._lines
+        ):
+            yield token(_TYPES[code], start, end, line)
+
+    def _token(self, ttype: TokenType, start: int, end: int, line: int) -> Token:
+        lexeme = self.source[start:end]
+        # the literal of a string or number is recomputed from its lexeme
+        if ttype == TokenType.NUMBER:
+            return Token(ttype, lexeme, float(lexeme), line)
+        elif ttype == TokenType.STRING:
+            return Token(ttype, lexeme, lexeme[1:-1], line)
+        return Token(ttype, sys.intern(lexeme), None, line)
@@ -0,0 +1,168 @@
+""" built-in functions implemented in python, every engine defines them as
+globals before running a program """
+import math
+import time
+from typing import Any, Callable, Dict, Tuple
+
+NativeFn = Callable[..., Any]
+
+
+class NativeError(Exception):
+    """raised by a native function called with invalid arguments, the engine
+    reports it as a runtime error at the call"""
+
+    def __init__(self, msg: str) -> None:
+        super().__init__(msg)
+        self.msg = msg
+
+
+class NativeFunction:
+    """a lox value calling a python function, the engines check the arity
+    and pass the arguments as they are"""
+
+    __slots__ = ("name", "arity", "function")
+
+    def __init__(self, name: str, arity: int, function: NativeFn) -> None:
+        self.name = name
+        self.arity = arity
+        self.function = function
+
+    def __str__(self) -> str:
+        return f"<native fn {self.name}>"
+
+    def __reduce__(self) -> Tuple[Callable[[str], "NativeFunction"], Tuple[str]]:
+        # pickled by name, unpickled as the registered function
+        return registered, (self.name,)
+
+
+NATIVES: Dict[str, NativeFunction] = {}
+""" the registry of the native functions by name """
+
+
+def registered(name: str) -> NativeFunction:
+    return NATIVES[name]
+
+
+def register(name: str, arity: int) -> Callable[[NativeFn], NativeFn]:
+    """decorator adding a python function to the native functions"""
+
+    def add(function: NativeFn) -> NativeFn:
+        NATIVES[name] = NativeFunction(name, arity, function)
+        return function
+
+    return add
+
+
+def _number(name: str, value: Any) -> float:
+    if value.__class__ is not float:
+        raise NativeError(f"{name} expects a number, got {_type_name(value)}")
+    return value
+
+
+def _string(name: str, value: Any) -> str:
+    if value.__class__ is not str:
+        raise NativeError(f"{name} expects a string, got {_type_name(value)}")
+    return value
+
+
+def _index(name: str, value: Any) -> int:
+    if value.__class__ is not float or not value.is_integer():
+        raise NativeError(f"{name} expects an integral index, got {value}")
+    return int(value)
+
+
+def _type_name(value: Any) -> str:
+    if value is None:
+        return "nil"
+    if value.__class__ is bool:
+        return "boolean"
+    if value.__class__ is float:
+        return "number"
+    if value.__class__ is str:
+        return "string"
+    return "function"
+
+
+@register("clock", 0)
+def _clock() -> float:
+    """seconds of a monotonic clock, for timing inside a script"""
+    return time.perf_counter()
+
+
+@register("sqrt", 1)
+def _sqrt(x: Any) -> float:
+    if _number("sqrt", x) < 0:
+        raise NativeError("sqrt expects a non negative number")
+    return math.sqrt(x)
+
+
+@register("abs", 1)
+def _abs(x: Any) -> float:
+    return abs(_number("abs", x))
+
+
+@register("floor", 1)
+def _floor(x: Any) -> float:
+    x = _number("floor", x)
+    return float(math.floor(x)) if math.isfinite(x) else x
+
+
+@register("ceil", 1)
+def _ceil(x: Any) -> float:
+    x = _number("ceil", x)
+    return float(math.ceil(x)) if math.isfinite(x) else x
+
+
+@register("pow", 2)
+def _pow(x: Any, y: Any) -> float:
+    try:
+        return math.pow(_number("pow", x), _number("pow", y))
+    except (OverflowError, ValueError) as e:
+        raise NativeError(f"pow: {e}") from None
+
+
+@register("min", 2)
+def _min(x: Any, y: Any) -> float:
+    return min(_number("min", x), _number("min", y))
+
+
+@register("max", 2)
+def _max(x: Any, y: Any) -> float:
+    return max(_number("max", x), _number("max", y))
+
+
+@register("len", 1)
+def _len(s: Any) -> float:
+    return float(len(_string("len", s)))
+
+
+@register("substr", 3)
+def _substr(s: Any, start: Any, end: Any) -> str:
+    """the characters from start up to end, negative indexes count from the
+    end of the string"""
+    return _string("substr", s)[_index("substr", start) : _index("substr", end)]
+
+
+@register("upper", 1)
+def _upper(s: Any) -> str:
+    return _string("upper", s).upper()
+
+
+@register("lower", 1)
+def _lower(s: Any) -> str:
+    return _string("lower", s).lower()
+
+
+@register("str", 1)
+def _str(value: Any) -> str:
+    """the text print writes for the value"""
+    return str(value)
+
+
+@register("num", 1)
+def _num(s: Any) -> Any:
+    """the number written in the string, nil if it is not one"""
+    try:
+        return float(_string("num", s))
+    except ValueError:
+        return None
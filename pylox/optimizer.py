@@ -0,0 +1,302 @@
+""" constant folding and dead branch elimination over the parsed ast """
+from typing import Any, List, Optional
+
+from expr import (
+    AssignExpr,
+    BinaryExpr,
+    CallExpr,
+    DeepExpr,
+    Expr,
+    ExprVisitor,
+    GroupExpr,
+    LiteralExpr,
+    LogicExpr,
+    UnaryExpr,
+    VarExpr,
+)
+from stmt import (
+    BlockStmt,
+    ConditionalStmt,
+    DeclStmt,
+    ExprStmt,
+    FunStmt,
+    PrintStmt,
+    ReturnStmt,
+    Stmt,
+    StmtVisitor,
+    WhileStmt,
+)
+from token_type import TokenType
+
+
+class _NodeCounter(ExprVisitor, StmtVisitor):
+    def count(self, node: Any) -> int:
+        return 0 if node is None else node.accept(self)
+
+    def visit_literal(self, expr: LiteralExpr) -> int:
+        return 1
+
+    def visit_unary(self, expr: UnaryExpr) -> int:
+        return 1 + self.count(expr.right)
+
+    def visit_binary(self, expr: BinaryExpr) -> int:
+        return 1 + self.count(expr.left) + self.count(expr.right)
+
+    def visit_group(self, expr: GroupExpr) -> int:
+        return 1 + self.count(expr.expr)
+
+    def visit_var(self, expr: VarExpr) -> int:
+        return 1
+
+    def visit_assign(self, expr: AssignExpr) -> int:
+        return 1 + self.count(expr.expr)
+
+    def visit_logic(self, expr: LogicExpr) -> int:
+        return 1 + self.count(expr.left) + self.count(expr.right)
+
+    def visit_call(self, expr: CallExpr) -> int:
+        return 1 + self.count(expr.callee) + sum(self.count(a) for a in expr.args)
+
+    def visit_deep(self, expr: DeepExpr) -> int:
+        # the groups have no step and are not counted
+        return 1 + len(expr.code)
+
+    def visit_print(self, stmt: PrintStmt) -> int:
+        return 1 + self.count(stmt.expr)
+
+    def visit_expr(self, stmt: ExprStmt) -> int:
+        return 1 + self.count(stmt.expr)
+
+    def visit_decl(self, stmt: DeclStmt) -> int:
+        return 1 + self.count(stmt.initializer)
+
+    def visit_block(self, stmt: BlockStmt) -> int:
+        return 1 + sum(self.count(s) for s in stmt.stmts)
+
+    def visit_conditional(self, stmt: ConditionalStmt) -> int:
+        return (
+            1 + self.count(stmt.cond) + self.count(stmt.truthy) + self.count(stmt.falsy)
+        )
+
+    def visit_while(self, stmt: WhileStmt) -> int:
+        return 1 + self.count(stmt.cond) + self.count(stmt.stmt)
+
+    def visit_function(self, stmt: FunStmt) -> int:
+        return 1 + sum(self.count(s) for s in stmt.body)
+
+    def visit_return(self, stmt: ReturnStmt) -> int:
+        return 1 + self.count(stmt.value)
+
+
+def count_nodes(stmts: List[Stmt]) -> int:
+    counter = _NodeCounter()
+    return sum(counter.count(stmt) for stmt in stmts)
+
+
+class Optimizer(ExprVisitor, StmtVisitor):
+    """rewrites the ast into an equivalent smaller one.
+
+    Only operations that cannot fail are folded, an operation on literals of
+    the wrong type is left alone so it still raises its runtime error. The
+    input ast is not modified, rewritten nodes are new objects sharing the
+    unchanged subtrees."""
+
+    def __init__(self) -> None:
+        self.removed = 0
+        """ number of nodes removed by the calls to optimize so far """
+
+    def optimize(self, stmts: List[Stmt]) -> List[Stmt]:
+        optimized = self._optimize_stmts(stmts)
+        self.removed += count_nodes(stmts) - count_nodes(optimized)
+        return optimized
+
+    def visit_literal(self, expr: LiteralExpr) -> Expr:
+        return expr
+
+    def visit_group(self, expr: GroupExpr) -> Expr:
+        return self._optimize_expr(expr.expr)
+
+    def visit_var(self, expr: VarExpr) -> Expr:
+        return expr
+
+    def visit_assign(self, expr: AssignExpr) -> Expr:
+        value = self._optimize_expr(expr.expr)
+        if value is expr.expr:
+            return expr
+        return AssignExpr(token=expr.token, expr=value)
+
+    def visit_unary(self, expr: UnaryExpr) -> Expr:
+        right = self._optimize_expr(expr.right)
+
+        if isinstance(right, LiteralExpr):
+            value = right.value
+            if expr.op.ttype == TokenType.BANG:
+                return LiteralExpr(value=value is None or value is False)
+            if expr.op.ttype == TokenType.MINUS and type(value) is float:
+                return LiteralExpr(value=-1 * value)
+
+        if right is expr.right:
+            return expr
+        return UnaryExpr(op=expr.op, right=right)
+
+    def visit_binary(self, expr: BinaryExpr) -> Expr:
+        left = self._optimize_expr(expr.left)
+        right = self._optimize_expr(expr.right)
+
+        if isinstance(left, LiteralExpr) and isinstance(right, LiteralExpr):
+            folded = self._fold_binary(expr.op.ttype, left.value, right.value)
+            if folded is not None:
+                return folded
+
+        if left is expr.left and right is expr.right:
+            return expr
+        return BinaryExpr(left=left, op=expr.op, right=right)
+
+    def visit_logic(self, expr: LogicExpr) -> Expr:
+        left = self._optimize_expr(expr.left)
+        right = self._optimize_expr(expr.right)
+
+        if isinstance(left, LiteralExpr):
+            # the value of the left operand decides whether it is the result
+            if expr.op.ttype == TokenType.OR:
+                return left if left.value else right
+            else:
+                return right if left.value else left
+
+        if left is expr.left and right is expr.right:
+            return expr
+        return LogicExpr(left=left, op=expr.op, right=right)
+
+    def visit_call(self, expr: CallExpr) -> Expr:
+        # calls are never folded, a native like clock has a different result
+        # every time
+        callee = self._optimize_expr(expr.callee)
+        args = [self._optimize_expr(arg) for arg in expr.args]
+        if callee is expr.callee and all(
+            new is old for new, old in zip(args, expr.args)
+        ):
+            return expr
+        return CallExpr(callee=callee, paren=expr.paren, args=args)
+
+    def visit_deep(self, expr: DeepExpr) -> Expr:
+        # folding recurses into the operands, deep expressions are left alone
+        return expr
+
+    def visit_print(self, stmt: PrintStmt) -> Optional[Stmt]:
+        value = self._optimize_expr(stmt.expr)
+        return stmt if value is stmt.expr else PrintStmt(expr=value)
+
+    def visit_expr(self, stmt: ExprStmt) -> Optional[Stmt]:
+        value = self._optimize_expr(stmt.expr)
+        return stmt if value is stmt.expr else ExprStmt(expr=value)
+
+    def visit_decl(self, stmt: DeclStmt) -> Optional[Stmt]:
+        if stmt.initializer is None:
+            return stmt
+        value = self._optimize_expr(stmt.initializer)
+        if value is stmt.initializer:
+            return stmt
+        return DeclStmt(token=stmt.token, initializer=value)
+
+    def visit_block(self, stmt: BlockStmt) -> Optional[Stmt]:
+        stmts = self._optimize_stmts(stmt.stmts)
+        if not stmts:
+            return None
+        if len(stmts) == len(stmt.stmts) and all(
+            new is old for new, old in zip(stmts, stmt.stmts)
+        ):
+            return stmt
+        return BlockStmt(stmts=stmts)
+
+    def visit_conditional(self, stmt: ConditionalStmt) -> Optional[Stmt]:
+        cond = self._optimize_expr(stmt.cond)
+
+        if isinstance(cond, LiteralExpr):
+            if cond.value:
+                return self._optimize_stmt(stmt.truthy)
+            return None if stmt.falsy is None else self._optimize_stmt(stmt.falsy)
+
+        truthy = self._optimize_body(stmt.truthy)
+        falsy = None if stmt.falsy is None else self._optimize_stmt(stmt.falsy)
+        if cond is stmt.cond and truthy is stmt.truthy and falsy is stmt.falsy:
+            return stmt
+        return ConditionalStmt(cond=cond, truthy=truthy, falsy=falsy)
+
+    def visit_while(self, stmt: WhileStmt) -> Optional[Stmt]:
+        cond = self._optimize_expr(stmt.cond)
+
+        if isinstance(cond, LiteralExpr) and not cond.value:
+            return None
+
+        body = self._optimize_body(stmt.stmt)
+        if cond is stmt.cond and body is stmt.stmt:
+            return stmt
+        return WhileStmt(cond=cond, stmt=body)
+
+    def visit_function(self, stmt: FunStmt) -> Optional[Stmt]:
+        body = self._optimize_stmts(stmt.body)
+        if len(body) == len(stmt.body) and all(
+            new is old for new, old in zip(body, stmt.body)
+        ):
+            return stmt
+        return FunStmt(token=stmt.token, params=stmt.params, body=body)
+
+    def visit_return(self, stmt: ReturnStmt) -> Optional[Stmt]:
+        if stmt.value is None:
+            return stmt
+        value = self._optimize_expr(stmt.value)
+        if value is stmt.value:
+            return stmt
+        return ReturnStmt(token=stmt.token, value=value)
+
+    def _optimize_expr(self, expr: Expr) -> Expr:
+        return expr.accept(self)
+
+    def _optimize_stmt(self, stmt: Stmt) -> Optional[Stmt]:
+        """the optimized statement, None if it has no effect"""
+        return stmt.accept(self)
+
+    def _optimize_body(self, stmt: Stmt) -> Stmt:
+        """optimize a statement that is required by its parent"""
+        return self._optimize_stmt(stmt) or BlockStmt(stmts=[])
+
+    def _optimize_stmts(self, stmts: List[Stmt]) -> List[Stmt]:
+        optimized = []
+        for stmt in stmts:
+            new_stmt = self._optimize_stmt(stmt)
+            if new_stmt is not None:
+                optimized.append(new_stmt)
+        return optimized
+
+    @staticmethod
+    def _fold_binary(op_type: TokenType, left: Any, right: Any) -> Optional[Expr]:
+        if op_type == TokenType.EQUAL_EQUAL:
+            return LiteralExpr(value=left == right)
+        if op_type == TokenType.BANG_EQUAL:
+            return LiteralExpr(value=left != right)
+
+        if type(left) is str and type(right) is str:
+            if op_type == TokenType.PLUS:
+                return LiteralExpr(value=left + right)
+            return None
+
+        if type(left) is not float or type(right) is not float:
+            return None
+
+        if op_type == TokenType.PLUS:
+            return LiteralExpr(value=left + right)
+        elif op_type == TokenType.MINUS:
+            return LiteralExpr(value=left - right)
+        elif op_type == TokenType.STAR:
+            return LiteralExpr(value=left * right)
+        elif op_type == TokenType.SLASH and right != 0:
+            return LiteralExpr(value=left / right)
+        elif op_type == TokenType.GREATER:
+            return LiteralExpr(value=left > right)
+        elif op_type == TokenType.GREATER_EQUAL:
+            return LiteralExpr(value=left >= right)
+        elif op_type == TokenType.LESS:
+            return LiteralExpr(value=left < right)
+        elif op_type == TokenType.LESS_EQUAL:
+            return LiteralExpr(value=left <= right)
+        return None
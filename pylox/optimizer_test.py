@@ -0,0 +1,75 @@
+import unittest
+from parser import Parser
+from typing import List
+
+from expr import BinaryExpr, LiteralExpr, VarExpr
+from optimizer import Optimizer, count_nodes
+from scanner import Scanner
+from stmt import BlockStmt, ConditionalStmt, ExprStmt, PrintStmt, Stmt, WhileStmt
+
+
+class OptimizerTest(unittest.TestCase):
+    def test_fold_constant_expr(self) -> None:
+        expectation = [
+            ("(1+2)*3", 9.0),
+            ("-(4/2)", -2.0),
+            ('"a"+"b"', "ab"),
+            ("!nil", True),
+            ("1 < 2 == true", True),
+            ("nil or 2", 2.0),
+            ("false and 1", False),
+        ]
+        for text, value in expectation:
+            with self.subTest(msg=f"test folding {text}"):
+                stmts = self._optimize(f"print {text};")
+                self.assertEqual(stmts, [PrintStmt(expr=LiteralExpr(value=value))])
+
+    def test_keep_runtime_errors(self) -> None:
+        for text in ['1 - "a"', '-"a"', "1 / 0", '"a" < "b"']:
+            with self.subTest(msg=f"test not folding {text}"):
+                stmts = self._optimize(f"print {text};")
+                self.assertEqual(stmts, self._parse(f"print {text};"))
+
+    def test_partial_folding(self) -> None:
+        stmts = self._optimize("print a + (2 * 3);")
+        self.assertIsInstance(stmts[0], PrintStmt)
+        expr = stmts[0].expr  # type: ignore
+        self.assertIsInstance(expr, BinaryExpr)
+        self.assertIsInstance(expr.left, VarExpr)
+        self.assertEqual(expr.right, LiteralExpr(value=6.0))
+
+    def test_dead_branches(self) -> None:
+        self.assertEqual(self._optimize("if (1 > 2) print 1;"), [])
+        self.assertEqual(self._optimize("while (false) print 1;"), [])
+        self.assertEqual(
+            self._optimize("if (nil) print 1; else print 2;"),
+            [PrintStmt(expr=LiteralExpr(value=2.0))],
+        )
+        self.assertEqual(self._optimize("{ if (false) print 1; }"), [])
+
+        stmts = self._optimize("if (a) if (false) print 1;")
+        self.assertIsInstance(stmts[0], ConditionalStmt)
+        self.assertEqual(stmts[0].truthy, BlockStmt(stmts=[]))  # type: ignore
+
+    def test_for_without_condition(self) -> None:
+        stmts = self._optimize("for (;;) a = a + 1;")
+        self.assertIsInstance(stmts[0], WhileStmt)
+        self.assertEqual(stmts[0].cond, LiteralExpr(value=True))  # type: ignore
+        self.assertIsInstance(stmts[0].stmt, ExprStmt)  # type: ignore
+
+    def test_report_removed_nodes(self) -> None:
+        stmts = self._parse("print (1+2)*3; if (false) print 1;")
+        before = count_nodes(stmts)
+
+        optimizer = Optimizer()
+        optimized = optimizer.optimize(stmts)
+        self.assertEqual(optimizer.removed, before - count_nodes(optimized))
+        self.assertEqual(optimizer.removed, 9)
+        # the input is left untouched
+        self.assertEqual(count_nodes(stmts), before)
+
+    def _parse(self, source: str) -> List[Stmt]:
+        return Parser(Scanner(source).scan_tokens()).parse()
+
+    def _optimize(self, source: str) -> List[Stmt]:
+        return Optimizer().optimize(self._parse(source))
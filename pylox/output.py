@@ -0,0 +1,68 @@
+""" sinks receiving what the print statements of a lox program write """
+import abc
+import sys
+import time
+from typing import List, Optional, TextIO
+
+
+class Output(abc.ABC):
+    @abc.abstractmethod
+    def write(self, text: str) -> None:
+        pass
+
+    def flush(self) -> None:
+        """called by the engines when a run ends, successful or not"""
+
+
+class BufferedOutput(Output):
+    """collects the writes and passes them to the stream in one write once
+    size characters are buffered or interval seconds passed since the last
+    flush. Without a stream the current sys.stdout is used at every flush,
+    so redirecting stdout keeps working."""
+
+    def __init__(
+        self,
+        stream: Optional[TextIO] = None,
+        size: int = 64 * 1024,
+        interval: float = 0.1,
+    ) -> None:
+        self._stream = stream
+        self._size = size
+        self._interval = interval
+        self._chunks: List[str] = []
+        self._buffered = 0
+        self._flushed_at = time.monotonic()
+
+    def write(self, text: str) -> None:
+        self._chunks.append(text)
+        self._buffered += len(text)
+        if (
+            self._buffered >= self._size
+            or time.monotonic() - self._flushed_at >= self._interval
+        ):
+            self.flush()
+
+    def flush(self) -> None:
+        if self._chunks:
+            stream = self._stream or sys.stdout
+            stream.write("".join(self._chunks))
+            stream.flush()
+            self._chunks.clear()
+            self._buffered = 0
+        self._flushed_at = time.monotonic()
+
+
+class CaptureOutput(Output):
+    """keeps everything written in memory, for tests and embedding"""
+
+    def __init__(self) -> None:
+        self._chunks: List[str] = []
+
+    def write(self, text: str) -> None:
+        self._chunks.append(text)
+
+    def getvalue(self) -> str:
+        return "".join(self._chunks)
+
+    def clear(self) -> None:
+        self._chunks.clear()
@@ -0,0 +1,37 @@
+import contextlib
+import io
+import time
+import unittest
+
+from output import BufferedOutput
+
+
+class BufferedOutputTest(unittest.TestCase):
+    def test_flush_when_full(self) -> None:
+        stream = io.StringIO()
+        output = BufferedOutput(stream, size=8, interval=60)
+        output.write("1234")
+        output.write("567")
+        self.assertEqual(stream.getvalue(), "")
+        output.write("89")
+        self.assertEqual(stream.getvalue(), "123456789")
+        output.write("0")
+        output.flush()
+        self.assertEqual(stream.getvalue(), "1234567890")
+
+    def test_flush_after_interval(self) -> None:
+        stream = io.StringIO()
+        output = BufferedOutput(stream, interval=0.01)
+        output.write("a")
+        self.assertEqual(stream.getvalue(), "")
+        time.sleep(0.02)
+        output.write("b")
+        self.assertEqual(stream.getvalue(), "ab")
+
+    def test_current_stdout(self) -> None:
+        output = BufferedOutput()
+        output.write("before")
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            output.flush()
+        self.assertEqual(out.getvalue(), "before")
@@ -1,9 +1,11 @@
-from typing import List
+from typing import Iterable, Iterator, List, Optional, Tuple, cast
 
-from error import report
+from error import LoxParseError, report
 from expr import (
     AssignExpr,
     BinaryExpr,
+    CallExpr,
+    DeepExpr,
     Expr,
     GroupExpr,
     LiteralExpr,
@@ -17,7 +19,9 @@ from stmt import (
     ConditionalStmt,
     DeclStmt,
     ExprStmt,
+    FunStmt,
     PrintStmt,
+    ReturnStmt,
     Stmt,
     WhileStmt,
 )
@@ -28,22 +32,115 @@ class ParserError(Exception):
     pass
 
 
+_STATEMENT_STARTS = {
+    TokenType.CLASS,
+    TokenType.FUN,
+    TokenType.VAR,
+    TokenType.FOR,
+    TokenType.IF,
+    TokenType.WHILE,
+    TokenType.PRINT,
+    TokenType.RETURN,
+}
+""" tokens at which the parser resumes after a syntax error """
+
+
+_ASSIGN_PRECEDENCE = 0
+_BINARY_PRECEDENCE = {
+    TokenType.OR: 1,
+    TokenType.AND: 2,
+    TokenType.BANG_EQUAL: 3,
+    TokenType.EQUAL_EQUAL: 3,
+    TokenType.GREATER: 4,
+    TokenType.GREATER_EQUAL: 4,
+    TokenType.LESS: 4,
+    TokenType.LESS_EQUAL: 4,
+    TokenType.PLUS: 5,
+    TokenType.MINUS: 5,
+    TokenType.STAR: 6,
+    TokenType.SLASH: 6,
+}
+_UNARY_PRECEDENCE = 7
+_GROUP = -1
+_CALL = -2
+""" the precedence of the parentheses, lower than any operator so that they
+are only reduced by their closing parenthesis """
+
+_PendingOp = Tuple[int, Token, Optional[List[Tuple[Expr, int]]]]
+""" (precedence, token, arguments parsed so far of a call) of an operator
+waiting for its right operand """
+
+_KEYWORD_LITERALS = {TokenType.FALSE: False, TokenType.TRUE: True, TokenType.NIL: None}
+
+DEEP_EXPR_DEPTH = 64
+""" expressions nested deeper than this are wrapped in a DeepExpr """
+
+
 class Parser:
-    def __init__(self, tokens: List[Token]) -> None:
-        self._tokens = tokens
-        self._current = 0
+    def __init__(self, tokens: Iterable[Token]) -> None:
+        # only the current and the previous token are kept, so tokens can be a
+        # lazy stream ending with EOF
+        self._tokens = iter(tokens)
+        self._previous_token: Optional[Token] = None
+        self._current_token = next(self._tokens)
+        self._function_depth = 0
+        """ number of function bodies being parsed """
+        self._block_depth = 0
+        """ number of blocks being parsed """
+        self.errors: List[LoxParseError] = []
+        """ the syntax errors found so far, every one is also reported """
 
     def parse(self) -> List[Stmt]:
+        """parse the whole program. After a syntax error the parser skips to
+        the next statement and carries on, so one pass finds all the errors.
+        The statements with an error are left out, check errors before
+        running the others."""
+        stmts = []
+        while not self._eof():
+            stmt = self._recovering_statement()
+            if stmt is not None:
+                stmts.append(stmt)
+        return stmts
+
+    def statements(self) -> Iterator[Stmt]:
+        """parse the statements one at a time, stops at the first parse error"""
         try:
-            return self._program()
+            while not self._eof():
+                stmt = self._statement()
+                if self.errors:
+                    # the statement has an error which was not raised
+                    return
+                yield stmt
         except ParserError:
-            return []
+            return
 
-    def _program(self) -> List[Stmt]:
-        stmts = []
+    def _recovering_statement(self) -> Optional[Stmt]:
+        """the next statement, None if it has a syntax error"""
+        errors = len(self.errors)
+        try:
+            stmt = self._statement()
+        except ParserError:
+            self._synchronize()
+            return None
+        # errors which leave the parser in sync are reported without raising
+        return stmt if len(self.errors) == errors else None
+
+    def _synchronize(self) -> None:
+        """skip the tokens up to the start of the next statement, or up to the
+        end of the enclosing block"""
+        in_block = self._block_depth > 0
+        if self._eof() or in_block and self._peek().ttype == TokenType.RIGHT_BRACE:
+            return
+        self._advance()
         while not self._eof():
-            stmts.append(self._statement())
-        return stmts
+            if self._previous().ttype == TokenType.SEMICOLON:
+                return
+            ttype = self._peek().ttype
+            if ttype in _STATEMENT_STARTS or (
+                in_block and ttype == TokenType.RIGHT_BRACE
+            ):
+                return
+            self._advance()
 
     def _statement(self) -> Stmt:
         if self._match(TokenType.VAR):
@@ -58,6 +155,10 @@ class Parser:
             return self._while_stmt()
         elif self._match(TokenType.FOR):
             return self._for_stmt()
+        elif self._match(TokenType.FUN):
+            return self._function()
+        elif self._match(TokenType.RETURN):
+            return self._return_stmt()
         else:
             return self._expr_stmt()
 
@@ -65,7 +166,7 @@ class Parser:
         self._expect(TokenType.LEFT_PAREN, "Expect (")
         expr = self._expression()
         self._expect(TokenType.RIGHT_PAREN, "Expect )")
-        stmt = self._statement()
+        stmt = self._body()
         return WhileStmt(cond=expr, stmt=stmt)
 
     def _for_stmt(self) -> Stmt:
@@ -78,14 +179,16 @@ class Parser:
         else:
             initializer = self._expr_stmt()
 
-        condition = None if self._peek() == TokenType.SEMICOLON else self._expression()
+        condition = (
+            None if self._peek().ttype == TokenType.SEMICOLON else self._expression()
+        )
         self._expect(TokenType.SEMICOLON, "Expect ;")
         increment = (
-            None if self._peek() == TokenType.RIGHT_PAREN else self._expression()
+            None if self._peek().ttype == TokenType.RIGHT_PAREN else self._expression()
         )
         self._expect(TokenType.RIGHT_PAREN, "Expect )")
 
-        body = self._statement()
+        body = self._body()
 
         if increment:
             body = BlockStmt(stmts=[body, ExprStmt(expr=increment)])
@@ -101,19 +204,68 @@ class Parser:
         expr = self._expression()
         self._expect(TokenType.RIGHT_PAREN, "Expect )")
 
-        truthy = self._statement()
-        falsy = self._statement() if self._match(TokenType.ELSE) else None
+        truthy = self._body()
+        falsy = self._body() if self._match(TokenType.ELSE) else None
 
         return ConditionalStmt(cond=expr, truthy=truthy, falsy=falsy)
 
+    def _body(self) -> Stmt:
+        """the statement run by an if, an else or a loop. A declaration there
+        would declare its variable in the enclosing block only when it runs,
+        so it needs a block of its own"""
+        if self._peek().ttype in (TokenType.VAR, TokenType.FUN):
+            self._error("Expect statement, a declaration needs a block")
+        return self._statement()
+
     def _block_stmt(self) -> Stmt:
         stmts = []
-        while not self._eof() and self._peek().ttype != TokenType.RIGHT_BRACE:
-            stmts.append(self._statement())
+        self._block_depth += 1
+        try:
+            while not self._eof() and self._peek().ttype != TokenType.RIGHT_BRACE:
+                stmt = self._recovering_statement()
+                if stmt is not None:
+                    stmts.append(stmt)
+        finally:
+            self._block_depth -= 1
 
         self._expect(TokenType.RIGHT_BRACE, "Expect } at the end of a block")
         return BlockStmt(stmts=stmts)
 
+    def _function(self) -> Stmt:
+        token = self._expect(TokenType.IDENTIFIER, "Expect function name")
+        self._expect(TokenType.LEFT_PAREN, "Expect ( after function name")
+        params: List[Token] = []
+        if self._peek().ttype != TokenType.RIGHT_PAREN:
+            params.append(self._parameter(params))
+            while self._match(TokenType.COMMA):
+                params.append(self._parameter(params))
+        self._expect(TokenType.RIGHT_PAREN, "Expect ) after parameters")
+        self._expect(TokenType.LEFT_BRACE, "Expect { before function body")
+
+        self._function_depth += 1
+        try:
+            body = cast(BlockStmt, self._block_stmt()).stmts
+        finally:
+            self._function_depth -= 1
+        return FunStmt(token=token, params=params, body=body)
+
+    def _parameter(self, params: List[Token]) -> Token:
+        # the arguments of a call are stored in the slots of their parameters
+        if any(param.lexeme == self._peek().lexeme for param in params):
+            self._error("Duplicate parameter name")
+        return self._expect(TokenType.IDENTIFIER, "Expect parameter name")
+
+    def _return_stmt(self) -> Stmt:
+        token = self._previous()
+        if not self._function_depth:
+            self._error("Can't return from top-level code", token)
+
+        value = None
+        if self._peek().ttype != TokenType.SEMICOLON:
+            value = self._expression()
+        self._expect(TokenType.SEMICOLON, "Expect ; after return value")
+        return ReturnStmt(token=token, value=value)
+
     def _declaration(self) -> Stmt:
         token = self._expect(TokenType.IDENTIFIER, "expect identifier")
         expr = None
@@ -134,122 +286,159 @@ class Parser:
         return ExprStmt(expr=expr)
 
     def _expression(self) -> Expr:
-        return self._assignment()
-
-    def _assignment(self) -> Expr:
-        expr = self._or()
-
-        if self._match(TokenType.EQUAL):
-            rvalue = self._assignment()
-
-            if isinstance(expr, VarExpr):
-                return AssignExpr(token=expr.token, expr=rvalue)
-
-            self._error("Expect var expression")
-
-        return expr
-
-    def _or(self) -> Expr:
-        expr = self._and()
-
-        while self._match(TokenType.OR):
-            op = self._previous()
-            right = self._and()
-            expr = LogicExpr(left=expr, op=op, right=right)
-
-        return expr
-
-    def _and(self) -> Expr:
-        expr = self._equility()
-
-        while self._match(TokenType.AND):
-            op = self._previous()
-            right = self._equility()
-            expr = LogicExpr(left=expr, op=op, right=right)
-
-        return expr
-
-    def _equility(self) -> Expr:
-        expr = self._comparision()
-
-        while self._match(TokenType.BANG_EQUAL, TokenType.EQUAL_EQUAL):
-            op = self._previous()
-            right = self._comparision()
-            expr = BinaryExpr(left=expr, op=op, right=right)
-
-        return expr
-
-    def _comparision(self) -> Expr:
-        expr = self._term()
-
-        while self._match(
-            TokenType.GREATER,
-            TokenType.GREATER_EQUAL,
-            TokenType.LESS,
-            TokenType.LESS_EQUAL,
-        ):
-            op = self._previous()
-            right = self._term()
-            expr = BinaryExpr(left=expr, op=op, right=right)
-
-        return expr
-
-    def _term(self) -> Expr:
-        expr = self._factor()
-
-        while self._match(TokenType.PLUS, TokenType.MINUS):
-            op = self._previous()
-            right = self._factor()
-            expr = BinaryExpr(left=expr, op=op, right=right)
-        return expr
-
-    def _factor(self) -> Expr:
-        expr = self._unary()
-
-        while self._match(TokenType.STAR, TokenType.SLASH):
-            op = self._previous()
-            right = self._unary()
-            expr = BinaryExpr(left=expr, op=op, right=right)
-
-        return expr
-
-    def _unary(self) -> Expr:
-        if self._match(TokenType.BANG, TokenType.MINUS):
-            op = self._previous()
-            right = self._unary()
-            return UnaryExpr(op=op, right=right)
-
-        return self._primary()
+        """precedence climbing over explicit stacks of operands and pending
+        operators, instead of a recursive call per precedence level and per
+        parenthesis, so the python stack does not grow with the expression"""
+        operands: List[Expr] = []
+        depths: List[int] = []
+        """ height of the tree of every operand """
+        ops: List[_PendingOp] = []
+
+        while True:
+            # prefix operators and opening parentheses, then an operand
+            token = self._peek()
+            if token.ttype == TokenType.BANG or token.ttype == TokenType.MINUS:
+                self._advance()
+                ops.append((_UNARY_PRECEDENCE, token, None))
+                continue
+            if token.ttype == TokenType.LEFT_PAREN:
+                self._advance()
+                ops.append((_GROUP, token, None))
+                continue
+            operands.append(self._primary())
+            depths.append(1)
+
+            # calls and closing parentheses, up to the next infix operator
+            while True:
+                token = self._peek()
+                ttype = token.ttype
+                if ttype == TokenType.LEFT_PAREN:
+                    self._advance()
+                    if not self._match(TokenType.RIGHT_PAREN):
+                        ops.append((_CALL, token, []))
+                        break
+                    callee = operands.pop()
+                    operands.append(
+                        CallExpr(callee=callee, paren=self._previous(), args=[])
+                    )
+                    depths[-1] += 1
+                elif ttype == TokenType.RIGHT_PAREN or ttype == TokenType.COMMA:
+                    self._reduce(operands, depths, ops, 0)
+                    if not ops or (ttype == TokenType.COMMA and ops[-1][0] != _CALL):
+                        # e.g. the parenthesis closing the condition of an if
+                        return self._end_expression(operands, depths, ops)
+                    self._advance()
+                    if ttype == TokenType.COMMA:
+                        args = ops[-1][2]
+                        assert args is not None
+                        args.append((operands.pop(), depths.pop()))
+                        break
+                    self._close(operands, depths, ops.pop())
+                elif ttype in _BINARY_PRECEDENCE:
+                    precedence = _BINARY_PRECEDENCE[ttype]
+                    # left associative, the pending operators of the same
+                    # precedence apply first
+                    self._reduce(operands, depths, ops, precedence)
+                    self._advance()
+                    ops.append((precedence, token, None))
+                    break
+                elif ttype == TokenType.EQUAL:
+                    # right associative, a = b = c assigns b = c first
+                    self._reduce(operands, depths, ops, _ASSIGN_PRECEDENCE + 1)
+                    self._advance()
+                    if not isinstance(operands[-1], VarExpr):
+                        self._error("Expect var expression", token)
+                    ops.append((_ASSIGN_PRECEDENCE, token, None))
+                    break
+                else:
+                    return self._end_expression(operands, depths, ops)
+
+    def _end_expression(
+        self, operands: List[Expr], depths: List[int], ops: List[_PendingOp]
+    ) -> Expr:
+        self._reduce(operands, depths, ops, 0)
+        if ops:
+            if ops[-1][0] == _GROUP:
+                raise self._error("Expect ')' after expression.")
+            raise self._error("Expect ')' after arguments.")
+        if depths[-1] > DEEP_EXPR_DEPTH:
+            return DeepExpr(expr=operands[-1])
+        return operands[-1]
+
+    @staticmethod
+    def _reduce(
+        operands: List[Expr],
+        depths: List[int],
+        ops: List[_PendingOp],
+        precedence: int,
+    ) -> None:
+        """apply the pending operators binding at least as tight as precedence,
+        parentheses are never reduced"""
+        while ops and ops[-1][0] >= precedence:
+            op_precedence, op, _ = ops.pop()
+            right = operands.pop()
+            depth = depths.pop()
+            if op_precedence == _UNARY_PRECEDENCE:
+                operands.append(UnaryExpr(op=op, right=right))
+                depths.append(depth + 1)
+                continue
+
+            left = operands.pop()
+            depth = max(depth, depths.pop())
+            if op_precedence == _ASSIGN_PRECEDENCE:
+                if not isinstance(left, VarExpr):
+                    # reported when the = was parsed, the assignment is dropped
+                    operands.append(left)
+                    depths.append(depth)
+                    continue
+                expr: Expr = AssignExpr(token=left.token, expr=right)
+            elif op.ttype == TokenType.OR or op.ttype == TokenType.AND:
+                expr = LogicExpr(left=left, op=op, right=right)
+            else:
+                expr = BinaryExpr(left=left, op=op, right=right)
+            operands.append(expr)
+            depths.append(depth + 1)
+
+    def _close(self, operands: List[Expr], depths: List[int], op: _PendingOp) -> None:
+        """replace the operands inside the parentheses just closed"""
+        kind, _, args = op
+        if kind == _GROUP:
+            operands[-1] = GroupExpr(expr=operands[-1])
+            depths[-1] += 1
+            return
+
+        assert args is not None
+        args.append((operands.pop(), depths.pop()))
+        depth = max(depth for _, depth in args)
+        operands[-1] = CallExpr(
+            callee=operands[-1], paren=self._previous(), args=[arg for arg, _ in args]
+        )
+        depths[-1] = max(depths[-1], depth) + 1
 
     def _primary(self) -> Expr:
-        if self._match(TokenType.FALSE):
-            return LiteralExpr(value=False)
-
-        if self._match(TokenType.TRUE):
-            return LiteralExpr(value=True)
-
-        if self._match(TokenType.NIL):
-            return LiteralExpr(value=None)
-
-        if self._match(TokenType.IDENTIFIER):
-            return VarExpr(token=self._previous())
-
-        if self._match(TokenType.NUMBER, TokenType.STRING):
-            return LiteralExpr(value=self._previous().literal)
-
-        if self._match(TokenType.LEFT_PAREN):
-            expr = self._expression()
-            self._expect(TokenType.RIGHT_PAREN, "Expect ')' after expression.")
-            return GroupExpr(expr=expr)
+        token = self._peek()
+        ttype = token.ttype
+        if ttype == TokenType.IDENTIFIER:
+            self._advance()
+            return VarExpr(token=token)
+        if ttype == TokenType.NUMBER or ttype == TokenType.STRING:
+            self._advance()
+            return LiteralExpr(value=token.literal)
+        if ttype in _KEYWORD_LITERALS:
+            self._advance()
+            return LiteralExpr(value=_KEYWORD_LITERALS[ttype])
 
         raise self._error("Expect Expression")
 
-    def _error(self, msg: str) -> ParserError:
-        token = self._peek()
+    def _error(self, msg: str, token: Optional[Token] = None) -> ParserError:
+        """report the error at the token, by default the next one"""
+        token = token or self._peek()
         if token.ttype == TokenType.EOF:
-            report(token.line, " at end", msg)
+            where = " at end"
         else:
-            report(token.line, f" at '{token.lexeme}'", msg)
+            where = f" at '{token.lexeme}'"
+        self.errors.append(LoxParseError(line=token.line, where=where, msg=msg))
+        report(token.line, where, msg)
         return ParserError()
 
     def _expect(self, token_type: TokenType, msg: str) -> Token:
@@ -258,15 +447,16 @@ class Parser:
         return self._previous()
 
     def _previous(self) -> Token:
-        return self._tokens[self._current - 1]
+        return self._previous_token  # type: ignore
 
     def _advance(self) -> Token:
-        cur = self._tokens[self._current]
-        self._current += 1
+        cur = self._current_token
+        self._previous_token = cur
+        self._current_token = next(self._tokens)
         return cur
 
     def _peek(self) -> Token:
-        return self._tokens[self._current]
+        return self._current_token
 
     def _match(self, *token_types: TokenType) -> bool:
         if self._eof():
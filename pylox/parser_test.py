@@ -1,9 +1,22 @@
+import contextlib
+import io
 import unittest
 from parser import Parser
 
-from expr import BinaryExpr, GroupExpr, LiteralExpr, UnaryExpr
+from error import LoxParseError
+from expr import (
+    AssignExpr,
+    BinaryExpr,
+    CallExpr,
+    DeepExpr,
+    GroupExpr,
+    LiteralExpr,
+    UnaryExpr,
+    VarExpr,
+)
 from lox_token import Token
-from scanner import Scanner
+from scanner import Scanner, StreamScanner
+from stmt import FunStmt, ReturnStmt
 from token_type import TokenType
 
 
@@ -174,6 +187,33 @@ class ParserTest(unittest.TestCase):
         ]
         self._test_expected(expectation)
 
+    def test_call_expr(self) -> None:
+        paren = Token(ttype=TokenType.RIGHT_PAREN, lexeme=")")
+        expectation = [
+            (
+                "f(1, g())(2)",
+                CallExpr(
+                    callee=CallExpr(
+                        callee=VarExpr(Token(ttype=TokenType.IDENTIFIER, lexeme="f")),
+                        paren=paren,
+                        args=[
+                            LiteralExpr(value=1),
+                            CallExpr(
+                                callee=VarExpr(
+                                    Token(ttype=TokenType.IDENTIFIER, lexeme="g")
+                                ),
+                                paren=paren,
+                                args=[],
+                            ),
+                        ],
+                    ),
+                    paren=paren,
+                    args=[LiteralExpr(value=2)],
+                ),
+            ),
+        ]
+        self._test_expected(expectation)
+
     def test_expr_precedence(self) -> None:
         expectation = [
             (
@@ -221,6 +261,158 @@ class ParserTest(unittest.TestCase):
         ]
         self._test_expected(expectation)
 
+    def test_assignment_is_right_associative(self) -> None:
+        ident = TokenType.IDENTIFIER
+        a, b = Token(ttype=ident, lexeme="a"), Token(ttype=ident, lexeme="b")
+        expectation = [
+            (
+                "a = b = -1",
+                AssignExpr(
+                    token=a,
+                    expr=AssignExpr(
+                        token=b,
+                        expr=UnaryExpr(
+                            Token(ttype=TokenType.MINUS, lexeme="-"),
+                            LiteralExpr(value=1),
+                        ),
+                    ),
+                ),
+            ),
+        ]
+        self._test_expected(expectation)
+
+    def test_expression_errors(self) -> None:
+        for source, msg in [
+            ("(1 + 2;", "Error at ';': Expect ')' after expression."),
+            ("f(1, (2);", "Error at ';': Expect ')' after arguments."),
+            ("(1, 2);", "Error at ',': Expect ')' after expression."),
+            ("1 + 2 = 3;", "Error at '=': Expect var expression"),
+            ("1 + ;", "Error at ';': Expect Expression"),
+        ]:
+            with self.subTest(msg=source):
+                parser = Parser(Scanner(source).scan_tokens())
+                with contextlib.redirect_stdout(io.StringIO()) as out:
+                    self.assertEqual(parser.parse(), [])
+                self.assertEqual(out.getvalue(), f"[line 1] {msg}\n")
+
+    def test_deep_expressions(self) -> None:
+        # far deeper than the python recursion limit
+        for source in [
+            "1" + " + 1" * 5000,
+            "(" * 5000 + "1" + ")" * 5000,
+            "-" * 5000 + "1",
+            "f(" * 5000 + ")" * 5000,
+        ]:
+            with self.subTest(msg=source[:10]):
+                expr = Parser(Scanner(source).scan_tokens())._expression()
+                self.assertIsInstance(expr, DeepExpr)
+
+        expr = Parser(Scanner("1" + " + 1" * 10).scan_tokens())._expression()
+        self.assertIsInstance(expr, BinaryExpr)
+
+    def test_statements_from_stream(self) -> None:
+        source = "var a = 1; { print a; } a = a + 1;"
+        tokens = StreamScanner([source[i : i + 4] for i in range(0, len(source), 4)])
+        self.assertEqual(
+            list(Parser(tokens.scan_stream()).statements()),
+            Parser(Scanner(source).scan_tokens()).parse(),
+        )
+
+    def test_statements_stop_at_error(self) -> None:
+        parser = Parser(Scanner("print 1; print ; print 2;").scan_tokens())
+        with contextlib.redirect_stdout(io.StringIO()) as out:
+            self.assertEqual(len(list(parser.statements())), 1)
+        self.assertEqual(out.getvalue(), "[line 1] Error at ';': Expect Expression\n")
+
+    def test_parse_recovers_from_errors(self) -> None:
+        source = """print 1;
+print ;
+{ var a = 1; print a }
+if (true) print 2; else print 3;
+print (4;
+"""
+        parser = Parser(Scanner(source).scan_tokens())
+        with contextlib.redirect_stdout(io.StringIO()) as out:
+            stmts = parser.parse()
+        # the statements with an error are left out, the others are kept
+        self.assertEqual(len(stmts), 2)
+        self.assertEqual(
+            parser.errors,
+            [
+                LoxParseError(2, " at ';'", "Expect Expression"),
+                LoxParseError(3, " at '}'", "Expect ; at the end of print statment"),
+                LoxParseError(5, " at ';'", "Expect ')' after expression."),
+            ],
+        )
+        self.assertEqual(out.getvalue(), "".join(f"{e}\n" for e in parser.errors))
+
+    def test_errors_at_end(self) -> None:
+        for source in ["print 1", "{ print 1;", "f(1,", "var"]:
+            with self.subTest(msg=f"test parsing {source!r}"):
+                parser = Parser(Scanner(source).scan_tokens())
+                with contextlib.redirect_stdout(io.StringIO()):
+                    self.assertListEqual(parser.parse(), [])
+                self.assertEqual(parser.errors[0].where, " at end")
+
+    def test_declaration_as_body(self) -> None:
+        source = """{ if (false) var a = 1; print a; }
+while (false) fun f() {}
+if (true) print 1; else var b;
+for (;;) { var c; }
+"""
+        parser = Parser(Scanner(source).scan_tokens())
+        with contextlib.redirect_stdout(io.StringIO()):
+            stmts = parser.parse()
+        # the same error for every engine, instead of a variable declared or
+        # not depending on the branch taken
+        self.assertEqual(len(stmts), 1)
+        message = "Expect statement, a declaration needs a block"
+        self.assertEqual(
+            parser.errors,
+            [
+                LoxParseError(1, " at 'var'", message),
+                LoxParseError(2, " at 'fun'", message),
+                LoxParseError(3, " at 'var'", message),
+            ],
+        )
+
+    def test_statements_stop_at_recovered_error(self) -> None:
+        parser = Parser(Scanner("print 1; { print 2 } print 3;").scan_tokens())
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertEqual(len(list(parser.statements())), 1)
+        self.assertEqual(len(parser.errors), 1)
+
+    def test_function_declaration(self) -> None:
+        source = "fun f(a, b) { return a; return; }"
+        stmts = Parser(Scanner(source).scan_tokens()).parse()
+        ident = TokenType.IDENTIFIER
+        a = Token(ttype=ident, lexeme="a")
+        ret = Token(ttype=TokenType.RETURN, lexeme="return")
+        self.assertEqual(
+            stmts,
+            [
+                FunStmt(
+                    token=Token(ttype=ident, lexeme="f"),
+                    params=[a, Token(ttype=ident, lexeme="b")],
+                    body=[
+                        ReturnStmt(token=ret, value=VarExpr(a)),
+                        ReturnStmt(token=ret),
+                    ],
+                )
+            ],
+        )
+
+    def test_function_errors(self) -> None:
+        for source, msg in [
+            ("return 1;", "Error at 'return': Can't return from top-level code"),
+            ("fun f(a, a) {}", "Error at 'a': Duplicate parameter name"),
+        ]:
+            with self.subTest(msg=source):
+                parser = Parser(Scanner(source).scan_tokens())
+                with contextlib.redirect_stdout(io.StringIO()) as out:
+                    self.assertEqual(parser.parse(), [])
+                self.assertEqual(out.getvalue(), f"[line 1] {msg}\n")
+
     def _test_expected(self, expectation) -> None:
         for text, expected in expectation:
             with self.subTest(msg=f"test parsing {text}"):
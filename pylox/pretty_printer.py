@@ -1,6 +1,17 @@
+from typing import List, Tuple
+
 from expr import (
+    AND_STEP,
+    ASSIGN_STEP,
+    BINARY_STEP,
+    CALL_STEP,
+    LEAF_STEP,
+    OR_STEP,
+    UNARY_STEP,
     AssignExpr,
     BinaryExpr,
+    CallExpr,
+    DeepExpr,
     Expr,
     ExprVisitor,
     GroupExpr,
@@ -33,6 +44,41 @@ class _PPrinter(ExprVisitor):
     def visit_logic(self, expr: LogicExpr) -> str:
         return self._parenthesize(expr.op.lexeme, expr.left, expr.right)
 
+    def visit_call(self, expr: CallExpr) -> str:
+        return self._parenthesize("call", expr.callee, *expr.args)
+
+    def visit_deep(self, expr: DeepExpr) -> str:
+        """the same text as the recursive methods but without the groups,
+        built over the steps of the expression"""
+        texts: List[str] = []
+        # (end of the right operand, operator) of the logic operators
+        pending: List[Tuple[int, str]] = []
+        for ip, (kind, node, operand) in enumerate(expr.code):
+            while pending and pending[-1][0] == ip:
+                self._join(texts, pending.pop()[1], 2)
+            if kind == LEAF_STEP:
+                texts.append(node.accept(self))
+            elif kind == UNARY_STEP:
+                self._join(texts, node.op.lexeme, 1)  # type: ignore
+            elif kind == BINARY_STEP:
+                self._join(texts, node.op.lexeme, 2)  # type: ignore
+            elif kind == AND_STEP or kind == OR_STEP:
+                pending.append((operand, node.op.lexeme))  # type: ignore
+            elif kind == ASSIGN_STEP:
+                self._join(texts, f"= {node.token.lexeme}", 1)  # type: ignore
+            elif kind == CALL_STEP:
+                self._join(texts, "call", operand + 1)
+        while pending:
+            self._join(texts, pending.pop()[1], 2)
+        return texts[0]
+
+    @staticmethod
+    def _join(texts: List[str], name: str, count: int) -> None:
+        """replace the last count texts with the node of the name"""
+        operands = texts[len(texts) - count :]
+        del texts[len(texts) - count :]
+        texts.append(f"({name} {' '.join(operands)})")
+
     def _parenthesize(self, name: str, *exprs: Expr) -> str:
         result = f"({name}"
         for expr in exprs:
@@ -0,0 +1,145 @@
+""" opt-in profiling of lox programs run by the tree interpreter """
+import dataclasses
+import time
+from typing import Any, Callable, Dict, List, Optional, TextIO, Tuple, Union
+
+from expr import AssignExpr, Expr, VarExpr
+from interpreter import Interpreter
+from lox_token import Token
+from output import Output
+from stmt import Stmt
+
+Node = Union[Expr, Stmt]
+
+
+def first_line(node: Node) -> int:
+    """line of the first token in the node, 0 if it has none (e.g. literals)"""
+    # depth first over an explicit stack, expressions can be deeply nested
+    todo: List[Any] = [node]
+    while todo:
+        current = todo.pop()
+        if isinstance(current, Token):
+            return current.line
+        if not isinstance(current, (Expr, Stmt)):
+            continue
+        children: List[Any] = []
+        for field in dataclasses.fields(current):  # type: ignore[arg-type]
+            value = getattr(current, field.name)
+            children.extend(value if isinstance(value, list) else [value])
+        todo.extend(reversed(children))
+    return 0
+
+
+@dataclasses.dataclass(slots=True)
+class NodeStats:
+    node: Node
+    """ kept so the id of the node is not reused while profiling """
+    kind: str
+    line: int
+    count: int = 0
+    total: float = 0.0
+    """ seconds spent in the node including its children """
+    own: float = 0.0
+    """ seconds spent in the node itself """
+
+
+class ProfilingInterpreter(Interpreter):
+    """an Interpreter recording how often every node runs and how long it
+    takes. The plain Interpreter has no profiling hooks at all, profiling is
+    enabled by running the program with this class instead."""
+
+    def __init__(self, output: Optional[Output] = None) -> None:
+        super().__init__(output)
+        self.stats: Dict[int, NodeStats] = {}
+        """ the stats of the executed nodes by their id """
+        self.stacks: Dict[str, float] = {}
+        """ own seconds by `;` separated path of nodes from the program root """
+        self._stack: List[Tuple[NodeStats, str]] = []
+        self._child_time = [0.0]
+        self.cache_hits = 0
+        """ global reads and writes served by the inline cache of their node """
+        self.cache_misses = 0
+
+    def visit_var(self, expr: VarExpr) -> Any:
+        if expr.depth is None:
+            self._count_cache(expr)
+        return super().visit_var(expr)
+
+    def _assign(self, expr: AssignExpr, value: Any) -> Any:
+        if expr.depth is None:
+            self._count_cache(expr)
+        return super()._assign(expr, value)
+
+    def _count_cache(self, expr: Union[VarExpr, AssignExpr]) -> None:
+        if expr.cell_env is self._globals:
+            self.cache_hits += 1
+        else:
+            self.cache_misses += 1
+
+    def _evaluate(self, expr: Expr) -> Any:
+        return self._profile(expr, super()._evaluate)
+
+    def _execute(self, stmt: Stmt) -> Optional[bool]:
+        return self._profile(stmt, super()._execute)
+
+    def _profile(self, node: Any, run: Callable[[Any], Any]) -> Any:
+        stats = self.stats.get(id(node))
+        if stats is None:
+            # nodes without tokens are attributed to the line of their parent
+            line = first_line(node) or (self._stack[-1][0].line if self._stack else 0)
+            stats = NodeStats(node=node, kind=type(node).__name__, line=line)
+            self.stats[id(node)] = stats
+
+        frame = f"{stats.kind}:{stats.line}"
+        path = f"{self._stack[-1][1]};{frame}" if self._stack else frame
+        self._stack.append((stats, path))
+        self._child_time.append(0.0)
+        start = time.perf_counter()
+        try:
+            return run(node)
+        finally:
+            elapsed = time.perf_counter() - start
+            self._stack.pop()
+            own = elapsed - self._child_time.pop()
+            self._child_time[-1] += elapsed
+            stats.count += 1
+            stats.total += elapsed
+            stats.own += own
+            self.stacks[path] = self.stacks.get(path, 0.0) + own
+
+    def report(self, limit: Optional[int] = None) -> str:
+        """a flat report of the nodes by line and kind, slowest first"""
+        rows: Dict[Tuple[int, str], List[float]] = {}
+        for stats in self.stats.values():
+            row = rows.setdefault((stats.line, stats.kind), [0, 0.0, 0.0])
+            row[0] += stats.count
+            row[1] += stats.total
+            row[2] += stats.own
+
+        elapsed = sum(stats.own for stats in self.stats.values()) or 1.0
+        lines = [
+            f"{'line':>6} {'node':<16} {'count':>10} {'total ms':>10}"
+            f" {'own ms':>10} {'own %':>6}"
+        ]
+        ranked = sorted(rows.items(), key=lambda item: item[1][2], reverse=True)
+        for (line, kind), (count, total, own) in ranked[:limit]:
+            lines.append(
+                f"{line:>6} {kind:<16} {count:>10} {total * 1000:>10.2f}"
+                f" {own * 1000:>10.2f} {own / elapsed * 100:>6.1f}"
+            )
+        return "\n".join(lines)
+
+    def cache_report(self) -> str:
+        """the hit rate of the inline caches of the global variables"""
+        lookups = self.cache_hits + self.cache_misses
+        rate = self.cache_hits / lookups * 100 if lookups else 0.0
+        return (
+            f"global variable accesses {lookups},"
+            f" inline cache hits {self.cache_hits} ({rate:.1f}%)"
+        )
+
+    def write_stacks(self, out: TextIO) -> None:
+        """write the own time in microseconds of every path of nodes in the
+        collapsed stack format read by flamegraph.pl and speedscope"""
+        for path, own in self.stacks.items():
+            out.write(f"{path} {round(own * 1e6)}\n")
@@ -0,0 +1,55 @@
+import io
+from typing import Dict, Tuple
+
+import interpreter_test
+from profiler import ProfilingInterpreter
+
+
+class ProfilingInterpreterTest(interpreter_test.InterpreterTest):
+    def setUp(self):
+        self.interpreter = ProfilingInterpreter()
+
+    def test_counts_per_line(self) -> None:
+        output = self._interpret("var i = 0;\nwhile (i < 3)\n  i = i + 1;\nprint i;\n")
+        self.assertEqual(output, "3.0\n")
+
+        counts: Dict[Tuple[int, str], int] = {}
+        for stats in self.interpreter.stats.values():
+            key = (stats.line, stats.kind)
+            counts[key] = counts.get(key, 0) + stats.count
+        self.assertEqual(counts[(2, "WhileStmt")], 1)
+        self.assertEqual(counts[(2, "BinaryExpr")], 4)
+        self.assertEqual(counts[(3, "AssignExpr")], 3)
+        # a literal has no token and gets the line of its parent
+        self.assertEqual(counts[(3, "LiteralExpr")], 3)
+        self.assertEqual(counts[(4, "PrintStmt")], 1)
+
+        report = self.interpreter.report(limit=3)
+        self.assertEqual(len(report.splitlines()), 4)
+        self.assertIn("own ms", report)
+
+    def test_inline_cache_hits(self) -> None:
+        self._interpret("var i = 0;\nwhile (i < 3)\n  i = i + 1;\n{ var j = i; }\n")
+        # the first read of i in the condition and the body, the assignment
+        # and the read in the block miss, later runs of the nodes hit
+        self.assertEqual(self.interpreter.cache_misses, 4)
+        self.assertEqual(self.interpreter.cache_hits, 7)
+        self.assertIn("(63.6%)", self.interpreter.cache_report())
+
+    def test_collapsed_stacks(self) -> None:
+        self._interpret("var a = 1;\nprint a + 2;\n")
+
+        out = io.StringIO()
+        self.interpreter.write_stacks(out)
+        paths = [line.rsplit(" ", 1)[0] for line in out.getvalue().splitlines()]
+        self.assertCountEqual(
+            paths,
+            [
+                "DeclStmt:1",
+                "DeclStmt:1;LiteralExpr:1",
+                "PrintStmt:2",
+                "PrintStmt:2;BinaryExpr:2",
+                "PrintStmt:2;BinaryExpr:2;VarExpr:2",
+                "PrintStmt:2;BinaryExpr:2;LiteralExpr:2",
+            ],
+        )
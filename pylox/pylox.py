@@ -1,18 +1,106 @@
+import argparse
 import sys
 
-from runner import run_from_file, run_prompt
+from runner import (
+    ENGINES,
+    disable_cache,
+    enable_optimizer,
+    enable_profiler,
+    restore_snapshot,
+    run_from_file,
+    run_prompt,
+    save_snapshot,
+    use_engine,
+)
+from snapshot import SnapshotError
+from version import __version__
 
 
 def main() -> None:
-    argc = len(sys.argv)
+    arg_parser = argparse.ArgumentParser(prog="pylox")
+    arg_parser.add_argument("script", nargs="?", help="run the script or a prompt")
+    arg_parser.add_argument(
+        "--engine",
+        choices=sorted(ENGINES),
+        default="tree",
+        help="tree walking interpreter, bytecode vm or compiled closures",
+    )
+    arg_parser.add_argument(
+        "--optimize",
+        action="store_true",
+        help="fold constant expressions and remove dead branches before running",
+    )
+    arg_parser.add_argument(
+        "--optimize-report",
+        action="store_true",
+        help="print the number of ast nodes removed by --optimize to stderr",
+    )
+    arg_parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="run the script statement by statement while reading it",
+    )
+    arg_parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="neither read nor write the parsed script in __pycache__",
+    )
+    arg_parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="print the time spent per line and node and the hit rate of the "
+        "variable caches to stderr, tree engine only",
+    )
+    arg_parser.add_argument(
+        "--profile-stacks",
+        metavar="FILE",
+        help="write the profile as collapsed stacks for flamegraph.pl",
+    )
+    arg_parser.add_argument(
+        "--snapshot",
+        metavar="FILE",
+        help="save the globals to FILE when the script is done, tree engine only",
+    )
+    arg_parser.add_argument(
+        "--restore",
+        metavar="FILE",
+        help="start from the globals saved with --snapshot, e.g. by a prelude",
+    )
+    arg_parser.add_argument("--version", action="version", version=__version__)
+    args = arg_parser.parse_args()
 
-    if argc > 2:
-        print("Usage: pylox [script]")
-        exit(-1)
-    elif argc == 2:
-        run_from_file(sys.argv[1])
+    profiling = args.profile or args.profile_stacks is not None
+    if profiling and args.engine != "tree":
+        arg_parser.error("profiling is only supported by the tree engine")
+    snapshots = args.snapshot is not None or args.restore is not None
+    if snapshots and args.engine != "tree":
+        arg_parser.error("snapshots are only supported by the tree engine")
+
+    use_engine(args.engine)
+    profiler = enable_profiler() if profiling else None
+    if args.restore is not None:
+        try:
+            restore_snapshot(args.restore)
+        except (OSError, SnapshotError) as e:
+            arg_parser.error(f"cannot restore {args.restore}: {e}")
+    if args.no_cache:
+        disable_cache()
+    if args.optimize or args.optimize_report:
+        enable_optimizer(report=args.optimize_report)
+    if args.script is not None:
+        run_from_file(args.script, stream=args.stream)
     else:
         run_prompt()
+    if args.snapshot is not None:
+        save_snapshot(args.snapshot)
+
+    if profiler is not None:
+        if args.profile:
+            print(profiler.report(), file=sys.stderr)
+            print(profiler.cache_report(), file=sys.stderr)
+        if args.profile_stacks is not None:
+            with open(args.profile_stacks, "w") as f:
+                profiler.write_stacks(f)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,158 @@
+""" static pass computing the frame coordinates of every local variable """
+from typing import Dict, List, Optional, Tuple
+
+from expr import (
+    AssignExpr,
+    BinaryExpr,
+    CallExpr,
+    DeepExpr,
+    Expr,
+    ExprVisitor,
+    GroupExpr,
+    LiteralExpr,
+    LogicExpr,
+    UnaryExpr,
+    VarExpr,
+)
+from stmt import (
+    BlockStmt,
+    ConditionalStmt,
+    DeclStmt,
+    ExprStmt,
+    FunStmt,
+    PrintStmt,
+    ReturnStmt,
+    Stmt,
+    StmtVisitor,
+    WhileStmt,
+)
+
+
+class Resolver(ExprVisitor, StmtVisitor):
+    """annotates VarExpr/AssignExpr with the (depth, slot) of the variable they
+    refer to, DeclStmt and FunStmt with their slot, BlockStmt with the size of
+    its frame and FunStmt with the size of the frame of a call.
+    Names not declared in any enclosing block are left as globals. A block
+    declaring nothing gets no frame, size 0, and is not counted in depths."""
+
+    def __init__(self) -> None:
+        self._scopes: List[Dict[str, int]] = []
+        """ name -> slot of every block being resolved, innermost last """
+
+    def resolve(self, stmts: List[Stmt]) -> None:
+        for stmt in stmts:
+            self._resolve_stmt(stmt)
+
+    def visit_literal(self, expr: LiteralExpr) -> None:
+        pass
+
+    def visit_unary(self, expr: UnaryExpr) -> None:
+        self._resolve_expr(expr.right)
+
+    def visit_binary(self, expr: BinaryExpr) -> None:
+        self._resolve_expr(expr.left)
+        self._resolve_expr(expr.right)
+
+    def visit_group(self, expr: GroupExpr) -> None:
+        self._resolve_expr(expr.expr)
+
+    def visit_var(self, expr: VarExpr) -> None:
+        expr.depth, expr.slot = self._lookup(expr.token.lexeme)
+
+    def visit_assign(self, expr: AssignExpr) -> None:
+        self._resolve_expr(expr.expr)
+        expr.depth, expr.slot = self._lookup(expr.token.lexeme)
+
+    def visit_logic(self, expr: LogicExpr) -> None:
+        self._resolve_expr(expr.left)
+        self._resolve_expr(expr.right)
+
+    def visit_call(self, expr: CallExpr) -> None:
+        self._resolve_expr(expr.callee)
+        for arg in expr.args:
+            self._resolve_expr(arg)
+
+    def visit_deep(self, expr: DeepExpr) -> None:
+        # only the variables need resolving, in any order
+        for _, node, _ in expr.code:
+            if isinstance(node, (VarExpr, AssignExpr)):
+                node.depth, node.slot = self._lookup(node.token.lexeme)
+
+    def visit_print(self, stmt: PrintStmt) -> None:
+        self._resolve_expr(stmt.expr)
+
+    def visit_expr(self, stmt: ExprStmt) -> None:
+        self._resolve_expr(stmt.expr)
+
+    def visit_decl(self, stmt: DeclStmt) -> None:
+        # the initializer is resolved first, `var a = a;` refers to an outer a
+        if stmt.initializer is not None:
+            self._resolve_expr(stmt.initializer)
+        stmt.slot = self._declare(stmt.token.lexeme)
+
+    def visit_function(self, stmt: FunStmt) -> None:
+        # declared before the body is resolved so the function can call itself
+        stmt.slot = self._declare(stmt.token.lexeme)
+
+        self._scopes.append({})
+        for param in stmt.params:
+            self._declare(param.lexeme)
+        for s in stmt.body:
+            self._resolve_stmt(s)
+        stmt.size = len(self._scopes.pop())
+
+    def visit_return(self, stmt: ReturnStmt) -> None:
+        if stmt.value is not None:
+            self._resolve_expr(stmt.value)
+
+    def visit_block(self, stmt: BlockStmt) -> None:
+        if not any(_declares(s) for s in stmt.stmts):
+            # e.g. the block wrapping a for body and its increment, the
+            # statements run in the frame of the enclosing block
+            for s in stmt.stmts:
+                self._resolve_stmt(s)
+            stmt.size = 0
+            return
+
+        self._scopes.append({})
+        for s in stmt.stmts:
+            self._resolve_stmt(s)
+        stmt.size = len(self._scopes.pop())
+
+    def visit_conditional(self, stmt: ConditionalStmt) -> None:
+        self._resolve_expr(stmt.cond)
+        self._resolve_stmt(stmt.truthy)
+        if stmt.falsy is not None:
+            self._resolve_stmt(stmt.falsy)
+
+    def visit_while(self, stmt: WhileStmt) -> None:
+        self._resolve_expr(stmt.cond)
+        self._resolve_stmt(stmt.stmt)
+
+    def _resolve_expr(self, expr: Expr) -> None:
+        expr.accept(self)
+
+    def _resolve_stmt(self, stmt: Stmt) -> None:
+        stmt.accept(self)
+
+    def _declare(self, name: str) -> Optional[int]:
+        """the slot of the variable in the innermost block, None for a global"""
+        if not self._scopes:
+            return None
+
+        scope = self._scopes[-1]
+        if name not in scope:
+            scope[name] = len(scope)
+        return scope[name]
+
+    def _lookup(self, name: str) -> Tuple[Optional[int], int]:
+        for depth, scope in enumerate(reversed(self._scopes)):
+            if name in scope:
+                return depth, scope[name]
+        return None, 0
+
+
+def _declares(stmt: Stmt) -> bool:
+    """whether the statement declares a variable in the enclosing block, the
+    parser only allows declarations directly in a block"""
+    return isinstance(stmt, (DeclStmt, FunStmt))
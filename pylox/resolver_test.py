@@ -0,0 +1,102 @@
+import unittest
+from parser import Parser
+from typing import List, cast
+
+from expr import AssignExpr, BinaryExpr, VarExpr
+from resolver import Resolver
+from scanner import Scanner
+from stmt import BlockStmt, DeclStmt, ExprStmt, FunStmt, PrintStmt, ReturnStmt, Stmt
+
+
+class ResolverTest(unittest.TestCase):
+    def test_global_is_unresolved(self) -> None:
+        stmts = self._resolve("var a = 1; print a;")
+        self.assertIsNone(self._decl(stmts[0]).slot)
+        self.assertIsNone(self._var(stmts[1]).depth)
+
+    def test_local_coordinates(self) -> None:
+        stmts = self._resolve("{ var a = 1; var b = 2; { print a; b = 3; } }")
+        outer = self._block(stmts[0])
+        self.assertEqual(outer.size, 2)
+        self.assertEqual(self._decl(outer.stmts[1]).slot, 1)
+
+        # the inner block declares nothing and gets no frame of its own
+        inner = self._block(outer.stmts[2])
+        self.assertEqual(inner.size, 0)
+        var = self._var(inner.stmts[0])
+        self.assertEqual((var.depth, var.slot), (0, 0))
+        assign = self._assign(inner.stmts[1])
+        self.assertEqual((assign.depth, assign.slot), (0, 1))
+
+    def test_initializer_refers_to_outer_variable(self) -> None:
+        stmts = self._resolve("{ var a = 1; { var a = a; } }")
+        inner = self._block(self._block(stmts[0]).stmts[1])
+        initializer = self._decl(inner.stmts[0]).initializer
+        assert isinstance(initializer, VarExpr)
+        self.assertEqual((initializer.depth, initializer.slot), (1, 0))
+
+    def test_frameless_blocks_are_skipped_in_depth(self) -> None:
+        stmts = self._resolve(
+            "{ var a = 1; { { var b = 2; { print a; } } } { if (a) { var c; } } }"
+        )
+        outer = self._block(stmts[0])
+        middle = self._block(outer.stmts[1])
+        self.assertEqual(middle.size, 0)
+        inner = self._block(middle.stmts[0])
+        self.assertEqual(inner.size, 1)
+        var = self._var(self._block(inner.stmts[1]).stmts[0])
+        self.assertEqual((var.depth, var.slot), (1, 0))
+        # a declaration in a branch belongs to the block of the branch
+        self.assertEqual(self._block(outer.stmts[2]).size, 0)
+
+    def test_redeclaration_reuses_slot(self) -> None:
+        stmts = self._resolve("{ var a = 1; var a = 2; }")
+        block = self._block(stmts[0])
+        self.assertEqual(block.size, 1)
+        self.assertEqual(self._decl(block.stmts[1]).slot, 0)
+
+    def test_function_frame(self) -> None:
+        stmts = self._resolve("fun f(a, b) { var c; return a + f; }")
+        function = stmts[0]
+        assert isinstance(function, FunStmt)
+        self.assertIsNone(function.slot)
+        # the parameters come first in the frame of a call
+        self.assertEqual(function.size, 3)
+        self.assertEqual(self._decl(function.body[0]).slot, 2)
+        ret = function.body[1]
+        assert isinstance(ret, ReturnStmt)
+        add = ret.value
+        assert isinstance(add, BinaryExpr)
+        a, f = cast(VarExpr, add.left), cast(VarExpr, add.right)
+        self.assertEqual((a.depth, a.slot), (0, 0))
+        self.assertIsNone(f.depth)
+
+        stmts = self._resolve("{ var x; fun g() { return x; } }")
+        block = self._block(stmts[0])
+        self.assertEqual(block.size, 2)
+        g = block.stmts[1]
+        assert isinstance(g, FunStmt)
+        self.assertEqual(g.slot, 1)
+        x = cast(VarExpr, cast(ReturnStmt, g.body[0]).value)
+        self.assertEqual((x.depth, x.slot), (1, 0))
+
+    def _resolve(self, source: str) -> List[Stmt]:
+        stmts = Parser(Scanner(source).scan_tokens()).parse()
+        Resolver().resolve(stmts)
+        return stmts
+
+    def _block(self, stmt: Stmt) -> BlockStmt:
+        assert isinstance(stmt, BlockStmt)
+        return stmt
+
+    def _decl(self, stmt: Stmt) -> DeclStmt:
+        assert isinstance(stmt, DeclStmt)
+        return stmt
+
+    def _var(self, stmt: Stmt) -> VarExpr:
+        assert isinstance(stmt, PrintStmt) and isinstance(stmt.expr, VarExpr)
+        return stmt.expr
+
+    def _assign(self, stmt: Stmt) -> AssignExpr:
+        assert isinstance(stmt, ExprStmt) and isinstance(stmt.expr, AssignExpr)
+        return stmt.expr
@@ -1,26 +1,135 @@
 """ entry point of the python implementation of the lox language """
+import sys
 from parser import Parser
+from typing import Callable, Dict, Iterable, List, Optional, Union
 
+import cache
+import snapshot
+from closures import ClosureInterpreter
 from interpreter import Interpreter
-from scanner import Scanner
+from optimizer import Optimizer
+from profiler import ProfilingInterpreter
+from scanner import FastScanner, StreamScanner
+from stmt import Stmt
+from vm import VM
 
-interpreter = Interpreter()
+Engine = Union[Interpreter, VM, ClosureInterpreter]
 
+ENGINES: Dict[str, Callable[..., Engine]] = {
+    "tree": Interpreter,
+    "vm": VM,
+    "closure": ClosureInterpreter,
+}
+""" the available execution engines, all of them expose interpret(stmts) and
+take an optional Output receiving what print writes """
 
-def _run(source_code: str) -> None:
-    scanner = Scanner(source_code)
-    tokens = scanner.scan_tokens()
-    parser = Parser(tokens)
+STREAM_CHUNK_SIZE = 64 * 1024
+
+interpreter: Engine = Interpreter()
+optimizer: Optional[Optimizer] = None
+report_optimizations = False
+use_cache = True
+""" whether the ast of a script run from a file is cached on disk """
+
+
+def use_engine(name: str) -> None:
+    """replace the global interpreter with a fresh instance of the named engine"""
+    global interpreter
+    interpreter = ENGINES[name]()
+
+
+def enable_optimizer(report: bool = False) -> None:
+    """optimize the statements before running them, with report the number of
+    removed nodes is printed to stderr"""
+    global optimizer, report_optimizations
+    optimizer = Optimizer()
+    report_optimizations = report
+
+
+def enable_profiler() -> ProfilingInterpreter:
+    """replace the global interpreter with a tree interpreter recording the
+    count and time of every executed node"""
+    global interpreter
+    interpreter = ProfilingInterpreter()
+    return interpreter
+
+
+def disable_cache() -> None:
+    global use_cache
+    use_cache = False
+
+
+def restore_snapshot(path: str) -> None:
+    """start the global interpreter, a tree interpreter, from the globals saved
+    by save_snapshot"""
+    assert isinstance(interpreter, Interpreter)
+    snapshot.load(interpreter, path)
+
+
+def save_snapshot(path: str) -> None:
+    """save the globals of the global interpreter, a tree interpreter"""
+    assert isinstance(interpreter, Interpreter)
+    snapshot.save(interpreter, path)
+
+
+def _run(source_code: str, script_path: Optional[str] = None) -> None:
+    stmts = _parse(source_code, script_path)
+    if stmts is None:
+        # every syntax error has been reported by the parser
+        return
+
+    interpreter.interpret(_optimize(stmts))
+
+
+def _parse(source_code: str, script_path: Optional[str]) -> Optional[List[Stmt]]:
+    """parse the source code, None if it has syntax errors. The ast of a script
+    file is cached on disk"""
+    if script_path is None or not use_cache:
+        return _parse_source(source_code)
+
+    stmts = cache.load(script_path, source_code)
+    if stmts is None:
+        stmts = _parse_source(source_code)
+        if stmts is not None:
+            cache.store(script_path, source_code, stmts)
+    return stmts
+
+
+def _parse_source(source_code: str) -> Optional[List[Stmt]]:
+    parser = Parser(FastScanner(source_code).scan_tokens())
     stmts = parser.parse()
-    if stmts:
-        interpreter.interpret(stmts)
-    else:
-        print(f"Failed to parse {source_code}")
+    return None if parser.errors else stmts
+
+
+def _run_stream(chunks: Iterable[str]) -> None:
+    """scan, parse and run the statements one by one as the chunks arrive,
+    stops at the first parse or runtime error"""
+    tokens = StreamScanner(chunks).scan_stream()
+    for stmt in Parser(tokens).statements():
+        if not interpreter.interpret(_optimize([stmt])):
+            break
+
+
+def _optimize(stmts: List[Stmt]) -> List[Stmt]:
+    if optimizer is None:
+        return stmts
+
+    removed = optimizer.removed
+    stmts = optimizer.optimize(stmts)
+    if report_optimizations:
+        removed = optimizer.removed - removed
+        print(f"optimizer removed {removed} nodes", file=sys.stderr)
+    return stmts
 
 
-def run_from_file(file_name: str) -> None:
+def run_from_file(file_name: str, stream: bool = False) -> None:
+    """with stream the file is read in chunks and every statement runs as soon
+    as it is parsed, so memory does not grow with the size of the file"""
     with open(file_name) as f:
-        _run(f.read())
+        if stream:
+            _run_stream(iter(lambda: f.read(STREAM_CHUNK_SIZE), ""))
+        else:
+            _run(f.read(), file_name)
 
 
 def run_prompt() -> None:
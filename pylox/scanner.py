@@ -1,9 +1,14 @@
-from typing import Any, List, Optional
+import re
+import sys
+from typing import Any, Iterable, Iterator, List, Optional, Tuple
 
 from error import error
-from lox_token import Token
+from lox_token import Token, TokenArray
 from token_type import TokenType
 
+Span = Tuple[Token, int, int]
+""" a token with the start and end offsets of its lexeme in the source """
+
 
 class Scanner:
 
@@ -143,6 +148,7 @@ class Scanner:
 
         if self._is_at_end():
             error(self._line, "Untermindated string.")
+            return
 
         # consume closing "
         self._advance()
@@ -187,6 +193,9 @@ class Scanner:
 
     def _add_token_with_literal(self, ttype: TokenType, literal: Any) -> None:
         lexeme = self._source_code[self._start : self._current]
+        if literal is None:
+            # keywords, identifiers and operators repeat a lot, share one string
+            lexeme = sys.intern(lexeme)
         self._tokens.append(
             Token(ttype=ttype, lexeme=lexeme, literal=literal, line=self._line)
         )
@@ -195,3 +204,295 @@ class Scanner:
         self._tokens.append(
             Token(ttype=TokenType.EOF, lexeme="", literal=None, line=self._line)
         )
+
+
+class FastScanner(Scanner):
+    """produces the same tokens and errors as Scanner, but matches whole
+    lexemes with one compiled regex instead of dispatching per character.
+    Anything the regex does not cover (unexpected or non ascii characters,
+    unterminated strings) is handed to the per character Scanner."""
+
+    _LEXEME_RE = re.compile(
+        r"""
+        [ \t\r]*
+        (?:
+            (?P<identifier>[A-Za-z_][A-Za-z0-9_]*)
+            |(?P<op>[-(){},.+;*]|[!=<>]=?|/(?!/))
+            |(?P<number>[0-9]+(?:\.[0-9]+)?)
+            |(?P<newline>\n)
+            |(?P<comment>//[^\n]*)
+            |(?P<string>"[^"]*")
+            |(?P<other>.|\Z)
+        )
+        """,
+        re.VERBOSE | re.DOTALL,
+    )
+    """ each match skips blanks then matches one lexeme, `other` marks where
+    the per character Scanner has to take over """
+
+    OPERATORS = {
+        "(": TokenType.LEFT_PAREN,
+        ")": TokenType.RIGHT_PAREN,
+        "{": TokenType.LEFT_BRACE,
+        "}": TokenType.RIGHT_BRACE,
+        ",": TokenType.COMMA,
+        ".": TokenType.DOT,
+        "-": TokenType.MINUS,
+        "+": TokenType.PLUS,
+        ";": TokenType.SEMICOLON,
+        "*": TokenType.STAR,
+        "/": TokenType.SLASH,
+        "!": TokenType.BANG,
+        "!=": TokenType.BANG_EQUAL,
+        "=": TokenType.EQUAL,
+        "==": TokenType.EQUAL_EQUAL,
+        ">": TokenType.GREATER,
+        ">=": TokenType.GREATER_EQUAL,
+        "<": TokenType.LESS,
+        "<=": TokenType.LESS_EQUAL,
+    }
+
+    def scan_tokens(self) -> List[Token]:
+        source = self._source_code
+        end = len(source)
+        # an ascii only source never needs the non ascii checks
+        check_non_ascii = not source.isascii()
+        pos = 0
+        line = self._line
+
+        while pos < end:
+            pos, line, _ = self._scan_fast(pos, line, check_non_ascii, final=True)
+            if pos < end:
+                pos, line = self._scan_slow(pos, line)
+
+        self._current = pos
+        self._line = line
+        self._add_eof_token()
+        return self._tokens
+
+    def _lexemes(
+        self, pos: int, line: int, check_non_ascii: bool, end: int
+    ) -> Iterator[Tuple[str, int, int, int]]:
+        """the kind, start and end offsets and line of the lexemes from pos,
+        which is on the given line. The last one has no length and the kind
+        `other` if the per character Scanner has to take over at its start, or
+        `partial` if the lexeme ends after end and may still continue"""
+        source = self._source_code
+        for m in self._LEXEME_RE.finditer(source, pos):
+            # every alternative of the regex is a named group
+            kind = m.lastgroup
+            assert kind is not None
+            start, stop = m.span(kind)
+            if m.end() > end:
+                yield "partial", start, start, line
+                return
+            if kind == "newline":
+                line += 1
+            elif kind == "identifier" or kind == "number":
+                if check_non_ascii and self._continues_non_ascii(source, stop):
+                    yield "other", start, start, line
+                    return
+                yield kind, start, stop, line
+            elif kind == "string":
+                line += source.count("\n", start, stop)
+                yield kind, start, stop, line
+            elif kind == "op":
+                yield kind, start, stop, line
+            elif kind == "other":
+                yield kind, start, start, line
+                return
+
+    def _scan_fast(
+        self, pos: int, line: int, check_non_ascii: bool, final: bool
+    ) -> Tuple[int, int, bool]:
+        """scan lexemes from pos until one needs the per character Scanner,
+        returns the (pos, line) of that lexeme and whether it is complete.
+
+        If the source is not final more text may follow, so a lexeme is only
+        complete if two characters after it are known (enough to tell `1.`
+        from `1.5`) and a string is not complete until its closing quote."""
+        source = self._source_code
+        end = len(source) if final else len(source) - 2
+        operators = self.OPERATORS
+        key_words = self.KEY_WORDS
+        append = self._tokens.append
+        intern = sys.intern
+        identifier = TokenType.IDENTIFIER
+        number = TokenType.NUMBER
+
+        for kind, start, stop, line in self._lexemes(pos, line, check_non_ascii, end):
+            if kind == "identifier":
+                lexeme = intern(source[start:stop])
+                append(Token(key_words.get(lexeme, identifier), lexeme, None, line))
+            elif kind == "op":
+                lexeme = intern(source[start:stop])
+                append(Token(operators[lexeme], lexeme, None, line))
+            elif kind == "number":
+                lexeme = source[start:stop]
+                append(Token(number, lexeme, float(lexeme), line))
+            elif kind == "string":
+                lexeme = source[start:stop]
+                append(Token(TokenType.STRING, lexeme, lexeme[1:-1], line))
+            elif kind == "other":
+                return start, line, final or source[start] != '"'
+            else:
+                return start, line, False
+        return len(source), line, True
+
+    def scan_token_array(self) -> TokenArray:
+        """scan into a TokenArray holding offsets into the source instead of
+        Token objects, the tokens are the same as the ones of scan_tokens"""
+        source = self._source_code
+        check_non_ascii = not source.isascii()
+        tokens = TokenArray(source)
+        pos = 0
+        line = self._line
+
+        while pos < len(source):
+            pos, line = self._scan_offsets(tokens, pos, line, check_non_ascii)
+            if pos < len(source):
+                start = pos
+                pos, line = self._scan_slow(pos, line)
+                for token in self._tokens:
+                    tokens.append(token.ttype, start, pos, token.line)
+                self._tokens.clear()
+
+        tokens.append(TokenType.EOF, len(source), len(source), line)
+        return tokens
+
+    def _scan_offsets(
+        self, tokens: TokenArray, pos: int, line: int, check_non_ascii: bool
+    ) -> Tuple[int, int]:
+        """the _scan_fast loop of a final source adding offsets to tokens,
+        returns the (pos, line) of the lexeme needing the per character
+        Scanner"""
+        source = self._source_code
+        operators = self.OPERATORS
+        key_words = self.KEY_WORDS
+        append = tokens.append
+        identifier = TokenType.IDENTIFIER
+        number = TokenType.NUMBER
+
+        lexemes = self._lexemes(pos, line, check_non_ascii, len(source))
+        for kind, start, stop, line in lexemes:
+            if kind == "identifier":
+                append(key_words.get(source[start:stop], identifier), start, stop, line)
+            elif kind == "op":
+                append(operators[source[start:stop]], start, stop, line)
+            elif kind == "number":
+                append(number, start, stop, line)
+            elif kind == "string":
+                append(TokenType.STRING, start, stop, line)
+            else:
+                return start, line
+        return len(source), line
+
+    def scan_spans(self, pos: int = 0, line: int = 1) -> Iterator[Span]:
+        """lazily scan the tokens from the offset pos, which is on the given
+        line, with the start and end offsets of their lexemes. The last one is
+        EOF, a caller re-scanning part of an edited source stops as soon as it
+        meets tokens it already has"""
+        source = self._source_code
+        check_non_ascii = not source.isascii()
+        operators = self.OPERATORS
+        key_words = self.KEY_WORDS
+        intern = sys.intern
+        identifier = TokenType.IDENTIFIER
+        number = TokenType.NUMBER
+
+        while pos < len(source):
+            lexemes = self._lexemes(pos, line, check_non_ascii, len(source))
+            for kind, start, stop, line in lexemes:
+                if kind == "identifier":
+                    lexeme = intern(source[start:stop])
+                    ttype = key_words.get(lexeme, identifier)
+                    yield Token(ttype, lexeme, None, line), start, stop
+                elif kind == "op":
+                    lexeme = intern(source[start:stop])
+                    yield Token(operators[lexeme], lexeme, None, line), start, stop
+                elif kind == "number":
+                    lexeme = source[start:stop]
+                    yield Token(number, lexeme, float(lexeme), line), start, stop
+                elif kind == "string":
+                    lexeme = source[start:stop]
+                    token = Token(TokenType.STRING, lexeme, lexeme[1:-1], line)
+                    yield token, start, stop
+                else:
+                    pos = start
+
+            if pos < len(source):
+                start = pos
+                pos, line = self._scan_slow(pos, line)
+                for token in self._tokens:
+                    yield token, start, pos
+                self._tokens.clear()
+
+        yield Token(TokenType.EOF, "", None, line), len(source), len(source)
+
+    def _scan_slow(self, pos: int, line: int) -> Tuple[int, int]:
+        """scan one lexeme at pos with Scanner, returns the new (pos, line)"""
+        self._start = self._current = pos
+        self._line = line
+        self._scan()
+        return self._current, self._line
+
+    @staticmethod
+    def _continues_non_ascii(source: str, stop: int) -> bool:
+        """whether Scanner would extend the identifier or number ending at stop
+        with non ascii letters or digits, which the regex does not know"""
+        if stop >= len(source):
+            return False
+        c = source[stop]
+        if c == "." and stop + 1 < len(source):
+            c = source[stop + 1]
+        return c > "\x7f"
+
+
+class StreamScanner(FastScanner):
+    """scans source code arriving as an iterable of text chunks, a token is
+    yielded as soon as the chunks read so far prove it complete, so only the
+    unfinished lexeme at the end of a chunk is kept in memory"""
+
+    def __init__(self, chunks: Iterable[str]) -> None:
+        super().__init__("")
+        self._chunks = chunks
+
+    def scan_stream(self) -> Iterator[Token]:
+        rest = ""
+        for chunk in self._chunks:
+            self._source_code = rest + chunk
+            pos = self._scan_complete()
+            rest = self._source_code[pos:]
+            yield from self._take_tokens()
+
+        self._source_code = rest
+        self.scan_tokens()
+        yield from self._take_tokens()
+
+    def _scan_complete(self) -> int:
+        """scan the complete lexemes of the current text, returns the offset of
+        the first lexeme that may continue in the next chunk"""
+        source = self._source_code
+        check_non_ascii = not source.isascii()
+        pos = 0
+        while True:
+            pos, self._line, complete = self._scan_fast(
+                pos, self._line, check_non_ascii, final=False
+            )
+            if not complete:
+                return pos
+
+            scanned = len(self._tokens)
+            line = self._line
+            current, self._line = self._scan_slow(pos, line)
+            if current > len(source) - 2:
+                # the per character scan may need the next chunk too
+                del self._tokens[scanned:]
+                self._line = line
+                return pos
+            pos = current
+
+    def _take_tokens(self) -> List[Token]:
+        tokens = self._tokens
+        self._tokens = []
+        return tokens
@@ -1,7 +1,9 @@
+import contextlib
+import io
 import unittest
 
 from lox_token import Token
-from scanner import Scanner
+from scanner import FastScanner, Scanner, StreamScanner
 from token_type import TokenType
 
 
@@ -24,3 +26,77 @@ class ScannerTest(unittest.TestCase):
                 Token(ttype=TokenType.EOF, lexeme=""),
             ],
         )
+
+    def test_fast_scanner_same_tokens(self) -> None:
+        sources = [
+            "var a = 1.5; // comment\nprint a <= 2 and b_1 != nil;",
+            'print "multi\nline" + "string";\nwhile (x >= 10) x = x / 2.;',
+            "!a == !b < c > d - e * f, g.h { }",
+            "a // comment at the end",
+            "trailing blanks \t\r\n  ",
+            "π = 3; x١ = 1; 1.٣;",
+        ]
+        for source in sources:
+            with self.subTest(msg=f"test scanning {source!r}"):
+                self.assertListEqual(
+                    FastScanner(source).scan_tokens(), Scanner(source).scan_tokens()
+                )
+
+    def test_token_array_same_tokens(self) -> None:
+        sources = [
+            "var a = 1.5; // comment\nprint a <= 2 and b_1 != nil;",
+            'print "multi\nline" + "string";\nwhile (x >= 10) x = x / 2.;',
+            "π = 3; x١ = 1; 1.٣;",
+            "",
+        ]
+        for source in sources:
+            with self.subTest(msg=f"test scanning {source!r}"):
+                expected = Scanner(source).scan_tokens()
+                tokens = FastScanner(source).scan_token_array()
+                self.assertEqual(len(tokens), len(expected))
+                self.assertListEqual(list(tokens), expected)
+                self.assertEqual(tokens[0], expected[0])
+
+    def test_spans_of_tokens(self) -> None:
+        source = 'var a = "multi\nline"; // comment\nπ = 1.٣;'
+        spans = list(FastScanner(source).scan_spans())
+        tokens = [token for token, _, _ in spans]
+        self.assertListEqual(tokens, Scanner(source).scan_tokens())
+        for token, start, stop in spans:
+            self.assertEqual(source[start:stop], token.lexeme)
+        # scanning from the middle of the source
+        start = source.index(";") + 1
+        tail = [token for token, _, _ in FastScanner(source).scan_spans(start, 2)]
+        self.assertListEqual(tail, tokens[5:])
+
+    def test_unterminated_string(self) -> None:
+        for scanner in (Scanner, FastScanner):
+            with self.subTest(msg=f"test {scanner.__name__}"):
+                with contextlib.redirect_stdout(io.StringIO()) as out:
+                    tokens = scanner('a "b\nc').scan_tokens()
+                self.assertListEqual(
+                    tokens,
+                    [
+                        Token(ttype=TokenType.IDENTIFIER, lexeme="a"),
+                        Token(ttype=TokenType.EOF, lexeme="", line=2),
+                    ],
+                )
+                self.assertEqual(
+                    out.getvalue(), "[line 2] Error: Untermindated string.\n"
+                )
+
+    def test_lexemes_interned(self) -> None:
+        first, _, second, _ = FastScanner("value + value").scan_tokens()
+        self.assertIs(first.lexeme, second.lexeme)
+
+    def test_stream_scanner_chunk_boundaries(self) -> None:
+        source = (
+            'var a = 12.5; // comment\nprint a >= 1 and "multi\nline" != b_1;\n'
+            "x١ = 1.٣;"
+        )
+        expected = Scanner(source).scan_tokens()
+        for size in [1, 2, 3, 5, 8, len(source)]:
+            with self.subTest(msg=f"test chunks of {size} characters"):
+                chunks = [source[i : i + size] for i in range(0, len(source), size)]
+                tokens = list(StreamScanner(chunks).scan_stream())
+                self.assertListEqual(tokens, expected)
@@ -0,0 +1,228 @@
+""" local server keeping named interpreter sessions warm between requests.
+
+Clients connect over a unix socket or tcp on localhost and send one json
+object per line:
+
+    {"session": "name", "source": "print 1;"}  run source in the session
+    {"session": "name", "close": true}         forget the session
+
+The output printed while running is streamed back as `{"output": text}`
+lines, a run ends with `{"done": true, "ok": false}` if a parse or runtime
+error was reported. A session is created by its first request, sessions
+share nothing. """
+import argparse
+import asyncio
+import contextvars
+import io
+import json
+import sys
+from dataclasses import dataclass, field
+from parser import Parser
+from typing import Any, Callable, Dict, Optional, TextIO
+
+from runner import ENGINES, Engine
+from scanner import FastScanner
+
+_Emit = Callable[[str], None]
+
+_output: contextvars.ContextVar[Optional[_Emit]] = contextvars.ContextVar(
+    "output", default=None
+)
+""" where the print output of the current session run goes """
+
+LINE_LIMIT = 16 * 1024 * 1024
+""" longest request line accepted, the connection of a client sending a longer
+one is closed after an error response """
+
+
+class _SessionStdout(io.TextIOBase):
+    """replacement of sys.stdout sending the writes of a session run to its
+    client, everything else goes to the real stdout"""
+
+    def __init__(self, stdout: TextIO) -> None:
+        self.stdout = stdout
+
+    def write(self, text: str) -> int:
+        emit = _output.get()
+        if emit is None:
+            return self.stdout.write(text)
+        emit(text)
+        return len(text)
+
+    def flush(self) -> None:
+        self.stdout.flush()
+
+
+@dataclass
+class Session:
+    interpreter: Engine
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+    """ runs of the same session are serialized """
+
+
+class LoxServer:
+    def __init__(self, engine: str = "tree") -> None:
+        self._engine = ENGINES[engine]
+        self.sessions: Dict[str, Session] = {}
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._stdout: Optional[TextIO] = None
+
+    async def start_unix(self, path: str) -> None:
+        self._install_stdout()
+        self._server = await asyncio.start_unix_server(
+            self._serve_client, path, limit=LINE_LIMIT
+        )
+
+    async def start_tcp(self, port: int, host: str = "127.0.0.1") -> int:
+        """listen on host, returns the port which is chosen if 0"""
+        self._install_stdout()
+        self._server = await asyncio.start_server(
+            self._serve_client, host, port, limit=LINE_LIMIT
+        )
+        return self._server.sockets[0].getsockname()[1]
+
+    async def serve_forever(self) -> None:
+        assert self._server is not None
+        await self._server.serve_forever()
+
+    async def close(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        if self._stdout is not None:
+            sys.stdout = self._stdout
+            self._stdout = None
+
+    def _install_stdout(self) -> None:
+        if self._stdout is None:
+            self._stdout = sys.stdout
+            sys.stdout = _SessionStdout(self._stdout)
+
+    async def _serve_client(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    # the rest of the line may still be coming, the
+                    # following requests can't be found reliably
+                    await self._send(writer, {"error": "request too long"})
+                    break
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                    name = request["session"]
+                except (ValueError, KeyError, TypeError):
+                    await self._send(writer, {"error": "malformed request"})
+                    continue
+
+                if request.get("close"):
+                    self.sessions.pop(name, None)
+                    await self._send(writer, {"done": True, "ok": True})
+                else:
+                    await self._run(writer, name, str(request.get("source", "")))
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def _run(self, writer: asyncio.StreamWriter, name: str, source: str) -> None:
+        session = self.sessions.get(name)
+        if session is None:
+            session = self.sessions[name] = Session(interpreter=self._engine())
+
+        outputs: asyncio.Queue[Optional[str]] = asyncio.Queue()
+        loop = asyncio.get_running_loop()
+
+        def emit(text: str) -> None:
+            loop.call_soon_threadsafe(outputs.put_nowait, text)
+
+        def run() -> bool:
+            _output.set(emit)
+            return self._interpret(session.interpreter, source)
+
+        async with session.lock:
+            # the interpreter runs in a thread so other clients are served
+            # meanwhile, to_thread runs it in a copy of this context
+            task = asyncio.ensure_future(asyncio.to_thread(run))
+            task.add_done_callback(lambda _: outputs.put_nowait(None))
+            try:
+                done = False
+                while not done:
+                    # send everything printed so far as one message, None
+                    # marks the end of the run
+                    chunks = [await outputs.get()]
+                    while not outputs.empty():
+                        chunks.append(outputs.get_nowait())
+                    done = None in chunks
+                    text = "".join(chunk for chunk in chunks if chunk is not None)
+                    if text:
+                        await self._send(writer, {"output": text})
+            finally:
+                # the thread can't be stopped, the session stays locked until
+                # it ends even if the client is gone
+                await _join(task)
+            ok = task.result()
+
+        await self._send(writer, {"done": True, "ok": ok})
+
+    @staticmethod
+    def _interpret(interpreter: Engine, source: str) -> bool:
+        parser = Parser(FastScanner(source).scan_tokens())
+        stmts = parser.parse()
+        if parser.errors:
+            return False
+        return interpreter.interpret(stmts)
+
+    @staticmethod
+    async def _send(writer: asyncio.StreamWriter, message: Dict[str, Any]) -> None:
+        writer.write(json.dumps(message).encode() + b"\n")
+        await writer.drain()
+
+
+async def _join(task: "asyncio.Future[bool]") -> None:
+    """wait until the task is done, even if the caller is cancelled meanwhile"""
+    cancelled = False
+    while not task.done():
+        try:
+            # unlike awaiting the task, wait doesn't cancel it
+            await asyncio.wait([task])
+        except asyncio.CancelledError:
+            cancelled = True
+    if cancelled:
+        raise asyncio.CancelledError
+
+
+async def _serve(args: argparse.Namespace) -> None:
+    server = LoxServer(args.engine)
+    if args.unix is not None:
+        await server.start_unix(args.unix)
+    else:
+        port = await server.start_tcp(args.port)
+        print(f"listening on 127.0.0.1:{port}", file=sys.stderr)
+    try:
+        await server.serve_forever()
+    finally:
+        await server.close()
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(prog="pylox-server")
+    arg_parser.add_argument("--unix", metavar="PATH", help="listen on a unix socket")
+    arg_parser.add_argument(
+        "--port", type=int, default=0, help="tcp port on localhost, 0 picks one"
+    )
+    arg_parser.add_argument("--engine", choices=sorted(ENGINES), default="tree")
+    args = arg_parser.parse_args()
+    try:
+        asyncio.run(_serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
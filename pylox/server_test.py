@@ -0,0 +1,131 @@
+import asyncio
+import json
+import os
+import tempfile
+import unittest
+from typing import Any, Dict, List, Tuple
+from unittest import mock
+
+from server import LINE_LIMIT, LoxServer
+
+Client = Tuple[asyncio.StreamReader, asyncio.StreamWriter]
+
+
+class LoxServerTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        self.server = LoxServer()
+        self.port = await self.server.start_tcp(0)
+        self._writers: List[asyncio.StreamWriter] = []
+
+    async def asyncTearDown(self) -> None:
+        for writer in self._writers:
+            writer.close()
+            await writer.wait_closed()
+        await self.server.close()
+
+    async def test_sessions_keep_state(self) -> None:
+        client = await self._connect()
+        self.assertEqual(await self._run(client, "a", "var x = 1;"), ("", True))
+        self.assertEqual(await self._run(client, "b", "var x = 2;"), ("", True))
+        self.assertEqual(await self._run(client, "a", "print x;"), ("1.0\n", True))
+        self.assertEqual(await self._run(client, "b", "print x;"), ("2.0\n", True))
+
+        # another client sees the same named sessions
+        other = await self._connect()
+        self.assertEqual(await self._run(other, "a", "print x + 1;"), ("2.0\n", True))
+
+    async def test_errors(self) -> None:
+        client = await self._connect()
+        output, ok = await self._run(client, "a", 'print 1;\nprint -"a";')
+        self.assertEqual(
+            output,
+            "1.0\n[line 2] Error: type mismatched for -, expected type is "
+            "<class 'float'>\n",
+        )
+        self.assertFalse(ok)
+        output, ok = await self._run(client, "a", "print ;")
+        self.assertIn("Error at ';'", output)
+        self.assertFalse(ok)
+
+        reader, writer = client
+        writer.write(b"not json\n")
+        response = json.loads(await reader.readline())
+        self.assertEqual(response, {"error": "malformed request"})
+
+    async def test_request_too_long(self) -> None:
+        reader, writer = await self._connect()
+        writer.write(b"x" * (LINE_LIMIT + 1) + b"\n")
+        response = json.loads(await reader.readline())
+        self.assertEqual(response, {"error": "request too long"})
+        self.assertEqual(await reader.readline(), b"")
+
+    async def test_client_gone_during_run(self) -> None:
+        send = self.server._send
+
+        async def fail_output(writer: Any, message: Dict[str, Any]) -> None:
+            if "output" in message:
+                raise ConnectionResetError
+            await send(writer, message)
+
+        # printed late enough to be flushed right away, the client is found
+        # gone in the middle of the run
+        source = """
+var i = 0;
+while (i < 100000) { i = i + 1; if (i == 50000) print i; }
+"""
+        reader, writer = await self._connect()
+        with mock.patch.object(self.server, "_send", fail_output):
+            writer.write(json.dumps({"session": "a", "source": source}).encode())
+            writer.write(b"\n")
+            # the connection is closed once the run is over
+            self.assertEqual(await reader.readline(), b"")
+        # a run of the session started later sees the whole run
+        result = await self._run(await self._connect(), "a", "print i;")
+        self.assertEqual(result, ("100000.0\n", True))
+
+    async def test_close_session(self) -> None:
+        client = await self._connect()
+        await self._run(client, "a", "var x = 1;")
+        reader, writer = client
+        writer.write(json.dumps({"session": "a", "close": True}).encode() + b"\n")
+        await reader.readline()
+        output, ok = await self._run(client, "a", "print x;")
+        self.assertIn("Undefined variable x", output)
+        self.assertFalse(ok)
+
+    async def test_concurrent_clients(self) -> None:
+        async def count(name: str) -> Tuple[str, bool]:
+            source = "for (var i = 0; i < 200; i = i + 1) print i;"
+            return await self._run(await self._connect(), name, source)
+
+        results = await asyncio.gather(*(count(f"s{i}") for i in range(8)))
+        expected = "".join(f"{float(i)}\n" for i in range(200))
+        self.assertEqual(results, [(expected, True)] * 8)
+
+    async def test_unix_socket(self) -> None:
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "lox.sock")
+            server = LoxServer(engine="vm")
+            await server.start_unix(path)
+            try:
+                client = await asyncio.open_unix_connection(path)
+                self._writers.append(client[1])
+                result = await self._run(client, "a", "print 1 + 1;")
+                self.assertEqual(result, ("2.0\n", True))
+            finally:
+                await server.close()
+
+    async def _connect(self) -> Client:
+        reader, writer = await asyncio.open_connection("127.0.0.1", self.port)
+        self._writers.append(writer)
+        return reader, writer
+
+    async def _run(self, client: Client, session: str, source: str) -> Tuple[str, bool]:
+        reader, writer = client
+        request = {"session": session, "source": source}
+        writer.write(json.dumps(request).encode() + b"\n")
+        messages: List[Dict[str, Any]] = []
+        while not messages or "done" not in messages[-1]:
+            messages.append(json.loads(await reader.readline()))
+        output = "".join(message.get("output", "") for message in messages)
+        return output, messages[-1]["ok"]
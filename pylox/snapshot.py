@@ -0,0 +1,80 @@
+""" snapshots of the globals of an interpreter, to run a prelude only once.
+
+A snapshot holds the global variables of a tree Interpreter with everything
+they reach: the functions, their declarations and the frames they closed
+over. It is a compressed pickle behind a header naming the pylox version and
+the layout of the ast, the native functions are stored by name. Restoring it
+replaces the globals of another interpreter, in this process or in a worker,
+which then runs as if it had run the prelude itself. Each restore gets its
+own copy of the values.
+
+Unpickling can run arbitrary code, like the ast cache a snapshot is trusted
+and must only be restored from a file no one else can write. """
+import contextlib
+import os
+import pickle
+import zlib
+
+from cache import AST_LAYOUT
+from env import Environment, ForkedEnvironment
+from interpreter import Interpreter
+from version import __version__
+
+_MAGIC = b"PYLOXENV"
+_HEADER = _MAGIC + __version__.encode().ljust(16) + AST_LAYOUT
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def dumps(interpreter: Interpreter) -> bytes:
+    """the snapshot of the globals of the interpreter"""
+    globals_ = interpreter.globals
+    if isinstance(globals_, ForkedEnvironment):
+        # a restore copies everything anyway
+        globals_ = globals_.merged()
+    try:
+        data = pickle.dumps(globals_, protocol=pickle.HIGHEST_PROTOCOL)
+    except RecursionError:
+        raise SnapshotError("the globals are nested too deeply to snapshot") from None
+    # the ast of the functions compresses more than tenfold, at the fastest
+    # level it costs less than unpickling
+    return _HEADER + zlib.compress(data, 1)
+
+
+def loads(interpreter: Interpreter, data: bytes) -> None:
+    """replace the globals of the interpreter with the ones of the snapshot"""
+    if not data.startswith(_MAGIC):
+        raise SnapshotError("not a pylox snapshot")
+    if not data.startswith(_HEADER):
+        raise SnapshotError(f"not a snapshot of this pylox {__version__}")
+    try:
+        globals_ = pickle.loads(zlib.decompress(data[len(_HEADER) :]))
+    except Exception as e:
+        raise SnapshotError(f"corrupted snapshot: {e!r}") from None
+    if not isinstance(globals_, Environment):
+        raise SnapshotError("corrupted snapshot: no globals")
+    interpreter.globals = globals_
+
+
+def save(interpreter: Interpreter, path: str) -> None:
+    """write the snapshot of the globals of the interpreter to the file"""
+    data = dumps(interpreter)
+    # written to a temporary file first, a worker restoring the snapshot
+    # while it is rewritten still reads a complete one
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except OSError:
+        with contextlib.suppress(OSError):
+            os.remove(tmp_path)
+        raise
+
+
+def load(interpreter: Interpreter, path: str) -> None:
+    """restore the snapshot of the file into the interpreter"""
+    with open(path, "rb") as f:
+        loads(interpreter, f.read())
@@ -0,0 +1,114 @@
+import contextlib
+import io
+import os
+import pickle
+import tempfile
+import unittest
+import zlib
+from parser import Parser
+
+import snapshot
+from cache import AST_LAYOUT
+from env import UNDEFINED
+from interpreter import Interpreter
+from limits import LimitedInterpreter
+from natives import NATIVES
+from scanner import Scanner
+
+PRELUDE = """
+var total = 0;
+for (var i = 0; i < 10; i = i + 1) total = total + i;
+fun twice(x) { return x * 2; }
+fun counter() {
+    var n = 0;
+    fun next() { n = n + 1; return n; }
+    return next;
+}
+var next = counter();
+next();
+var root = sqrt;
+fun late() { return defined_later; }
+"""
+
+JOB = """
+print total;
+print twice(total);
+print next();
+print root(16);
+var defined_later = "late";
+print late();
+"""
+
+
+class SnapshotTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.prelude = Interpreter()
+        self._interpret(self.prelude, PRELUDE)
+
+    def test_restore(self) -> None:
+        data = snapshot.dumps(self.prelude)
+        interpreter = Interpreter()
+        snapshot.loads(interpreter, data)
+        self.assertEqual(
+            self._interpret(interpreter, JOB), "45.0\n90.0\n2.0\n4.0\nlate\n"
+        )
+
+    def test_restores_are_independent(self) -> None:
+        data = snapshot.dumps(self.prelude)
+        first, second = LimitedInterpreter(), LimitedInterpreter()
+        snapshot.loads(first, data)
+        snapshot.loads(second, data)
+        self._interpret(first, "total = -1; next();")
+        self.assertEqual(
+            self._interpret(second, "print total; print next();"), "45.0\n2.0\n"
+        )
+        self.assertEqual(self._interpret(self.prelude, "print next();"), "2.0\n")
+
+    def test_snapshot_of_a_fork(self) -> None:
+        fork = self.prelude.fork()
+        self._interpret(fork, "total = 1; next(); print twice(total);")
+        interpreter = Interpreter()
+        snapshot.loads(interpreter, snapshot.dumps(fork))
+        self.assertEqual(
+            self._interpret(interpreter, "print total; print next();"), "1.0\n3.0\n"
+        )
+
+    def test_natives_and_undefined_keep_their_identity(self) -> None:
+        self.assertIs(pickle.loads(pickle.dumps(NATIVES["sqrt"])), NATIVES["sqrt"])
+        self.assertIs(pickle.loads(pickle.dumps(UNDEFINED)), UNDEFINED)
+
+    def test_save_and_load(self) -> None:
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "prelude.snapshot")
+            snapshot.save(self.prelude, path)
+            interpreter = Interpreter()
+            snapshot.load(interpreter, path)
+        self.assertEqual(self._interpret(interpreter, "print twice(4);"), "8.0\n")
+
+    def test_invalid_snapshots(self) -> None:
+        data = snapshot.dumps(self.prelude)
+        header = 24 + len(AST_LAYOUT)
+        invalid = {
+            "not a snapshot": b"var a = 1;",
+            "other version": data.replace(data[8:24], b"0.0.0".ljust(16), 1),
+            "other layout": data.replace(AST_LAYOUT, bytes(len(AST_LAYOUT)), 1),
+            "truncated": data[: len(data) // 2],
+            "not globals": data[:header] + zlib.compress(pickle.dumps([1, 2])),
+        }
+        for name, blob in invalid.items():
+            with self.subTest(msg=f"test restoring {name}"):
+                interpreter = Interpreter()
+                with self.assertRaises(snapshot.SnapshotError):
+                    snapshot.loads(interpreter, blob)
+                # the interpreter keeps its own globals
+                self.assertEqual(
+                    self._interpret(interpreter, "print total;"),
+                    "[line 1] Error: Undefined variable total\n",
+                )
+
+    @staticmethod
+    def _interpret(interpreter: Interpreter, source: str) -> str:
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            interpreter.interpret(Parser(Scanner(source).scan_tokens()).parse())
+        return out.getvalue()
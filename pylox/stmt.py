@@ -1,7 +1,7 @@
 """ class that models statements """
 import abc
-from dataclasses import dataclass
-from typing import List, Optional
+from dataclasses import dataclass, field
+from typing import Any, ClassVar, List, Optional, Tuple
 
 from expr import Expr
 from lox_token import Token
@@ -9,83 +9,126 @@ from lox_token import Token
 
 class StmtVisitor(abc.ABC):
     @abc.abstractmethod
-    def visit_print(self, stmt: "PrintStmt") -> None:
+    def visit_print(self, stmt: "PrintStmt") -> Any:
         pass
 
     @abc.abstractmethod
-    def visit_expr(self, stmt: "ExprStmt") -> None:
+    def visit_expr(self, stmt: "ExprStmt") -> Any:
         pass
 
     @abc.abstractmethod
-    def visit_decl(self, stmt: "DeclStmt") -> None:
+    def visit_decl(self, stmt: "DeclStmt") -> Any:
         pass
 
     @abc.abstractmethod
-    def visit_block(self, stmt: "BlockStmt") -> None:
+    def visit_block(self, stmt: "BlockStmt") -> Any:
         pass
 
     @abc.abstractmethod
-    def visit_conditional(self, stmt: "ConditionalStmt") -> None:
+    def visit_conditional(self, stmt: "ConditionalStmt") -> Any:
         pass
 
     @abc.abstractmethod
-    def visit_while(self, stmt: "WhileStmt") -> None:
+    def visit_while(self, stmt: "WhileStmt") -> Any:
+        pass
+
+    @abc.abstractmethod
+    def visit_function(self, stmt: "FunStmt") -> Any:
+        pass
+
+    @abc.abstractmethod
+    def visit_return(self, stmt: "ReturnStmt") -> Any:
         pass
 
 
 class Stmt(abc.ABC):
+    # slotted and pickled like the Expr nodes
+    __slots__ = ()
+
+    __match_args__: ClassVar[Tuple[str, ...]]
+
+    def __reduce__(self) -> Tuple[type, Tuple]:
+        return self.__class__, tuple(getattr(self, f) for f in self.__match_args__)
+
     @abc.abstractmethod
-    def accept(self, stmt_visitor: StmtVisitor) -> None:
+    def accept(self, stmt_visitor: StmtVisitor) -> Any:
         pass
 
 
-@dataclass
+@dataclass(slots=True)
 class PrintStmt(Stmt):
     expr: Expr
 
-    def accept(self, stmt_visitor: StmtVisitor) -> None:
-        stmt_visitor.visit_print(self)
+    def accept(self, stmt_visitor: StmtVisitor) -> Any:
+        return stmt_visitor.visit_print(self)
 
 
-@dataclass
+@dataclass(slots=True)
 class ExprStmt(Stmt):
     expr: Expr
 
-    def accept(self, stmt_visitor: StmtVisitor) -> None:
-        stmt_visitor.visit_expr(self)
+    def accept(self, stmt_visitor: StmtVisitor) -> Any:
+        return stmt_visitor.visit_expr(self)
 
 
-@dataclass
+@dataclass(slots=True)
 class DeclStmt(Stmt):
     token: Token
     initializer: Optional[Expr] = None
+    slot: Optional[int] = field(default=None, compare=False, repr=False)
+    """ index of the variable in the frame of its block, None for a global """
 
-    def accept(self, stmt_visitor: StmtVisitor) -> None:
-        stmt_visitor.visit_decl(self)
+    def accept(self, stmt_visitor: StmtVisitor) -> Any:
+        return stmt_visitor.visit_decl(self)
 
 
-@dataclass
+@dataclass(slots=True)
 class BlockStmt(Stmt):
     stmts: List[Stmt]
+    size: int = field(default=0, compare=False, repr=False)
+    """ number of variables declared directly in the block """
 
-    def accept(self, stmt_visitor: StmtVisitor) -> None:
-        stmt_visitor.visit_block(self)
+    def accept(self, stmt_visitor: StmtVisitor) -> Any:
+        return stmt_visitor.visit_block(self)
 
 
-@dataclass
+@dataclass(slots=True)
 class ConditionalStmt(Stmt):
     cond: Expr
     truthy: Stmt
     falsy: Optional[Stmt] = None
 
-    def accept(self, stmt_visitor: StmtVisitor) -> None:
-        stmt_visitor.visit_conditional(self)
+    def accept(self, stmt_visitor: StmtVisitor) -> Any:
+        return stmt_visitor.visit_conditional(self)
 
 
-@dataclass
+@dataclass(slots=True)
 class WhileStmt(Stmt):
     cond: Expr
     stmt: Stmt
 
-    def accept(self, stmt_visitor: StmtVisitor) -> None:
-        stmt_visitor.visit_while(self)
+    def accept(self, stmt_visitor: StmtVisitor) -> Any:
+        return stmt_visitor.visit_while(self)
+
+
+@dataclass(slots=True)
+class FunStmt(Stmt):
+    token: Token
+    params: List[Token]
+    body: List[Stmt]
+    slot: Optional[int] = field(default=None, compare=False, repr=False)
+    """ index of the function in the frame of its block, None for a global """
+    size: int = field(default=0, compare=False, repr=False)
+    """ number of variables of a call, the parameters are the first ones """
+
+    def accept(self, stmt_visitor: StmtVisitor) -> Any:
+        return stmt_visitor.visit_function(self)
+
+
+@dataclass(slots=True)
+class ReturnStmt(Stmt):
+    token: Token
+    value: Optional[Expr] = None
+
+    def accept(self, stmt_visitor: StmtVisitor) -> Any:
+        return stmt_visitor.visit_return(self)
@@ -0,0 +1,2 @@
+""" version of pylox, bumped whenever the ast or the cache format changes """
+__version__ = "0.3.0"
@@ -0,0 +1,339 @@
+""" stack based virtual machine executing the bytecode produced by the compiler """
+from chunk import Chunk, Function, OpCode
+from typing import Any, Dict, List, Optional, Tuple
+
+from compiler import Compiler
+from error import LoxRuntimeError, error
+from interpreter import call_error, type_error
+from lox_token import Token
+from natives import NATIVES, NativeError, NativeFunction
+from output import BufferedOutput, Output
+from stmt import Stmt
+from token_type import TokenType
+
+_CONSTANT = int(OpCode.CONSTANT)
+_NIL = int(OpCode.NIL)
+_TRUE = int(OpCode.TRUE)
+_FALSE = int(OpCode.FALSE)
+_POP = int(OpCode.POP)
+_POPN = int(OpCode.POPN)
+_DEFINE_GLOBAL = int(OpCode.DEFINE_GLOBAL)
+_GET_GLOBAL = int(OpCode.GET_GLOBAL)
+_SET_GLOBAL = int(OpCode.SET_GLOBAL)
+_GET_LOCAL = int(OpCode.GET_LOCAL)
+_SET_LOCAL = int(OpCode.SET_LOCAL)
+_ADD = int(OpCode.ADD)
+_SUBTRACT = int(OpCode.SUBTRACT)
+_MULTIPLY = int(OpCode.MULTIPLY)
+_DIVIDE = int(OpCode.DIVIDE)
+_NEGATE = int(OpCode.NEGATE)
+_NOT = int(OpCode.NOT)
+_EQUAL = int(OpCode.EQUAL)
+_NOT_EQUAL = int(OpCode.NOT_EQUAL)
+_GREATER = int(OpCode.GREATER)
+_GREATER_EQUAL = int(OpCode.GREATER_EQUAL)
+_LESS = int(OpCode.LESS)
+_LESS_EQUAL = int(OpCode.LESS_EQUAL)
+_JUMP = int(OpCode.JUMP)
+_JUMP_IF_FALSE = int(OpCode.JUMP_IF_FALSE)
+_JUMP_IF_TRUE = int(OpCode.JUMP_IF_TRUE)
+_POP_JUMP_IF_FALSE = int(OpCode.POP_JUMP_IF_FALSE)
+_PRINT = int(OpCode.PRINT)
+_RETURN = int(OpCode.RETURN)
+_CALL = int(OpCode.CALL)
+_CLOSURE = int(OpCode.CLOSURE)
+_GET_UPVALUE = int(OpCode.GET_UPVALUE)
+_SET_UPVALUE = int(OpCode.SET_UPVALUE)
+_CLOSE_UPVALUES = int(OpCode.CLOSE_UPVALUES)
+
+_OP_TOKENS = {
+    _ADD: (TokenType.PLUS, "+"),
+    _SUBTRACT: (TokenType.MINUS, "-"),
+    _MULTIPLY: (TokenType.STAR, "*"),
+    _DIVIDE: (TokenType.SLASH, "/"),
+    _NEGATE: (TokenType.MINUS, "-"),
+    _GREATER: (TokenType.GREATER, ">"),
+    _GREATER_EQUAL: (TokenType.GREATER_EQUAL, ">="),
+    _LESS: (TokenType.LESS, "<"),
+    _LESS_EQUAL: (TokenType.LESS_EQUAL, "<="),
+}
+""" the operator token of an instruction, used to report runtime errors """
+
+MAX_FRAMES = 4096
+""" nested calls of lox functions before the vm reports a stack overflow """
+
+
+class Upvalue:
+    """a variable captured by a closure. While the block declaring it runs it
+    is the slot of the local on the stack, then it holds the value itself"""
+
+    __slots__ = ("values", "index")
+
+    def __init__(self, values: List[Any], index: int) -> None:
+        self.values = values
+        self.index = index
+
+    def close(self) -> None:
+        self.values = [self.values[self.index]]
+        self.index = 0
+
+
+class Closure:
+    """a function with the variables it captured, the value of a declaration"""
+
+    __slots__ = ("function", "arity", "upvalues")
+
+    def __init__(self, function: Function, upvalues: List[Upvalue]) -> None:
+        self.function = function
+        self.arity = function.arity
+        self.upvalues = upvalues
+
+    def __str__(self) -> str:
+        return str(self.function)
+
+
+class VM:
+    def __init__(self, output: Optional[Output] = None) -> None:
+        self.output = output or BufferedOutput()
+        self._globals: Dict[str, Any] = dict(NATIVES)
+
+    def interpret(self, stmts: List[Stmt]) -> bool:
+        """run the statements, returns False if a runtime error was reported"""
+        try:
+            self._run(Compiler().compile(stmts))
+        except LoxRuntimeError as e:
+            self.output.flush()
+            error(e.token.line, e.msg)
+            return False
+        finally:
+            self.output.flush()
+        return True
+
+    def _run(self, chunk: Chunk) -> Any:
+        code = chunk.code
+        constants = chunk.constants
+        globals_ = self._globals
+        write = self.output.write
+        stack: List[Any] = []
+        push = stack.append
+        pop = stack.pop
+        ip = 0
+        # stack index of the first local of the running function
+        base = 0
+        upvalues: List[Upvalue] = []
+        # the upvalues of locals still on the stack, by stack index
+        open_upvalues: Dict[int, Upvalue] = {}
+        # (chunk, ip, base, upvalues) of the callers to resume on return
+        frames: List[Tuple[Chunk, int, int, List[Upvalue]]] = []
+
+        while True:
+            op = code[ip]
+            ip += 1
+
+            if op == _GET_LOCAL:
+                push(stack[base + code[ip]])
+                ip += 1
+            elif op == _CONSTANT:
+                push(constants[code[ip]])
+                ip += 1
+            elif op == _POP_JUMP_IF_FALSE:
+                if pop():
+                    ip += 1
+                else:
+                    ip = code[ip]
+            elif op == _JUMP:
+                ip = code[ip]
+            elif op == _SET_LOCAL:
+                stack[base + code[ip]] = stack[-1]
+                ip += 1
+            elif op == _POP:
+                pop()
+            elif op == _GET_GLOBAL:
+                try:
+                    push(globals_[constants[code[ip]]])
+                except KeyError:
+                    name = constants[code[ip]]
+                    raise self._undefined_variable(chunk, ip, name) from None
+                ip += 1
+            elif op == _SET_GLOBAL:
+                name = constants[code[ip]]
+                if name not in globals_:
+                    raise self._undefined_variable(chunk, ip, name)
+                globals_[name] = stack[-1]
+                ip += 1
+            elif op == _ADD:
+                right = pop()
+                left = stack[-1]
+                if isinstance(left, float):
+                    if not isinstance(right, float):
+                        raise self._type_error(chunk, ip, float)
+                elif isinstance(left, str):
+                    if not isinstance(right, str):
+                        raise self._type_error(chunk, ip, str)
+                stack[-1] = left + right
+            elif op == _LESS:
+                right = pop()
+                left = stack[-1]
+                if not (isinstance(left, float) and isinstance(right, float)):
+                    raise self._type_error(chunk, ip, float)
+                stack[-1] = left < right
+            elif op == _SUBTRACT:
+                right = pop()
+                left = stack[-1]
+                if not (isinstance(left, float) and isinstance(right, float)):
+                    raise self._type_error(chunk, ip, float)
+                stack[-1] = left - right
+            elif op == _MULTIPLY:
+                right = pop()
+                left = stack[-1]
+                if not (isinstance(left, float) and isinstance(right, float)):
+                    raise self._type_error(chunk, ip, float)
+                stack[-1] = left * right
+            elif op == _DIVIDE:
+                right = pop()
+                left = stack[-1]
+                if not (isinstance(left, float) and isinstance(right, float)):
+                    raise self._type_error(chunk, ip, float)
+                stack[-1] = left / right
+            elif op == _LESS_EQUAL:
+                right = pop()
+                left = stack[-1]
+                if not (isinstance(left, float) and isinstance(right, float)):
+                    raise self._type_error(chunk, ip, float)
+                stack[-1] = left <= right
+            elif op == _GREATER:
+                right = pop()
+                left = stack[-1]
+                if not (isinstance(left, float) and isinstance(right, float)):
+                    raise self._type_error(chunk, ip, float)
+                stack[-1] = left > right
+            elif op == _GREATER_EQUAL:
+                right = pop()
+                left = stack[-1]
+                if not (isinstance(left, float) and isinstance(right, float)):
+                    raise self._type_error(chunk, ip, float)
+                stack[-1] = left >= right
+            elif op == _EQUAL:
+                right = pop()
+                stack[-1] = stack[-1] == right
+            elif op == _NOT_EQUAL:
+                right = pop()
+                stack[-1] = stack[-1] != right
+            elif op == _PRINT:
+                write(f"{pop()}\n")
+            elif op == _CALL:
+                count = code[ip]
+                callee = stack[-count - 1]
+                if callee.__class__ is Closure and count == callee.arity:
+                    if len(frames) == MAX_FRAMES:
+                        raise LoxRuntimeError(self._paren(chunk, ip), "Stack overflow")
+                    # the arguments already on the stack become the first locals
+                    frames.append((chunk, ip + 1, base, upvalues))
+                    chunk = callee.function.chunk
+                    code = chunk.code
+                    constants = chunk.constants
+                    base = len(stack) - count
+                    upvalues = callee.upvalues
+                    ip = 0
+                    continue
+
+                args = stack[len(stack) - count :]
+                if callee.__class__ is not NativeFunction or count != callee.arity:
+                    raise call_error(self._paren(chunk, ip), callee, count)
+                try:
+                    stack[-count - 1 :] = [callee.function(*args)]
+                except NativeError as e:
+                    raise LoxRuntimeError(self._paren(chunk, ip), e.msg) from None
+                ip += 1
+            elif op == _POPN:
+                del stack[-code[ip] :]
+                ip += 1
+            elif op == _NIL:
+                push(None)
+            elif op == _TRUE:
+                push(True)
+            elif op == _FALSE:
+                push(False)
+            elif op == _NEGATE:
+                if not isinstance(stack[-1], float):
+                    raise self._type_error(chunk, ip, float)
+                stack[-1] = -1 * stack[-1]
+            elif op == _NOT:
+                value = stack[-1]
+                stack[-1] = value is None or value is False
+            elif op == _JUMP_IF_FALSE:
+                if stack[-1]:
+                    ip += 1
+                else:
+                    ip = code[ip]
+            elif op == _JUMP_IF_TRUE:
+                if stack[-1]:
+                    ip = code[ip]
+                else:
+                    ip += 1
+            elif op == _DEFINE_GLOBAL:
+                globals_[constants[code[ip]]] = pop()
+                ip += 1
+            elif op == _RETURN:
+                if not frames:
+                    return pop()
+                if open_upvalues:
+                    self._close_upvalues(open_upvalues, base)
+                # drop the locals and the callee, leaving the result in its place
+                stack[base - 1 :] = [stack[-1]]
+                chunk, ip, base, upvalues = frames.pop()
+                code = chunk.code
+                constants = chunk.constants
+            elif op == _GET_UPVALUE:
+                upvalue = upvalues[code[ip]]
+                push(upvalue.values[upvalue.index])
+                ip += 1
+            elif op == _SET_UPVALUE:
+                upvalue = upvalues[code[ip]]
+                upvalue.values[upvalue.index] = stack[-1]
+                ip += 1
+            elif op == _CLOSURE:
+                function = constants[code[ip]]
+                captured = []
+                for _ in range(function.upvalue_count):
+                    is_local, index = code[ip + 1], code[ip + 2]
+                    ip += 2
+                    if not is_local:
+                        captured.append(upvalues[index])
+                        continue
+                    slot = base + index
+                    if slot not in open_upvalues:
+                        open_upvalues[slot] = Upvalue(stack, slot)
+                    captured.append(open_upvalues[slot])
+                push(Closure(function, captured))
+                ip += 1
+            elif op == _CLOSE_UPVALUES:
+                self._close_upvalues(open_upvalues, base + code[ip])
+                ip += 1
+            else:
+                raise RuntimeError(f"Unknown opcode {op} at {ip - 1}")
+
+    @staticmethod
+    def _close_upvalues(open_upvalues: Dict[int, Upvalue], first: int) -> None:
+        """the locals from the stack index first are popped, their upvalues
+        keep the values"""
+        for slot in [slot for slot in open_upvalues if slot >= first]:
+            open_upvalues.pop(slot).close()
+
+    @staticmethod
+    def _type_error(chunk: Chunk, ip: int, expected_type: type) -> LoxRuntimeError:
+        # ip already points past the failing instruction
+        ttype, lexeme = _OP_TOKENS[chunk.code[ip - 1]]
+        token = Token(ttype=ttype, lexeme=lexeme, line=chunk.lines[ip - 1])
+        return type_error(token, expected_type)
+
+    @staticmethod
+    def _paren(chunk: Chunk, ip: int) -> Token:
+        # ip points at the argument count of the call
+        return Token(ttype=TokenType.RIGHT_PAREN, lexeme=")", line=chunk.lines[ip])
+
+    @staticmethod
+    def _undefined_variable(chunk: Chunk, ip: int, name: str) -> LoxRuntimeError:
+        # ip points at the operand holding the name
+        token = Token(ttype=TokenType.IDENTIFIER, lexeme=name, line=chunk.lines[ip])
+        return LoxRuntimeError(token=token, msg=f"Undefined variable {name}")